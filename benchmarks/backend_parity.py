@@ -0,0 +1,159 @@
+# benchmarks/backend_parity.py
+# Runs the same randomized service calls (filters, sorting, paging, column selection, date
+# windows) with the 'memory' and 'sqlite' backends and compares the results, including any
+# errors and printed messages. Reports JSON.
+#
+# Usage:
+#   python -m benchmarks.backend_parity --sales-rows 100000
+#   python -m benchmarks.backend_parity --data-dir data --calls 500
+#
+# Exits with status 1 when any call returns something different on the two backends.
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.generate_data import generate
+from benchmarks.run_benchmarks import DEFAULT_DATA_DIR
+
+CUSTOMER_COLUMNS = ['cust_id', 'cust_address', 'cust_age', 'effective_start_date', 'effective_end_date', 'current_ind']
+LOCATIONS = ['Austin, TX', 'austin', 'Main St', 'oak ave', 'Boston', 'seattle', 'TX', 'zzz', 'q', '']
+DATES = ['2018-01-01', '2019-02-28', '2019-07-15', '2020-06-01', '2021-12-31', 'bad']
+
+
+def _normalize(value):
+    """Turns a result into plain, comparable values (rows may be dicts or dict-like records)."""
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    if isinstance(value, dict) or (hasattr(value, 'keys') and hasattr(value, 'get')):
+        return {key: _normalize(value.get(key)) for key in value.keys()}
+    return repr(value)
+
+
+def _calls(seed, count):
+    """
+    Builds the randomized calls, the same for every backend.
+    Returns:
+        list: (service name, method name, args, kwargs) tuples.
+    """
+    rng = random.Random(seed)
+    calls = []
+    for _ in range(count):
+        paging = {
+            'order_by': rng.choice([None, 'nope'] + CUSTOMER_COLUMNS),
+            'order': rng.choice([None, 'asc', 'desc']),
+            'skip': rng.choice([0, 0, 3, 50, 1000, -1]),
+            'limit': rng.choice([None, 5, 20, 300, 0]),
+            'selects': rng.choice([None, None, 'cust_id,cust_age', 'bogus', 'cust_address, nope']),
+        }
+        calls.append(('customers', 'list_customers', (), dict(
+            paging, age=rng.choice([None, None, 33, 60]), address=rng.choice([None, None, 'a', 'TX', 'main st', 'xq', '']),
+            date=rng.choice([None] + DATES))))
+        calls.append(('customers', 'find_customers_from_multiple_locations',
+                      (rng.sample(LOCATIONS, rng.randint(1, 3)),), paging))
+        calls.append(('customers', 'get_total_customers_by_location', (rng.choice(LOCATIONS),), {}))
+
+    windows = [(None, None)] + [tuple(sorted(rng.sample(DATES[:-1], 2))) for _ in range(max(count // 20, 3))]
+    for start, end in windows:
+        for limit in (1, 5, 50):
+            calls.append(('products', 'get_worst_performing_products_by_quarter', (limit, start, end), {}))
+        for quarters in (None, [1], [2, 3]):
+            for order in ('asc', 'desc'):
+                calls.append(('products', 'get_products_by_quarterly_sales', (quarters, order, start, end), {}))
+        calls.append(('sales', 'get_customers_most_orders_per_month', (start, end), {}))
+        calls.append(('sales', 'get_return_rate_for_top_customers', (start, end), {}))
+    for order in ('desc', 'asc'):
+        calls.append(('customers', 'get_top_customers_by_orders', (10, order), {}))
+    for by in ('month', 'location'):
+        calls.append(('sales', 'get_distinct_customers', (by,), {}))
+    return calls
+
+
+def run(data_dir, backend, calls):
+    """
+    Makes the calls with one backend, without persisted caches so each backend computes
+    every result itself.
+    Returns:
+        tuple: ([(result or error, printed output) per call], seconds)
+    """
+    from services.customer_service import CustomerService
+    from services.product_service import ProductService
+    from services.sales_service import SalesService
+    from utils.data_loader import DataStore
+
+    DataStore.configure(data_dir=data_dir, backend=backend, use_snapshots=False)
+    DataStore.reset()
+    services = {'customers': CustomerService(), 'products': ProductService(), 'sales': SalesService()}
+    outcomes = []
+    started = time.perf_counter()
+    for service, method, args, kwargs in calls:
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            try:
+                result = _normalize(getattr(services[service], method)(*args, **kwargs))
+            except Exception as e:
+                result = f"{type(e).__name__}: {e}"
+        outcomes.append((result, printed.getvalue()))
+    return outcomes, time.perf_counter() - started
+
+
+def mismatches(calls, expected, actual, max_reported=20):
+    """Returns a message per call whose result or output differs between two runs."""
+    messages = []
+    for (service, method, args, kwargs), left, right in zip(calls, expected, actual):
+        if left != right:
+            what = 'result' if left[0] != right[0] else 'output'
+            messages.append(f"{service}.{method}{args} {kwargs}: {what} differs")
+    if len(messages) > max_reported:
+        messages = messages[:max_reported] + [f"... and {len(messages) - max_reported} more"]
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare service results between the memory and sqlite backends.")
+    parser.add_argument("--sales-rows", type=int, default=100000, help="Synthetic sales rows.")
+    parser.add_argument("--customers", type=int, default=None, help="Distinct customers (default: sales rows / 10).")
+    parser.add_argument("--products", type=int, default=None, help="Distinct products (default: sales rows / 1000).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the generated data and the calls.")
+    parser.add_argument("--data-dir", default=None, help="Existing data directory to use instead of generating one.")
+    parser.add_argument("--calls", type=int, default=300, help="Rounds of randomized customer queries.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file (default: stdout).")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(DEFAULT_DATA_DIR, f"sales-{args.sales_rows}-seed-{args.seed}")
+        if not os.path.exists(os.path.join(data_dir, 'sales_transactions.csv')):
+            print(f"Generating data in {data_dir}...", file=sys.stderr)
+            generate(data_dir, args.sales_rows, args.customers, args.products, args.seed)
+    data_dir = os.path.abspath(data_dir)
+
+    calls = _calls(args.seed, args.calls)
+    expected, memory_seconds = run(data_dir, 'memory', calls)
+    actual, sqlite_seconds = run(data_dir, 'sqlite', calls)
+    messages = mismatches(calls, expected, actual)
+    for message in messages:
+        print(message, file=sys.stderr)
+
+    report = {
+        'data_dir': data_dir,
+        'calls': len(calls),
+        'mismatches': sum(left != right for left, right in zip(expected, actual)),
+        'memory_seconds': round(memory_seconds, 4),
+        'sqlite_seconds': round(sqlite_seconds, 4),
+    }
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    sys.exit(1 if messages else 0)
+
+
+if __name__ == "__main__":
+    main()
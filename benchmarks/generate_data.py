@@ -0,0 +1,129 @@
+# benchmarks/generate_data.py
+# Deterministic synthetic data for benchmarks: customer_dim.csv, product_dim.csv and
+# sales_transactions.csv with the same columns as the real files. Dimension rows are SCD2
+# versioned (contiguous effective date ranges, current_ind 'Y' on the latest version).
+# Rows are written in blocks, so even 1e8 sales rows are generated in constant memory.
+#
+# Usage: python -m benchmarks.generate_data OUT_DIR --sales-rows 1000000 [--customers N] [--products N] [--seed 7]
+import argparse
+import csv
+import os
+import random
+from datetime import date, timedelta
+
+STREETS = ["Meadow St", "Oak Ave", "Pine Rd", "Main St", "Elm Blvd", "Cedar Ln", "Maple Dr", "Lake View Rd"]
+CITIES = ["Los Angeles, CA", "New York City, NY", "Austin, TX", "Seattle, WA", "Boston, MA",
+          "Chicago, IL", "Denver, CO", "Miami, FL", "Portland, OR", "Atlanta, GA"]
+OPEN_END = date(9999, 12, 31)
+HISTORY_START = date(2018, 1, 1)
+SALES_START = date(2019, 1, 1)
+SALES_DAYS = 1460 # Four years of orders
+BLOCK_SIZE = 10000
+
+
+def default_customers(sales_rows):
+    return max(100, sales_rows // 10)
+
+
+def default_products(sales_rows):
+    return max(50, min(100000, sales_rows // 1000))
+
+
+def _versions(rng, max_versions, min_days, max_days):
+    """Yields (start, end, is_current) for a random number of contiguous SCD2 versions."""
+    count = rng.randint(1, max_versions)
+    start = HISTORY_START + timedelta(days=rng.randint(0, 365))
+    for version in range(count):
+        is_current = version == count - 1
+        end = OPEN_END if is_current else start + timedelta(days=rng.randint(min_days, max_days))
+        yield start, end, is_current
+        start = end
+
+
+def _write_rows(path, headers, rows):
+    """Writes rows (an iterable) to a CSV file in blocks. Returns the number of data rows."""
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) >= BLOCK_SIZE:
+                writer.writerows(block)
+                written += len(block)
+                block = []
+        writer.writerows(block)
+        written += len(block)
+    return written
+
+
+def _customer_rows(rng, customers):
+    for cust_id in range(1, customers + 1):
+        for start, end, is_current in _versions(rng, 3, 60, 900):
+            address = f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}"
+            yield [cust_id, address, rng.randint(15, 85), start.isoformat(), end.isoformat(), 'Y' if is_current else 'N']
+
+
+def _product_rows(rng, products):
+    for product_id in range(1, products + 1):
+        price = rng.uniform(1, 500)
+        for start, end, is_current in _versions(rng, 2, 200, 1200):
+            yield [product_id, f"Product {product_id}", f"{price:.2f}", start.isoformat(), end.isoformat(), 'Y' if is_current else 'N']
+            price *= rng.uniform(0.9, 1.2) # Price changes between versions
+
+
+def _sales_rows(rng, sales_rows, customers, products):
+    dates = [(SALES_START + timedelta(days=day)).isoformat() for day in range(SALES_DAYS)]
+    for order_id in range(1, sales_rows + 1):
+        # A few ids that are not in the dimension tables, like real data with gaps
+        yield [order_id, rng.randint(1, products + 2), rng.randint(1, customers + 2), rng.randint(1, 10), rng.choice(dates)]
+
+
+def generate(out_dir, sales_rows, customers=None, products=None, seed=7):
+    """
+    Writes the three CSV files into out_dir.
+    Args:
+        out_dir (str): Target directory (created if needed).
+        sales_rows (int): Number of sales transactions.
+        customers (int): Number of distinct customers (default: sales_rows / 10).
+        products (int): Number of distinct products (default: sales_rows / 1000, 50 to 100000).
+        seed (int): Random seed; the same arguments always produce identical files.
+    Returns:
+        dict: {filename: number of data rows written}
+    """
+    customers = customers or default_customers(sales_rows)
+    products = products or default_products(sales_rows)
+    os.makedirs(out_dir, exist_ok=True)
+    # Separate generators per file, so each file only depends on its own parameters
+    return {
+        'customer_dim.csv': _write_rows(
+            os.path.join(out_dir, 'customer_dim.csv'),
+            ['cust_id', 'cust_address', 'cust_age', 'effective_start_date', 'effective_end_date', 'current_ind'],
+            _customer_rows(random.Random(f"{seed}-customers"), customers)),
+        'product_dim.csv': _write_rows(
+            os.path.join(out_dir, 'product_dim.csv'),
+            ['product_id', 'product_name', 'product_price', 'effective_start_date', 'effective_end_date', 'current_ind'],
+            _product_rows(random.Random(f"{seed}-products"), products)),
+        'sales_transactions.csv': _write_rows(
+            os.path.join(out_dir, 'sales_transactions.csv'),
+            ['order_id', 'product_id', 'cust_id', 'product_quantity', 'order_date'],
+            _sales_rows(random.Random(f"{seed}-sales"), sales_rows, customers, products)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic CSV data for benchmarks.")
+    parser.add_argument("out_dir", help="Directory to write the CSV files to.")
+    parser.add_argument("--sales-rows", type=int, default=10000, help="Number of sales transactions (e.g. 10000 to 100000000).")
+    parser.add_argument("--customers", type=int, default=None, help="Distinct customers (default: sales rows / 10).")
+    parser.add_argument("--products", type=int, default=None, help="Distinct products (default: sales rows / 1000).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed.")
+    args = parser.parse_args()
+    counts = generate(args.out_dir, args.sales_rows, args.customers, args.products, args.seed)
+    for filename, rows in counts.items():
+        print(f"{filename}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
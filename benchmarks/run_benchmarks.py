@@ -0,0 +1,270 @@
+# benchmarks/run_benchmarks.py
+# Times table loading, every service method behind the CLI commands and print_table (in each
+# --format) on synthetic data, and reports wall time, throughput and peak RSS as JSON.
+#
+# Usage:
+#   python -m benchmarks.run_benchmarks --sales-rows 100000 --output results.json
+#   python -m benchmarks.run_benchmarks --sales-rows 100000 --baseline results.json
+#
+# Each case runs in a fresh process, so its peak RSS and timings are not affected by data
+# loaded for other cases. By default each case is run once untimed first, so it is measured
+# with warm caches (snapshots, cached aggregates); --cold clears the cache before every run
+# and --no-cache disables it.
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from benchmarks.generate_data import generate
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+
+def _customer_service():
+    from services.customer_service import CustomerService
+    return CustomerService()
+
+
+def _product_service():
+    from services.product_service import ProductService
+    return ProductService()
+
+
+def _sales_service():
+    from services.sales_service import SalesService
+    return SalesService()
+
+
+def _customer_page():
+    """Prepares (untimed) the rows the print_table case formats."""
+    service = _customer_service()
+    return service.list_customers(limit=10000), service.customer_headers
+
+
+def _print_customers(prepared, output_format='table'):
+    from utils.helpers import print_table
+    customers, headers = prepared
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        print_table(customers, headers=headers, output_format=output_format)
+    return output.getvalue()
+
+
+# name -> (tables loaded before timing, table whose rows measure throughput,
+#          untimed setup returning the call's argument (e.g. a service), timed call)
+CASES = {
+    'load.customer': (('customer',), 'customer', None, None),
+    'load.product': (('product',), 'product', None, None),
+    'load.sales': (('sales',), 'sales', None, None),
+    'customers.total_by_location': (('customer',), 'customer', _customer_service,
+                                    lambda service: service.get_total_customers_by_location('Austin')),
+    'customers.from_multiple_locations': (('customer',), 'customer', _customer_service,
+                                          lambda service: service.find_customers_from_multiple_locations(['Boston', 'Oak Ave'])),
+    'customers.list': (('customer',), 'customer', _customer_service,
+                       lambda service: service.list_customers(age=33, order='asc', order_by='cust_id', limit=50)),
+    'customers.list_as_of': (('customer',), 'customer', _customer_service,
+                             lambda service: service.list_customers(date='2020-06-01', address='main st')),
+    'customers.top_orders': (('customer',), 'sales', _customer_service,
+                             lambda service: service.get_top_customers_by_orders(limit=10)),
+    'products.worst_performing': (('product',), 'sales', _product_service,
+                                  lambda service: service.get_worst_performing_products_by_quarter(limit=5)),
+    'products.quarterly_sales': (('product',), 'sales', _product_service,
+                                 lambda service: service.get_products_by_quarterly_sales()),
+    'sales.most_orders_per_month': (('customer',), 'sales', _sales_service,
+                                    lambda service: service.get_customers_most_orders_per_month()),
+    'sales.return_rate_top_customers': (('customer', 'product'), 'sales', _sales_service,
+                                        lambda service: service.get_return_rate_for_top_customers()),
+    'output.print_table': (('customer',), 'customer', _customer_page, _print_customers),
+    'output.csv': (('customer',), 'customer', _customer_page, lambda prepared: _print_customers(prepared, 'csv')),
+    'output.jsonl': (('customer',), 'customer', _customer_page, lambda prepared: _print_customers(prepared, 'jsonl')),
+}
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports KiB
+
+
+def _digest(result):
+    """Short, stable digest of a case's result, used to detect changed output."""
+    def normalize(value):
+        if isinstance(value, dict) or hasattr(value, 'keys'):
+            return {str(key): normalize(value[key]) for key in value.keys()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(item) for item in value]
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+    encoded = json.dumps(normalize(result), sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def _run_case(task):
+    """Runs one benchmark case in the current (fresh) process and returns its measurements."""
+    name, data_dir, options = task
+    from utils.data_loader import DataStore
+    tables, throughput_table, setup, call = CASES[name]
+    DataStore.configure(data_dir=data_dir, **options)
+    DataStore.reset()
+    data_store = DataStore()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        data_store.preload(tables)
+        load_seconds = time.perf_counter() - started
+        if call is None:
+            seconds, result = load_seconds, None
+        else:
+            argument = setup()
+            started = time.perf_counter()
+            result = call(argument)
+            seconds = time.perf_counter() - started
+
+    rows = _count_rows(data_dir, throughput_table)
+    return {
+        'name': name,
+        'seconds': round(seconds, 6),
+        'load_seconds': round(load_seconds, 6),
+        'rows': rows,
+        'rows_per_second': round(rows / seconds) if seconds > 0 else None,
+        'peak_rss_bytes': _peak_rss_bytes(),
+        'result_digest': None if result is None else _digest(result),
+    }
+
+
+_ROW_COUNTS = {}
+
+
+def _count_rows(data_dir, table):
+    filename = {'customer': 'customer_dim.csv', 'product': 'product_dim.csv', 'sales': 'sales_transactions.csv'}[table]
+    path = os.path.join(data_dir, filename)
+    if path not in _ROW_COUNTS:
+        with open(path, 'rb') as f:
+            _ROW_COUNTS[path] = max(0, sum(1 for _ in f) - 1)
+    return _ROW_COUNTS[path]
+
+
+def run(data_dir, names, options, repeat=1, cold=False):
+    """
+    Runs the named cases, each in its own process, keeping the fastest of `repeat` runs.
+    Args:
+        cold (bool): Clear the data directory's cache before every run instead of warming it.
+    Returns:
+        list: One result dict per case (see _run_case).
+    """
+    results = []
+    cache_dir = os.path.join(data_dir, '.cache')
+    context = multiprocessing.get_context('spawn') # Fresh interpreter: no memory inherited from this one
+    with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as executor:
+        for name in names:
+            task = (name, data_dir, options)
+            if options['use_snapshots'] and not cold:
+                executor.submit(_run_case, task).result() # Warm-up run fills the caches
+            runs = []
+            for _ in range(repeat):
+                if cold:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                runs.append(executor.submit(_run_case, task).result())
+            best = min(runs, key=lambda result: result['seconds'])
+            best['peak_rss_bytes'] = max(result['peak_rss_bytes'] for result in runs)
+            results.append(best)
+            print(f"{name}: {best['seconds']:.4f}s, {best['rows_per_second'] or 0:,} rows/s, "
+                  f"peak RSS {best['peak_rss_bytes'] / 2 ** 20:.1f} MiB", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """
+    Compares results with a baseline report.
+    Returns:
+        list: One comparison dict per case present in both, with 'regression' and 'output_changed' flags.
+    """
+    baseline_cases = {case['name']: case for case in baseline.get('cases', [])}
+    comparisons = []
+    for result in results:
+        before = baseline_cases.get(result['name'])
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else None
+        comparisons.append({
+            'name': result['name'],
+            'baseline_seconds': before['seconds'],
+            'seconds': result['seconds'],
+            'ratio': round(ratio, 3) if ratio is not None else None,
+            # Sub-millisecond cases are noisy, so a slowdown must also exceed min_delta seconds
+            'regression': ratio is not None and ratio > 1 + tolerance and result['seconds'] - before['seconds'] > min_delta,
+            'output_changed': result['result_digest'] != before.get('result_digest'),
+        })
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark data loading, CLI services and output formatting.")
+    parser.add_argument("--sales-rows", type=int, default=100000, help="Synthetic sales rows (e.g. 10000 to 100000000).")
+    parser.add_argument("--customers", type=int, default=None, help="Distinct customers (default: sales rows / 10).")
+    parser.add_argument("--products", type=int, default=None, help="Distinct products (default: sales rows / 1000).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the generated data.")
+    parser.add_argument("--data-dir", default=None, help="Existing data directory to use instead of generating one.")
+    parser.add_argument("--cases", nargs='+', choices=list(CASES), default=list(CASES), help="Cases to run (default: all).")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest is reported.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable snapshots and cached aggregates.")
+    parser.add_argument("--cold", action="store_true", help="Clear the cache before every run (measures first runs).")
+    parser.add_argument("--stream", action="store_true", help="Benchmark the streaming sales mode.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for sales aggregations.")
+    parser.add_argument("--engine", choices=['python', 'numpy'], default='python', help="Aggregation engine.")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file (default: stdout).")
+    parser.add_argument("--baseline", default=None, help="JSON report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs. the baseline (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(DEFAULT_DATA_DIR, f"sales-{args.sales_rows}-seed-{args.seed}")
+        if not os.path.exists(os.path.join(data_dir, 'sales_transactions.csv')):
+            print(f"Generating data in {data_dir}...", file=sys.stderr)
+            generate(data_dir, args.sales_rows, args.customers, args.products, args.seed)
+    data_dir = os.path.abspath(data_dir)
+
+    options = {'use_snapshots': not args.no_cache, 'streaming': args.stream, 'workers': args.workers, 'engine': args.engine}
+    results = run(data_dir, args.cases, options, args.repeat, args.cold)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'data_dir': data_dir,
+        'options': dict(options, cold=args.cold),
+        'cases': results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare(results, json.load(f), args.tolerance, args.min_delta)
+        for comparison in report['comparison']:
+            if comparison['regression'] or comparison['output_changed']:
+                exit_code = 1
+                print(f"Regression in {comparison['name']}: {comparison['seconds']:.4f}s vs "
+                      f"{comparison['baseline_seconds']:.4f}s (x{comparison['ratio']})"
+                      + (", output changed" if comparison['output_changed'] else ""), file=sys.stderr)
+
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# benchmarks/sketch_accuracy.py
+# Checks the --approx answers (utils.sketches) against the exact aggregates on synthetic data:
+# how often the exact value falls outside the reported error_bound, how many of the exact
+# top/bottom keys the estimates find (recall), and the largest relative error. Reports JSON.
+#
+# Usage:
+#   python -m benchmarks.sketch_accuracy --sales-rows 300000
+#   python -m benchmarks.sketch_accuracy --data-dir data --limit 50
+#
+# Exits with status 1 when a guarantee is broken: any Space-Saving bound (top customers,
+# which always holds), Count-Min / HyperLogLog bounds missed more often than --max-miss-rate,
+# a recall below --min-recall, or a relative error above --max-relative-error.
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from benchmarks.generate_data import generate
+from benchmarks.run_benchmarks import DEFAULT_DATA_DIR
+
+
+def _timed(call):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = call()
+    return result, time.perf_counter() - started
+
+
+def _check_bounds(rows, key, value, exact):
+    """
+    Compares estimated rows with exact {key: value}. Rows without an error_bound are exact
+    answers (the service fell back to the exact aggregates).
+    Returns:
+        dict: Row count, rows whose exact value is outside [estimate - error_bound, estimate],
+            and the largest absolute and relative errors.
+    """
+    misses, max_error, max_relative_error = 0, 0, 0.0
+    for row in rows:
+        actual = exact.get(row[key], 0)
+        if not row[value] - row.get('error_bound', 0) <= actual <= row[value]:
+            misses += 1
+        max_error = max(max_error, abs(row[value] - actual))
+        if actual:
+            max_relative_error = max(max_relative_error, round(abs(row[value] - actual) / actual, 4))
+    return {'rows': len(rows), 'bound_misses': misses, 'max_abs_error': max_error,
+            'max_relative_error': max_relative_error, 'approximate': any('error_bound' in row for row in rows)}
+
+
+def _recall(rows, key, exact, limit, highest):
+    """Share of the returned keys whose exact value is within the exact top (or bottom) `limit`."""
+    if not rows:
+        return None
+    ranked = sorted(exact.values(), reverse=highest)
+    threshold = ranked[min(limit, len(ranked)) - 1]
+    found = [row for row in rows if (exact.get(row[key], 0) >= threshold if highest else exact.get(row[key], 0) <= threshold)]
+    return round(len(found) / len(rows), 4)
+
+
+def _month_window(sales_months):
+    """First whole quarter of the sales, as --from/--to strings (exercises merging partitions)."""
+    year, month = sales_months[0]
+    first_month = (month - 1) // 3 * 3 + 4 # Start of the next quarter, so every month is complete
+    year, first_month = (year + 1, 1) if first_month > 12 else (year, first_month)
+    last_day = {3: 31, 6: 30, 9: 30, 12: 31}[first_month + 2]
+    return f"{year}-{first_month:02d}-01", f"{year}-{first_month + 2:02d}-{last_day}"
+
+
+def run(data_dir, limit):
+    from services.customer_service import CustomerService
+    from services.product_service import ProductService
+    from services.sales_service import SalesService
+    from utils.data_loader import DataStore
+    from utils.partitions import DateWindow
+
+    DataStore.configure(data_dir=data_dir)
+    DataStore.reset()
+    data_store = DataStore()
+    customers, products, sales = CustomerService(), ProductService(), SalesService()
+    checks = {}
+
+    sketches, build_seconds = _timed(data_store.get_sales_sketches)
+    exact_orders, exact_seconds = _timed(lambda: data_store.get_sales_aggregates(['orders_by_customer'])['orders_by_customer'])
+    report = {'sketch_build_seconds': round(build_seconds, 4), 'exact_aggregate_seconds': round(exact_seconds, 4)}
+
+    for order in ('desc', 'asc'):
+        rows, seconds = _timed(lambda: customers.get_top_customers_by_orders(limit, order, approx=True))
+        check = _check_bounds(rows, 'cust_id', 'order_count', exact_orders)
+        check['recall'] = _recall(rows, 'cust_id', exact_orders, limit, highest=(order == 'desc'))
+        check['seconds'] = round(seconds, 4)
+        checks[f"customers.top_orders.{order}"] = check
+
+    start, end = _month_window([month for month, _ in sketches.by_month()])
+    for name, window in (('all', None), (f"{start}..{end}", DateWindow.parse(start, end))):
+        exact_quantities = data_store.get_sales_aggregates(['quantity_by_product'], window)['quantity_by_product']
+        rows, seconds = _timed(lambda: products.get_worst_performing_products_by_quarter(
+            limit, *((start, end) if window else ()), approx=True))
+        check = _check_bounds(rows, 'product_id', 'total_quantity_sold', exact_quantities)
+        check['recall'] = _recall(rows, 'product_id', exact_quantities, limit, highest=False)
+        check['seconds'] = round(seconds, 4)
+        checks[f"products.worst_performing.{name}"] = check
+
+    for by in ('month', 'location'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            exact = {row[by]: row['distinct_customers'] for row in sales.get_distinct_customers(by)}
+        rows, seconds = _timed(lambda: sales.get_distinct_customers(by, approx=True))
+        check = {'rows': len(rows), 'bound_misses': 0, 'max_relative_error': 0.0, 'seconds': round(seconds, 4)}
+        for row in rows:
+            actual = exact.get(row[by], 0)
+            if abs(row['distinct_customers'] - actual) > row['error_bound']:
+                check['bound_misses'] += 1
+            if actual:
+                check['max_relative_error'] = max(check['max_relative_error'], round(abs(row['distinct_customers'] - actual) / actual, 4))
+        check['missing_groups'] = len(set(exact) - {row[by] for row in rows})
+        checks[f"sales.distinct_customers.{by}"] = check
+
+    report['checks'] = checks
+    return report
+
+
+def failures(report, max_miss_rate, min_recall=0.8, max_relative_error=0.25):
+    """Returns a message per broken guarantee or accuracy threshold in a report."""
+    messages = []
+    for name, check in report['checks'].items():
+        if name == 'customers.top_orders.desc': # Space-Saving bounds are deterministic
+            allowed = 0
+        else:
+            allowed = max_miss_rate * check['rows']
+        if check['bound_misses'] > allowed:
+            messages.append(f"{name}: {check['bound_misses']} of {check['rows']} rows outside error_bound")
+        if check.get('missing_groups'):
+            messages.append(f"{name}: {check['missing_groups']} groups missing from the estimates")
+        if check.get('recall') is not None and check['recall'] < min_recall:
+            messages.append(f"{name}: recall {check['recall']} below {min_recall}")
+        if check['max_relative_error'] > max_relative_error:
+            messages.append(f"{name}: relative error {check['max_relative_error']} above {max_relative_error}")
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check --approx estimates against exact results.")
+    parser.add_argument("--sales-rows", type=int, default=300000, help="Synthetic sales rows.")
+    parser.add_argument("--customers", type=int, default=None, help="Distinct customers (default: sales rows / 10).")
+    parser.add_argument("--products", type=int, default=None, help="Distinct products (default: sales rows / 1000).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for the generated data.")
+    parser.add_argument("--data-dir", default=None, help="Existing data directory to use instead of generating one.")
+    parser.add_argument("--limit", type=int, default=100, help="Rows requested per top/bottom query.")
+    parser.add_argument("--max-miss-rate", type=float, default=0.1,
+                        help="Allowed share of Count-Min/HyperLogLog rows outside their error_bound (0.1 = 10%%).")
+    parser.add_argument("--min-recall", type=float, default=0.8,
+                        help="Smallest allowed share of returned top/bottom keys that are in the exact top/bottom.")
+    parser.add_argument("--max-relative-error", type=float, default=0.25,
+                        help="Largest allowed |estimate - exact| / exact of any returned row (0.25 = 25%%).")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file (default: stdout).")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(DEFAULT_DATA_DIR, f"sales-{args.sales_rows}-seed-{args.seed}")
+        if not os.path.exists(os.path.join(data_dir, 'sales_transactions.csv')):
+            print(f"Generating data in {data_dir}...", file=sys.stderr)
+            generate(data_dir, args.sales_rows, args.customers, args.products, args.seed)
+    data_dir = os.path.abspath(data_dir)
+
+    report = run(data_dir, args.limit)
+    report['data_dir'] = data_dir
+    messages = failures(report, args.max_miss_rate, args.min_recall, args.max_relative_error)
+    for message in messages:
+        print(message, file=sys.stderr)
+
+    encoded = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(encoded + '\n')
+    else:
+        print(encoded)
+    sys.exit(1 if messages else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,263 @@
 # main.py
+import cProfile
+import contextlib
 import sys
+from utils.batch import BatchRunner
 from utils.cli_parser import create_parser
 from services.customer_service import CustomerService
 from services.product_service import ProductService
 from services.sales_service import SalesService
 from utils.helpers import print_table
+from utils.data_loader import DataStore
+from utils.server import QueryServer, run_client
+from utils.timings import timings
+
+# --- Command handlers: each receives its service and the parsed arguments ---
+
+def print_result(args, title, rows, headers=None):
+    """Prints a command's rows in the --format output format; the title is only part of the table format."""
+    if args.format == 'table':
+        print(title)
+    print_table(rows, headers=headers, output_format=args.format, out=args.output)
+
+def approx_note(rows):
+    """Title suffix for results estimated with --approx (whose rows carry an error_bound)."""
+    return " (approximate)" if rows and 'error_bound' in rows[0] else ""
+
+def customers_total_by_location(customer_service, args):
+    count = customer_service.get_total_customers_by_location(args.location)
+    if args.format == 'table':
+        print(f"Total customers in '{args.location}': {count}")
+    else:
+        print_table([{'location': args.location, 'total_customers': count}], output_format=args.format, out=args.output)
+
+def customers_from_multiple_locations(customer_service, args):
+    customers = customer_service.find_customers_from_multiple_locations(
+        args.locations,
+        skip=args.skip, limit=args.limit, order=args.order,
+        order_by=args.order_by, selects=args.selects
+    )
+    # Pass specific headers if you want a fixed display order
+    print_result(args, "Customers from multiple locations:", customers,
+                 headers=['cust_id', 'cust_address', 'cust_age', 'effective_start_date', 'effective_end_date', 'current_ind'])
+
+def customers_list(customer_service, args):
+    customers = customer_service.list_customers(
+        age=args.age, address=args.address, date=args.date,
+        skip=args.skip, limit=args.limit, order=args.order,
+        order_by=args.order_by, selects=args.selects
+    )
+    # Use the original headers to ensure correct column order if not 'selects'
+    print_result(args, "Filtered customers:", customers, headers=customer_service.customer_headers)
+
+def customers_top_orders(customer_service, args):
+    top_customers = customer_service.get_top_customers_by_orders(
+        limit=10, # As per problem statement "top 10"
+        order=args.order,
+        approx=args.approx
+    )
+    print_result(args, f"Top 10 customers by most orders{approx_note(top_customers)}:", top_customers)
+
+def products_worst_performing(product_service, args):
+    worst_products = product_service.get_worst_performing_products_by_quarter(
+        limit=args.limit, start=args.date_from, end=args.date_to, approx=args.approx)
+    print_result(args, f"Worst performing products (lowest total quantity sold, top {args.limit}){approx_note(worst_products)}:", worst_products)
+
+def products_quarterly_sales(product_service, args):
+    sales_data = product_service.get_products_by_quarterly_sales(
+        quarters=args.quarters,
+        order=args.order,
+        start=args.date_from,
+        end=args.date_to
+    )
+    print_result(args, "Products by quarterly sales:", sales_data)
+
+def sales_most_orders_per_month(sales_service, args):
+    customers_most_orders = sales_service.get_customers_most_orders_per_month(start=args.date_from, end=args.date_to)
+    print_result(args, "Customers with the most orders in any single month:", customers_most_orders)
+
+def sales_return_rate_top_customers(sales_service, args):
+    # As noted, this lists purchased products for top customers due to lack of return data
+    top_customer_details = sales_service.get_return_rate_for_top_customers(start=args.date_from, end=args.date_to)
+    product_headers_for_display = ['product_id', 'product_name', 'product_price']
+    if args.format != 'table':
+        # Machine-readable formats get one flat row per (customer, purchased product)
+        rows = (
+            {'cust_id': customer['cust_id'], 'cust_age': customer['cust_age'],
+             'cust_address': customer['cust_address'], **{key: product.get(key) for key in product_headers_for_display}}
+            for customer in top_customer_details or []
+            for product in customer['purchased_products']
+        )
+        print_table(rows, headers=['cust_id', 'cust_age', 'cust_address'] + product_headers_for_display,
+                    output_format=args.format, out=args.output)
+        return
+    if top_customer_details:
+        print("Top 3 Customers and Their Purchased Product Details:")
+        for customer in top_customer_details:
+            print(f"\n--- Customer ID: {customer['cust_id']} ({customer['cust_age']} yrs, {customer['cust_address']}) ---")
+            if customer['purchased_products']:
+                print("  Purchased Products:")
+                # Print sub-table for products
+                print_table(customer['purchased_products'], headers=product_headers_for_display)
+            else:
+                print("  No purchased products found for this customer.")
+    else:
+        print("Could not retrieve top customer details or no sales data available.")
+
+def sales_distinct_customers(sales_service, args):
+    distinct_customers = sales_service.get_distinct_customers(by=args.by, approx=args.approx)
+    print_result(args, f"Distinct customers with orders by {args.by}{approx_note(distinct_customers)}:", distinct_customers)
+
+# (command, subcommand) -> (service class, tables the command reads, handler).
+# Only the dispatched command's service is constructed and only its tables are loaded.
+# No command lists 'sales': they use cached sales aggregates and results, and the DataStore
+# reads the sales rows itself only when those have to be recomputed.
+COMMANDS = {
+    ("customers", "total-by-location"): (CustomerService, ("customer",), customers_total_by_location),
+    ("customers", "from-multiple-locations"): (CustomerService, ("customer",), customers_from_multiple_locations),
+    ("customers", "list"): (CustomerService, ("customer",), customers_list),
+    ("customers", "top-orders"): (CustomerService, ("customer",), customers_top_orders),
+    ("products", "worst-performing"): (ProductService, ("product",), products_worst_performing),
+    ("products", "quarterly-sales"): (ProductService, ("product",), products_quarterly_sales),
+    ("sales", "most-orders-per-month"): (SalesService, ("customer",), sales_most_orders_per_month),
+    ("sales", "return-rate-top-customers"): (SalesService, ("customer", "product"), sales_return_rate_top_customers),
+    ("sales", "distinct-customers"): (SalesService, ("customer",), sales_distinct_customers),
+}
+
+# (command, subcommand) -> sales aggregates (see utils.aggregations) the command reads.
+# A batch computes the aggregates of all its commands together in one pass over the sales rows.
+COMMAND_AGGREGATES = {
+    ("customers", "top-orders"): ("orders_by_customer",),
+    ("products", "worst-performing"): ("quantity_by_product",),
+    ("products", "quarterly-sales"): ("quantity_by_product_quarter",),
+    ("sales", "most-orders-per-month"): ("orders_by_customer_month",),
+    ("sales", "return-rate-top-customers"): ("orders_by_customer",),
+    ("sales", "distinct-customers"): ("orders_by_customer", "orders_by_customer_month"),
+}
+
+# (command, subcommand) -> {table: the only columns the command reads from it}. Parquet/Arrow
+# sources (see DataLoader.source) are read with just these columns; tables not listed here,
+# and CSV sources, are read whole.
+COMMAND_COLUMNS = {
+    ("customers", "total-by-location"): {"customer": ("cust_address",)},
+    ("customers", "top-orders"): {"customer": ("cust_id", "cust_address", "cust_age")},
+    ("products", "worst-performing"): {"product": ("product_id", "product_name")},
+    ("products", "quarterly-sales"): {"product": ("product_id", "product_name")},
+    ("sales", "most-orders-per-month"): {"customer": ("cust_id", "cust_address", "cust_age")},
+    ("sales", "distinct-customers"): {"customer": ("cust_id", "cust_address")},
+}
+
+# argparse destination holding the subcommand of each command
+SUBCOMMAND_DESTS = {
+    "customers": "customer_command",
+    "products": "product_command",
+    "sales": "sales_command",
+}
+
+def command_name(args):
+    """Returns the (command, subcommand) of parsed arguments."""
+    return args.command, getattr(args, SUBCOMMAND_DESTS[args.command])
+
+def get_command(args):
+    """Returns the (service class, tables, handler) entry for parsed arguments."""
+    return COMMANDS[command_name(args)]
+
+def command_requirements(args):
+    """Returns (tables, {table: columns}, sales aggregates) the command of parsed arguments reads."""
+    name = command_name(args)
+    # A --from/--to command aggregates only its date window (when it runs), not all-time sales
+    windowed = getattr(args, 'date_from', None) or getattr(args, 'date_to', None)
+    # An --approx command reads the cached sales sketches instead of exact aggregates
+    exact = not windowed and not getattr(args, 'approx', False)
+    return COMMANDS[name][1], COMMAND_COLUMNS.get(name, {}), COMMAND_AGGREGATES.get(name, ()) if exact else ()
+
+@contextlib.contextmanager
+def instrumented(args):
+    """
+    Runs the enclosed code under cProfile with --profile (writing the stats to the given file)
+    and prints a per-phase breakdown to stderr afterwards with --timings.
+    """
+    profiler = cProfile.Profile() if args.profile else None
+    if args.timings:
+        timings.enable()
+    try:
+        if profiler:
+            profiler.enable()
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"Profile written to {args.profile}", file=sys.stderr)
+        if args.timings:
+            timings.report(sys.stderr)
+            timings.disable()
+
+def run_command(args):
+    """
+    Loads the tables the command needs, builds its service and runs it.
+    With --timings a per-phase breakdown is printed to stderr afterwards; with --profile
+    the command runs under cProfile and the stats are written to the given file. With an
+    export --format only the rows go to stdout; progress messages and warnings go to stderr.
+    """
+    service_class, tables, handler = get_command(args)
+    with instrumented(args):
+        args.output = None if args.format == 'table' else sys.stdout
+        with timings.phase(f"command {' '.join(command_name(args))}"), \
+                contextlib.redirect_stdout(sys.stdout if args.output is None else sys.stderr):
+            DataStore().preload(tables, COMMAND_COLUMNS.get(command_name(args)))
+            handler(service_class(), args)
+
+def run_batch(args):
+    """Runs the commands listed in the --file of a 'batch' command. Returns the exit code."""
+    try:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except OSError as e:
+        print(f"Error: Could not read batch file {args.file}: {e}", file=sys.stderr)
+        return 1
+    runner = BatchRunner(create_parser, run_command, command_requirements, command_name,
+                         output_format=args.format, output_dir=args.output_dir)
+    with instrumented(args):
+        return runner.run(lines)
 
 def main():
     parser = create_parser()
     args = parser.parse_args()
 
-    # Instantiate services
-    customer_service = CustomerService()
-    product_service = ProductService()
-    sales_service = SalesService()
+    if args.connect:
+        # Thin client: the server parses and runs the same arguments against its warm DataStore
+        socket_path = args.socket or DataStore().default_socket_path()
+        try:
+            sys.exit(run_client(socket_path, sys.argv[1:]))
+        except OSError as e:
+            print(f"Error: Could not reach the query server at {socket_path}: {e}", file=sys.stderr)
+            sys.exit(1)
 
-    try:
-        if args.command == "customers":
-            if args.customer_command == "total-by-location":
-                count = customer_service.get_total_customers_by_location(args.location)
-                print(f"Total customers in '{args.location}': {count}")
-            elif args.customer_command == "from-multiple-locations":
-                customers = customer_service.find_customers_from_multiple_locations(
-                    args.locations,
-                    skip=args.skip, limit=args.limit, order=args.order,
-                    order_by=args.order_by, selects=args.selects
-                )
-                print("Customers from multiple locations:")
-                # Pass specific headers if you want a fixed display order
-                print_table(customers, headers=['cust_id', 'cust_address', 'cust_age', 'effective_start_date', 'effective_end_date', 'current_ind'])
-            elif args.customer_command == "list":
-                customers = customer_service.list_customers(
-                    age=args.age, address=args.address, date=args.date,
-                    skip=args.skip, limit=args.limit, order=args.order,
-                    order_by=args.order_by, selects=args.selects
-                )
-                print("Filtered customers:")
-                # Use the original headers to ensure correct column order if not 'selects'
-                print_table(customers, headers=customer_service.customer_headers)
-            elif args.customer_command == "top-orders":
-                top_customers = customer_service.get_top_customers_by_orders(
-                    limit=10, # As per problem statement "top 10"
-                    order=args.order
-                )
-                print("Top 10 customers by most orders:")
-                print_table(top_customers)
-
-        elif args.command == "products":
-            if args.product_command == "worst-performing":
-                worst_products = product_service.get_worst_performing_products_by_quarter(limit=args.limit)
-                print(f"Worst performing products (lowest total quantity sold, top {args.limit}):")
-                print_table(worst_products)
-            elif args.product_command == "quarterly-sales":
-                sales_data = product_service.get_products_by_quarterly_sales(
-                    quarters=args.quarters,
-                    order=args.order
-                )
-                print("Products by quarterly sales:")
-                print_table(sales_data)
-
-        elif args.command == "sales":
-            if args.sales_command == "most-orders-per-month":
-                customers_most_orders = sales_service.get_customers_most_orders_per_month()
-                print("Customers with the most orders in any single month:")
-                print_table(customers_most_orders)
-            elif args.sales_command == "return-rate-top-customers":
-                # As noted, this lists purchased products for top customers due to lack of return data
-                top_customer_details = sales_service.get_return_rate_for_top_customers()
-                if top_customer_details:
-                    print("Top 3 Customers and Their Purchased Product Details:")
-                    for customer in top_customer_details:
-                        print(f"\n--- Customer ID: {customer['cust_id']} ({customer['cust_age']} yrs, {customer['cust_address']}) ---")
-                        if customer['purchased_products']:
-                            print("  Purchased Products:")
-                            # Print sub-table for products
-                            product_headers_for_display = ['product_id', 'product_name', 'product_price']
-                            print_table(customer['purchased_products'], headers=product_headers_for_display)
-                        else:
-                            print("  No purchased products found for this customer.")
-                else:
-                    print("Could not retrieve top customer details or no sales data available.")
+    DataStore.configure(
+        use_snapshots=not args.no_cache,
+        streaming=args.stream,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        engine=args.engine,
+        strict=args.strict,
+        load_workers=args.load_workers,
+        backend=args.backend,
+    )
+
+    if args.command == "serve":
+        data_store = DataStore()
+        data_store.warm()
+        QueryServer(args.socket or data_store.default_socket_path(), create_parser, run_command).run()
+        return
 
+    try:
+        if args.command == "batch":
+            sys.exit(run_batch(args))
+        run_command(args)
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
         sys.exit(1) # Exit with an error code
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,106 +1,184 @@
 # services/customer_service.py
 from utils.data_loader import DataStore
-from utils.helpers import apply_pagination_and_sorting
+from utils.helpers import apply_pagination_and_sorting, top_k
+from utils.query import QueryPlan, EqualsFilter, ContainsFilter, AsOfFilter
+from utils.sketches import MAX_ERROR_SHARE, estimate_total, too_uncertain
+from utils.sqlite_store import as_of_condition, contains_condition, equals_condition
+from utils.timings import timed
 from datetime import datetime
 
 class CustomerService:
     def __init__(self):
+        # Data and indexes are fetched from the DataStore on first use, which loads them lazily
         self.data_store = DataStore()
-        self.customer_data = self.data_store.get_customer_data()
-        self.sales_data = self.data_store.get_sales_data()
-        self.customer_headers = self.data_store.get_customer_headers() # Get original headers for print_table
 
+    @property
+    def customer_data(self):
+        return self.data_store.get_customer_data()
+
+    @property
+    def customer_index(self):
+        return self.data_store.get_customer_index()
+
+    @property
+    def customer_temporal_index(self):
+        return self.data_store.get_customer_temporal_index()
+
+    @property
+    def customer_address_index(self):
+        return self.data_store.get_customer_address_index()
+
+    def _sort_index(self, column):
+        return self.data_store.get_sort_index('customer', column)
+
+    @property
+    def customer_headers(self): # Original headers for print_table
+        return self.data_store.get_customer_headers()
+
+    @timed()
     def get_total_customers_by_location(self, location):
         """
         Provides the total number of customers by location.
         Location match is case-insensitive and partial.
         """
-        count = 0
-        location_lower = location.lower()
-        for customer in self.customer_data:
-            if customer.get('cust_address') and location_lower in customer['cust_address'].lower():
-                count += 1
-        return count
+        sql_store = self.data_store.sql_store
+        if sql_store:
+            return sql_store.count('customer', [contains_condition('cust_address', location)])
+        return len(self.customer_address_index.search(location))
 
+    @timed()
     def find_customers_from_multiple_locations(self, locations, **kwargs):
         """
         Finds customers who reside in any of the specified locations.
+        Customers are listed grouped by the first location they match (in the order given),
+        then in file order; each cust_id is listed once.
         """
-        found_cust_ids = set() # Use a set to store unique customer IDs to avoid duplicates
-        results = []
-        for loc in locations:
-            loc_lower = loc.lower()
-            for customer in self.customer_data:
-                cust_id = customer.get('cust_id')
-                cust_address = customer.get('cust_address')
-                if cust_id is not None and cust_address and loc_lower in cust_address.lower() and cust_id not in found_cust_ids:
-                    results.append(customer)
+        sql_store = self.data_store.sql_store
+        if sql_store:
+            found_cust_ids = set()
+            result_rows = []
+            for row in sql_store.first_matches('customer', 'cust_address', locations):
+                cust_id = row['cust_id']
+                if cust_id is not None and cust_id not in found_cust_ids:
+                    result_rows.append(row)
                     found_cust_ids.add(cust_id)
-        return apply_pagination_and_sorting(results, **kwargs)
+            return sql_store.query_rows('customer', result_rows, **kwargs)
+
+        # {position: index of the first matching location}, from one pass over all candidates
+        matches = self.customer_address_index.search_any(locations)
+        cust_id_column = self.customer_data.column('cust_id')
+        found_cust_ids = set() # Use a set to store unique customer IDs to avoid duplicates
+        result_positions = []
+        for position in sorted(matches, key=lambda position: (matches[position], position)):
+            cust_id = cust_id_column[position]
+            if cust_id is not None and cust_id not in found_cust_ids:
+                result_positions.append(position)
+                found_cust_ids.add(cust_id)
+        return QueryPlan(self.customer_data, positions=result_positions).execute(**kwargs)
 
+    @timed()
     def list_customers(self, age=None, address=None, date=None, **kwargs):
         """
         Lists customers based on specified criteria (age, address, date).
         Applies pagination and sorting.
+        The filters run as a QueryPlan: the most selective one (e.g. an exact age through the
+        age index) picks the candidate rows and the others are only checked on those.
+        With the sqlite backend they run as one SQL query instead.
         """
-        filtered_customers = []
-        for customer in self.customer_data:
-            match = True
+        query_date = None
+        if date:
+            try:
+                query_date = datetime.strptime(date, '%Y-%m-%d')
+            except ValueError:
+                print(f"Warning: Invalid date format for --date: '{date}'. Expected YYYY-MM-DD. No customers match.")
+                return apply_pagination_and_sorting([], **kwargs)
 
-            if age is not None and customer.get('cust_age') != age:
-                match = False
-            
+        sql_store = self.data_store.sql_store
+        if sql_store:
+            conditions = []
+            if query_date:
+                conditions.append(as_of_condition('cust_id', query_date))
             if address:
-                cust_address_lower = customer.get('cust_address', '').lower()
-                if address.lower() not in cust_address_lower:
-                    match = False
-            
-            if date:
-                try:
-                    query_date = datetime.strptime(date, '%Y-%m-%d')
-                    start_date = customer.get('effective_start_date')
-                    end_date = customer.get('effective_end_date')
-
-                    # Check if query_date falls within the effective date range
-                    if not (start_date and end_date and start_date <= query_date <= end_date):
-                        match = False
-                except ValueError:
-                    print(f"Warning: Invalid date format for --date: '{date}'. Expected YYYY-MM-DD. Skipping date filter for this customer.")
-                    match = False
-
-            if match:
-                filtered_customers.append(customer)
-
-        return apply_pagination_and_sorting(filtered_customers, **kwargs)
-
-    def get_top_customers_by_orders(self, limit=10, order='desc'):
+                conditions.append(contains_condition('cust_address', address))
+            if age is not None:
+                conditions.append(equals_condition('cust_age', age))
+            return sql_store.select('customer', conditions, **kwargs)
+
+        filters = []
+        if query_date:
+            # Only the versions whose effective range contains query_date
+            filters.append(AsOfFilter(self.customer_temporal_index, query_date))
+        if address:
+            # Rows whose address contains the search text, found through the trigram index
+            filters.append(ContainsFilter(self.customer_address_index, address))
+        if age is not None:
+            filters.append(EqualsFilter(self.customer_data, 'cust_age', self.data_store.get_customer_age_index(), age))
+
+        return QueryPlan(self.customer_data, filters, sort_index=self._sort_index).execute(**kwargs)
+
+    @timed()
+    def get_top_customers_by_orders(self, limit=10, order='desc', approx=False):
         """
         Lists the top N customers with the most orders.
+        With approx, counts are estimated from the sales sketches instead of aggregated
+        exactly, and each row gets an error_bound (see _approximate_order_counts); when a
+        bound is more than MAX_ERROR_SHARE of its estimate, exact counts are returned instead.
         """
-        customer_order_counts = {} # {cust_id: count}
-        for sale in self.sales_data:
-            cust_id = sale.get('cust_id')
-            if cust_id is not None:
-                customer_order_counts[cust_id] = customer_order_counts.get(cust_id, 0) + 1
+        error_bounds = {}
+        if approx:
+            top_counts, error_bounds = self._approximate_order_counts(limit, order)
+            if too_uncertain(error_bounds, top_counts):
+                print(f"Warning: Approximate order counts are too uncertain (error_bound above {MAX_ERROR_SHARE:.0%} "
+                      "of an estimate); computing exact counts instead.")
+                approx = False
+        if not approx:
+            customer_order_counts = self.data_store.get_sales_aggregates(['orders_by_customer'])['orders_by_customer'] # {cust_id: count}
 
-        # Convert to a list of dictionaries for sorting
-        customer_counts_list = [{'cust_id': k, 'order_count': v} for k, v in customer_order_counts.items()]
-
-        # Sort based on order_count
-        customer_counts_list.sort(key=lambda x: x['order_count'], reverse=(order == 'desc'))
+            # Select the top (cust_id, count) pairs by order_count without sorting every customer
+            top_counts = top_k(customer_order_counts.items(), limit, key=lambda item: item[1], reverse=(order == 'desc'))
 
         # Merge with customer details from customer_dim
         top_customers_details = []
-        for item in customer_counts_list[:limit]:
-            cust_id = item['cust_id']
-            order_count = item['order_count']
-            # Find the corresponding customer details
-            customer_info = next((c for c in self.customer_data if c.get('cust_id') == cust_id), None)
-            if customer_info:
-                top_customers_details.append({
+        for cust_id, order_count in top_counts:
+            # Find the corresponding customer details (first customer_dim row for the id)
+            customer_rows = self.customer_index.get(cust_id)
+            if customer_rows:
+                customer_info = customer_rows[0]
+                details = {
                     'cust_id': cust_id,
                     'cust_address': customer_info.get('cust_address'),
                     'cust_age': customer_info.get('cust_age'),
                     'order_count': order_count
-                })
-        return top_customers_details
\ No newline at end of file
+                }
+                if approx:
+                    details['error_bound'] = error_bounds[cust_id]
+                top_customers_details.append(details)
+        return top_customers_details
+
+    def _approximate_order_counts(self, limit, order):
+        """
+        Estimates the top (cust_id, order count) pairs from the all-time sales sketches (see
+        estimate_total). Candidates are the customers monitored by Space-Saving, which include
+        every customer with more orders than any unmonitored one; for the fewest orders, once
+        the summary has evicted customers, every customer in customer_dim is one too. While
+        nothing was evicted the counts are exact and the error bounds 0.
+        Returns:
+            tuple: ([(cust_id, estimate)], {cust_id: error bound})
+        """
+        sketches = self.data_store.get_sales_sketches().merged()
+        totals, heavy_hitters = sketches.orders_by_customer, sketches.top_customers
+        if heavy_hitters.evicted:
+            print(f"Warning: About {sketches.customers.count()} customers have orders but the approximate summary "
+                  f"monitors {heavy_hitters.capacity}; error bounds are wider.")
+        if order == 'desc':
+            candidates = [cust_id for cust_id, _, _ in heavy_hitters.top()]
+        elif heavy_hitters.evicted:
+            candidates = dict.fromkeys([*heavy_hitters.counts, *self.customer_index.keys()])
+        else:
+            candidates = heavy_hitters.counts
+        estimates, error_bounds = [], {}
+        for cust_id in candidates:
+            estimate, error_bounds[cust_id] = estimate_total(cust_id, totals, heavy_hitters)
+            if estimate > 0: # Estimates never undercount, so customers without orders stay out as in the exact count
+                estimates.append((cust_id, estimate))
+        return top_k(estimates, limit, key=lambda item: item[1], reverse=(order == 'desc')), error_bounds
@@ -1,76 +1,130 @@
 # services/product_service.py
 from utils.data_loader import DataStore
-from utils.helpers import apply_pagination_and_sorting
+from utils.helpers import apply_pagination_and_sorting, top_k
+from utils.partitions import DateWindow
+from utils.sketches import MAX_ERROR_SHARE, estimate_total, too_uncertain
+from utils.timings import timed
 from datetime import datetime
 
 class ProductService:
     def __init__(self):
+        # Data and indexes are fetched from the DataStore on first use, which loads them lazily
         self.data_store = DataStore()
-        self.product_data = self.data_store.get_product_data()
-        self.sales_data = self.data_store.get_sales_data()
-        self.product_headers = self.data_store.get_product_headers()
 
-    def get_worst_performing_products_by_quarter(self, limit=5):
+    @property
+    def product_data(self):
+        return self.data_store.get_product_data()
+
+    @property
+    def product_index(self):
+        return self.data_store.get_product_index()
+
+    @property
+    def product_headers(self):
+        return self.data_store.get_product_headers()
+
+    def _get_product_name(self, product_id):
+        """Returns the name from the first product_dim row for product_id, or None if unknown."""
+        product_rows = self.product_index.get(product_id)
+        return product_rows[0].get('product_name') if product_rows else None
+
+    @timed()
+    def get_worst_performing_products_by_quarter(self, limit=5, start=None, end=None, approx=False):
         """
         Provides a list of the worst-performing products by total sales quantity.
-        'Worst-performing' is defined by the lowest total quantity sold across all time.
+        'Worst-performing' is defined by the lowest total quantity sold across all time, or
+        between the start and end dates (YYYY-MM-DD, inclusive) when given.
+        With approx, totals are estimated from the sales sketches (see _approximate_worst_products)
+        and each row gets an error_bound; dates must then cover whole months, and when a bound
+        is more than MAX_ERROR_SHARE of its estimate, exact totals are returned instead.
         """
-        product_sales_quantity = {} # {product_id: total_quantity_sold}
+        try:
+            window = DateWindow.parse(start, end)
+        except ValueError as e:
+            print(f"Warning: {e} No sales match.")
+            return []
+        error_bounds = {}
+        if approx:
+            try:
+                months = window.month_range() if window is not None else (None, None)
+            except ValueError as e:
+                print(f"Warning: {e} Approximate totals are kept per month; computing exact totals instead.")
+                approx = False
+        if approx:
+            worst_products, error_bounds = self._approximate_worst_products(limit, *months)
+            if too_uncertain(error_bounds, worst_products):
+                print(f"Warning: Approximate totals are too uncertain (error_bound above {MAX_ERROR_SHARE:.0%} "
+                      "of an estimate); computing exact totals instead.")
+                approx = False
+        if not approx:
+            product_sales_quantity = self.data_store.get_sales_aggregates(['quantity_by_product'], window)['quantity_by_product'] # {product_id: total_quantity_sold}
 
-        for sale in self.sales_data:
-            product_id = sale.get('product_id')
-            quantity = sale.get('product_quantity', 0)
-            if product_id is not None:
-                product_sales_quantity[product_id] = product_sales_quantity.get(product_id, 0) + quantity
+            # Select the lowest totals (ascending, ties in first-sale order) before looking up names,
+            # so only the returned products are resolved
+            worst_products = top_k(product_sales_quantity.items(), limit, key=lambda item: item[1])
 
         product_sales_list = []
-        for prod_id, total_quantity in product_sales_quantity.items():
+        for prod_id, total_quantity in worst_products:
             # Find product name for the product_id from product_dim
-            product_name = None
-            for p in self.product_data:
-                if p.get('product_id') == prod_id:
-                    product_name = p.get('product_name')
-                    break # Found the name, no need to search further
-            
-            product_sales_list.append({
+            product_name = self._get_product_name(prod_id)
+            product = {
                 'product_id': prod_id,
                 'product_name': product_name if product_name else f"Unknown Product ({prod_id})",
                 'total_quantity_sold': total_quantity
-            })
+            }
+            if approx:
+                product['error_bound'] = error_bounds[prod_id]
+            product_sales_list.append(product)
 
-        # Sort by total_quantity_sold in ascending order for "worst-performing"
-        product_sales_list.sort(key=lambda x: x['total_quantity_sold'], reverse=False)
+        return product_sales_list
 
-        return product_sales_list[:limit]
+    def _approximate_worst_products(self, limit, first=None, last=None):
+        """
+        Estimates the lowest (product_id, total quantity) pairs of months first..last ((year,
+        month) pairs, or None for an open end) from the sales sketches (see estimate_total).
+        Candidates are the products monitored by Space-Saving and, once it has evicted products,
+        those in product_dim (sold products missing from product_dim with small totals are then
+        not found). While nothing was evicted the totals are exact and the error bounds 0.
+        Returns:
+            tuple: ([(product_id, estimate)], {product_id: error bound})
+        """
+        sketches = self.data_store.get_sales_sketches().merged(first, last)
+        totals, heavy_hitters = sketches.quantity_by_product, sketches.top_products
+        if heavy_hitters.evicted:
+            print(f"Warning: The approximate summary of product totals monitors {heavy_hitters.capacity} products "
+                  "and had to evict some; error bounds are wider.")
+            candidates = dict.fromkeys([*heavy_hitters.counts, *self.product_index.keys()])
+        else:
+            candidates = heavy_hitters.counts
+        estimates, error_bounds = [], {}
+        for prod_id in candidates:
+            estimate, error_bounds[prod_id] = estimate_total(prod_id, totals, heavy_hitters)
+            if estimate > 0: # Estimates never undercount, so unsold products stay out as in the exact totals
+                estimates.append((prod_id, estimate))
+        return top_k(estimates, limit, key=lambda item: item[1]), error_bounds
 
-    def get_products_by_quarterly_sales(self, quarters=None, order='desc'):
+    @timed()
+    def get_products_by_quarterly_sales(self, quarters=None, order='desc', start=None, end=None):
         """
         Lists products by quarterly sales from the highest to the lowest.
-        Can filter by specific quarters.
+        Can filter by specific quarters and by start and end dates (YYYY-MM-DD, inclusive).
+        Without dates the all-time aggregate is filtered by quarter; with them only the
+        sales partitions of the requested quarters' months within the dates are read.
         """
-        sales_by_product_quarter = {} # {(product_id, year, quarter): total_quantity}
-
-        for sale in self.sales_data:
-            product_id = sale.get('product_id')
-            order_date = sale.get('order_date')
-            quantity = sale.get('product_quantity', 0)
-
-            if product_id is not None and order_date:
-                # Calculate quarter (1-based)
-                year = order_date.year
-                quarter = (order_date.month - 1) // 3 + 1
-
-                if quarters is None or quarter in quarters:
-                    key = (product_id, year, quarter)
-                    sales_by_product_quarter[key] = sales_by_product_quarter.get(key, 0) + quantity
+        months = None if quarters is None else [month for quarter in quarters for month in range(3 * quarter - 2, 3 * quarter + 1)]
+        try:
+            window = DateWindow.parse(start, end, months)
+        except ValueError as e:
+            print(f"Warning: {e} No sales match.")
+            return []
+        # {(product_id, year, quarter): total_quantity}, quarter being 1-based
+        sales_by_product_quarter = self.data_store.get_sales_aggregates(['quantity_by_product_quarter'], window)['quantity_by_product_quarter']
 
         results = []
         for (prod_id, year, quarter), total_quantity in sales_by_product_quarter.items():
-            product_name = None
-            for p in self.product_data:
-                if p.get('product_id') == prod_id:
-                    product_name = p.get('product_name')
-                    break
+            if quarters is not None and quarter not in quarters:
+                continue
+            product_name = self._get_product_name(prod_id)
             results.append({
                 'product_id': prod_id,
                 'product_name': product_name if product_name else f"Unknown Product ({prod_id})",
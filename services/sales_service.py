@@ -1,33 +1,51 @@
 # services/sales_service.py
+import math
 from utils.data_loader import DataStore
-from utils.helpers import apply_pagination_and_sorting
+from utils.helpers import address_location, apply_pagination_and_sorting, top_k
+from utils.partitions import DateWindow
+from utils.timings import timed
 from datetime import datetime
 
 class SalesService:
     def __init__(self):
+        # Data and indexes are fetched from the DataStore on first use, which loads them lazily
         self.data_store = DataStore()
-        self.sales_data = self.data_store.get_sales_data()
-        self.customer_data = self.data_store.get_customer_data()
-        self.product_data = self.data_store.get_product_data()
 
-    def get_customers_most_orders_per_month(self):
+    @property
+    def customer_data(self):
+        return self.data_store.get_customer_data()
+
+    @property
+    def product_data(self):
+        return self.data_store.get_product_data()
+
+    @property
+    def customer_index(self):
+        return self.data_store.get_customer_index()
+
+    @property
+    def product_index(self):
+        return self.data_store.get_product_index()
+
+    @property
+    def product_temporal_index(self):
+        return self.data_store.get_product_temporal_index()
+
+    @staticmethod
+    def _cache_name(name, window):
+        """Name of a cached result, qualified by the date window it was computed for."""
+        return name if window is None else f"{name}@{window.key()}"
+
+    def _compute_customer_max_monthly_orders(self, window=None):
         """
-        Lists customers who place the most orders per month.
-        Identifies the single month where each customer had their highest order count.
+        Returns the single month with the highest order count for each customer:
+        {cust_id: {'max_orders': count, 'month_str': 'YYYY-MM'}}
         """
-        # Dictionary to store orders per customer per month: {(cust_id, year, month): order_count}
-        customer_monthly_orders = {}
-
-        for sale in self.sales_data:
-            cust_id = sale.get('cust_id')
-            order_date = sale.get('order_date')
-            if cust_id is not None and order_date:
-                year_month = (order_date.year, order_date.month)
-                key = (cust_id, year_month)
-                customer_monthly_orders[key] = customer_monthly_orders.get(key, 0) + 1
+        # Orders per customer per month: {(cust_id, (year, month)): order_count}
+        customer_monthly_orders = self.data_store.get_sales_aggregates(['orders_by_customer_month'], window)['orders_by_customer_month']
 
         # Find the maximum orders per month for each unique customer
-        customer_max_monthly_orders = {} # {cust_id: {'max_orders': count, 'month_str': 'YYYY-MM'}}
+        customer_max_monthly_orders = {}
         for (cust_id, (year, month)), order_count in customer_monthly_orders.items():
             current_max = customer_max_monthly_orders.get(cust_id, {'max_orders': 0})
             if order_count > current_max['max_orders']:
@@ -35,11 +53,29 @@ class SalesService:
                     'max_orders': order_count,
                     'month_str': f"{year}-{month:02d}" # Format month as MM
                 }
+        return customer_max_monthly_orders
+
+    @timed()
+    def get_customers_most_orders_per_month(self, start=None, end=None):
+        """
+        Lists customers who place the most orders per month.
+        Identifies the single month where each customer had their highest order count,
+        counting only orders between the start and end dates (YYYY-MM-DD, inclusive) when given.
+        """
+        try:
+            window = DateWindow.parse(start, end)
+        except ValueError as e:
+            print(f"Warning: {e} No sales match.")
+            return []
+        customer_max_monthly_orders = self.data_store.get_materialized(
+            self._cache_name('sales:customer_max_monthly_orders', window), ['sales_transactions.csv'],
+            lambda: self._compute_customer_max_monthly_orders(window))
 
         results = []
         for cust_id, info in customer_max_monthly_orders.items():
-            customer_info = next((c for c in self.customer_data if c.get('cust_id') == cust_id), None)
-            if customer_info:
+            customer_rows = self.customer_index.get(cust_id)
+            if customer_rows:
+                customer_info = customer_rows[0]
                 results.append({
                     'cust_id': cust_id,
                     'cust_address': customer_info.get('cust_address'),
@@ -52,33 +88,69 @@ class SalesService:
         results.sort(key=lambda x: x['max_orders_in_month'], reverse=True)
         return results
 
-    def get_return_rate_for_top_customers(self):
+    def _compute_top_customer_first_purchases(self, window=None):
+        """
+        Returns (top 3 customer ids by total orders, {cust_id: {product_id: first order_date}}).
+        """
+        # Step 1: Identify top 3 customers by total orders (reusing logic from CustomerService concept)
+        customer_order_counts = self.data_store.get_sales_aggregates(['orders_by_customer'], window)['orders_by_customer']
+
+        top_3_counts = top_k(customer_order_counts.items(), 3, key=lambda item: item[1], reverse=True) # Descending
+        top_3_customer_ids = [cust_id for cust_id, _ in top_3_counts]
+        if not top_3_customer_ids:
+            return [], {}
+
+        # First purchase of each distinct product per top customer, collected in one pass over
+        # the sales chunks so each product is listed once
+        first_purchases = {cust_id: {} for cust_id in top_3_customer_ids}
+        product_index = self.product_index
+        for cust_id, product_id, order_date in self._iter_sales_of(top_3_customer_ids, window):
+            customer_purchases = first_purchases.get(cust_id)
+            if customer_purchases is None:
+                continue
+            if product_id is not None and product_id not in customer_purchases and product_id in product_index:
+                customer_purchases[product_id] = order_date
+        return top_3_customer_ids, first_purchases
+
+    def _iter_sales_of(self, cust_ids, window=None):
+        """
+        Yields (cust_id, product_id, order_date) for sales rows in file order, within the
+        DateWindow if given: only the given customers' rows (found through the cust_id index)
+        with the sqlite backend, every row otherwise.
+        """
+        sql_store = self.data_store.sql_store
+        if sql_store:
+            yield from sql_store.sales_of_customers(cust_ids, window)
+            return
+        for chunk in self.data_store.iter_sales_chunks(window):
+            yield from zip(chunk.column_values('cust_id'), chunk.column_values('product_id'), chunk.column_values('order_date'))
+
+    @timed()
+    def get_return_rate_for_top_customers(self, start=None, end=None):
         """
         Provides purchase details for the top 3 customers by total orders.
         NOTE: The concept of "return rate" is not directly supported by the provided CSV data
         as there's no 'return' indicator. This function will list the top 3 customers
         by their total orders and then detail all products they purchased.
+        With start and end dates (YYYY-MM-DD, inclusive) only orders between them count.
         """
-        # Step 1: Identify top 3 customers by total orders (reusing logic from CustomerService concept)
-        customer_order_counts = {}
-        for sale in self.sales_data:
-            cust_id = sale.get('cust_id')
-            if cust_id is not None:
-                customer_order_counts[cust_id] = customer_order_counts.get(cust_id, 0) + 1
-
-        customer_counts_list = [{'cust_id': k, 'order_count': v} for k, v in customer_order_counts.items()]
-        customer_counts_list.sort(key=lambda x: x['order_count'], reverse=True) # Sort descending
-        
-        top_3_customer_ids = [item['cust_id'] for item in customer_counts_list[:3]]
-
-        results = []
+        try:
+            window = DateWindow.parse(start, end)
+        except ValueError as e:
+            print(f"Warning: {e} No sales match.")
+            return []
+        top_3_customer_ids, first_purchases = self.data_store.get_materialized(
+            self._cache_name('sales:top_3_customer_first_purchases', window), ['sales_transactions.csv', 'product_dim.csv'],
+            lambda: self._compute_top_customer_first_purchases(window))
         if not top_3_customer_ids:
             return []
 
+        results = []
         for cust_id in top_3_customer_ids:
-            customer_info = next((c for c in self.customer_data if c.get('cust_id') == cust_id), None)
-            if not customer_info:
+            customer_rows = self.customer_index.get(cust_id)
+            if not customer_rows:
                 continue # Skip if customer details not found
+            customer_info = customer_rows[0]
 
             customer_purchases_summary = {
                 'cust_id': cust_id,
@@ -87,25 +159,66 @@ class SalesService:
                 'purchased_products': []
             }
 
-            # To avoid listing the same product multiple times if purchased repeatedly by the same customer
-            purchased_product_ids_for_customer = set()
-
-            for sale in self.sales_data:
-                if sale.get('cust_id') == cust_id:
-                    product_id = sale.get('product_id')
-                    if product_id is not None and product_id not in purchased_product_ids_for_customer:
-                        # Find product details for this product_id
-                        product_details = next((p for p in self.product_data if p.get('product_id') == product_id), None)
-                        if product_details:
-                            customer_purchases_summary['purchased_products'].append({
-                                'product_id': product_id,
-                                'product_name': product_details.get('product_name'),
-                                'product_price': product_details.get('product_price')
-                                # For precise price at time of purchase, you'd need to match
-                                # sales.order_date with product_dim effective dates, which is more complex.
-                                # Here, it uses the product_dim entry found first.
-                            })
-                            purchased_product_ids_for_customer.add(product_id)
+            # Price the product with the product_dim version in effect on the order date,
+            # falling back to its first version if no range covers that date
+            customer_purchases = first_purchases[cust_id]
+            versions = self.product_temporal_index.join_as_of(customer_purchases.items())
+            for product_id, product_details in zip(customer_purchases, versions):
+                if product_details is None:
+                    product_details = self.product_index[product_id][0]
+                customer_purchases_summary['purchased_products'].append({
+                    'product_id': product_id,
+                    'product_name': product_details.get('product_name'),
+                    'product_price': product_details.get('product_price')
+                })
             results.append(customer_purchases_summary)
 
-        return results
\ No newline at end of file
+        return results
+
+    @timed()
+    def get_distinct_customers(self, by='month', approx=False):
+        """
+        Counts the distinct customers with orders in each month (rows sorted by month), or in
+        each location (the part of cust_address after the first comma; rows sorted by count,
+        highest first).
+        With approx, counts are HyperLogLog estimates from the sales sketches and each row
+        gets an error_bound of two standard errors (the exact count is within it about 95%
+        of the time).
+        Args:
+            by (str): 'month' or 'location'.
+        """
+        if by not in ('month', 'location'):
+            raise ValueError(f"Unknown grouping: {by}. Expected 'month' or 'location'.")
+        if approx:
+            sketches = self.data_store.get_sales_sketches()
+            if by == 'month':
+                estimates = {f"{year}-{month:02d}": partition.customers for (year, month), partition in sketches.by_month()}
+            else:
+                estimates = sketches.merged().customers_by_location
+            counts = {group: sketch.count() for group, sketch in estimates.items()}
+            error_bounds = {group: math.ceil(2 * estimates[group].relative_error * count) for group, count in counts.items()}
+        elif by == 'month':
+            customer_monthly_orders = self.data_store.get_sales_aggregates(['orders_by_customer_month'])['orders_by_customer_month']
+            counts = {}
+            for _, (year, month) in customer_monthly_orders:
+                month_str = f"{year}-{month:02d}"
+                counts[month_str] = counts.get(month_str, 0) + 1
+        else:
+            customer_order_counts = self.data_store.get_sales_aggregates(['orders_by_customer'])['orders_by_customer']
+            counts = {}
+            for cust_id in customer_order_counts:
+                customer_rows = self.customer_index.get(cust_id)
+                location = address_location(customer_rows[0].get('cust_address') if customer_rows else None)
+                counts[location] = counts.get(location, 0) + 1
+
+        if by == 'month':
+            groups = sorted(counts)
+        else:
+            groups = sorted(counts, key=lambda location: (-counts[location], location))
+        results = []
+        for group in groups:
+            row = {by: group, 'distinct_customers': counts[group]}
+            if approx:
+                row['error_bound'] = error_bounds[group]
+            results.append(row)
+        return results
@@ -0,0 +1,25 @@
+# tests/test_sketch_accuracy.py
+# Runs the --approx accuracy checks (benchmarks/sketch_accuracy.py) on a small generated dataset.
+import pytest
+
+from benchmarks.generate_data import generate
+from benchmarks.sketch_accuracy import failures, run
+from utils.data_loader import DataStore
+
+
+@pytest.fixture
+def data_store_options():
+    """Restores the DataStore options and instance that run() replaces."""
+    options = dict(DataStore.options)
+    yield
+    DataStore.options = options
+    DataStore.reset()
+
+
+def test_approx_answers_meet_accuracy_thresholds(tmp_path, data_store_options):
+    data_dir = str(tmp_path / 'data')
+    generate(data_dir, 30000, seed=11)
+    report = run(data_dir, 10)
+    assert failures(report, max_miss_rate=0.1, min_recall=0.8, max_relative_error=0.25) == []
+    for name in ('customers.top_orders.desc', 'customers.top_orders.asc', 'products.worst_performing.all'):
+        assert report['checks'][name]['recall'] >= 0.8
@@ -0,0 +1,122 @@
+# utils/aggregations.py
+# Group-by aggregates over sales rows, shared by the customer, product and sales services.
+# Each aggregate is a {group key: sum} dictionary built by folding Table chunks of sales rows into it,
+# so in-memory data (one chunk) and streamed data (many chunks) go through the same code.
+# Keys are inserted in order of first appearance, which keeps tie ordering identical to a
+# single pass over the whole file.
+from collections import Counter
+from datetime import date
+from utils.table import NULL_DATE
+
+
+def _year_months(chunk):
+    """Returns (year, month) for each row's order_date (None where it is missing or not a date)."""
+    column = chunk.column('order_date')
+    if column.kind != 'date': # E.g. text kept for a value that failed to convert
+        return [(value.year, value.month) if isinstance(value, date) else None for value in column.to_list()]
+    ordinals = column.data.tolist()
+    # Dates repeat heavily in sales data, so convert each distinct ordinal once
+    parts = {NULL_DATE: None}
+    for ordinal in set(ordinals):
+        if ordinal != NULL_DATE:
+            day = date.fromordinal(ordinal)
+            parts[ordinal] = (day.year, day.month)
+    return [parts[ordinal] for ordinal in ordinals]
+
+
+def _add_counts(state, values):
+    # Counter preserves first-appearance order, so merging it keeps state ordered
+    counts = Counter(values)
+    counts.pop(None, None)
+    for key, count in counts.items():
+        state[key] = state.get(key, 0) + count
+
+
+def _update_orders_by_customer(state, chunk):
+    # {cust_id: order_count}
+    _add_counts(state, chunk.column_values('cust_id'))
+
+
+def _update_quantity_by_product(state, chunk):
+    # {product_id: total_quantity}
+    quantities = chunk.column_values('product_quantity')
+    for product_id, quantity in zip(chunk.column_values('product_id'), quantities):
+        if product_id is not None:
+            state[product_id] = state.get(product_id, 0) + quantity
+
+
+def _update_quantity_by_product_quarter(state, chunk):
+    # {(product_id, year, quarter): total_quantity}
+    quantities = chunk.column_values('product_quantity')
+    for product_id, year_month, quantity in zip(chunk.column_values('product_id'), _year_months(chunk), quantities):
+        if product_id is not None and year_month:
+            key = (product_id, year_month[0], (year_month[1] - 1) // 3 + 1)
+            state[key] = state.get(key, 0) + quantity
+
+
+def _update_orders_by_customer_month(state, chunk):
+    # {(cust_id, (year, month)): order_count}
+    _add_counts(state, (
+        (cust_id, year_month) if cust_id is not None and year_month else None
+        for cust_id, year_month in zip(chunk.column_values('cust_id'), _year_months(chunk))
+    ))
+
+
+AGGREGATES = {
+    'orders_by_customer': _update_orders_by_customer,
+    'quantity_by_product': _update_quantity_by_product,
+    'quantity_by_product_quarter': _update_quantity_by_product_quarter,
+    'orders_by_customer_month': _update_orders_by_customer_month,
+}
+
+
+def compute_aggregates(chunks, names, engine='python'):
+    """
+    Folds an iterable of sales row chunks into the named aggregates.
+    Args:
+        chunks (iterable): Tables of sales rows.
+        names (iterable): Aggregate names (keys of AGGREGATES).
+        engine (str): 'python' for the pure-Python loops, 'numpy' for the vectorized kernels
+            in utils.vectorized. Both produce identical results.
+    Returns:
+        dict: {name: {group key: value}}
+    Raises:
+        ValueError: If an aggregate name or engine is unknown, or NumPy is not installed.
+    """
+    names = list(dict.fromkeys(names))
+    unknown = [name for name in names if name not in AGGREGATES]
+    if unknown:
+        raise ValueError(f"Unknown aggregate(s): {', '.join(unknown)}")
+
+    if engine == 'numpy':
+        from utils import vectorized # Imported here: it depends on this module's AGGREGATES
+        if not vectorized.is_available():
+            raise ValueError("The 'numpy' engine requires NumPy (pip install numpy).")
+        update = lambda name, state, chunk: vectorized.update_aggregate(name, state, chunk, AGGREGATES[name])
+    elif engine == 'python':
+        update = lambda name, state, chunk: AGGREGATES[name](state, chunk)
+    else:
+        raise ValueError(f"Unknown aggregation engine: {engine}")
+
+    states = {name: {} for name in names}
+    for chunk in chunks:
+        for name in names:
+            update(name, states[name], chunk)
+    return states
+
+
+def merge_aggregates(target, partial):
+    """
+    Adds the partial aggregates of one slice of the sales data into target (in place).
+    Merging partials in the order of their slices keeps first-appearance key order.
+    Args:
+        target (dict): {name: {group key: value}} accumulated so far.
+        partial (dict): {name: {group key: value}} for the next slice.
+    Returns:
+        dict: target
+    """
+    for name, partial_state in partial.items():
+        state = target.setdefault(name, {})
+        for key, value in partial_state.items():
+            state[key] = state.get(key, 0) + value
+    return target
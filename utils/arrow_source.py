@@ -0,0 +1,165 @@
+# utils/arrow_source.py
+# Optional Apache Arrow input: Parquet and Arrow IPC (Feather) versions of the data files.
+# Only the requested columns are read, and numeric, date and ASCII string columns become Table
+# columns over the Arrow buffers (memoryviews) instead of per-value Python objects.
+from array import array as array_
+from datetime import date, datetime
+from utils.converters import CONVERTERS
+from utils.table import (NULL_DATE, NULL_INT, DateColumn, FloatColumn, IntColumn, StrColumn, Table,
+                         build_column)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is optional; CSV input does not need it
+    pa = None
+
+# Extension -> format of the columnar files read instead of a CSV with the same base name,
+# in order of preference
+EXTENSIONS = {'.parquet': 'parquet', '.feather': 'arrow', '.arrow': 'arrow'}
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def is_available():
+    return pa is not None
+
+
+def column_names(path, fmt):
+    """Returns the column names of a Parquet or Arrow IPC file, from its schema."""
+    if fmt == 'parquet':
+        return pq.read_schema(path).names
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def read_table(path, fmt, columns=None):
+    """Reads a Parquet or Arrow IPC file (memory-mapped), keeping only `columns` if given."""
+    if columns is not None:
+        available = column_names(path, fmt)
+        columns = [column for column in available if column in set(columns)]
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns, memory_map=True)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def iter_batches(path, fmt, columns=None, batch_size=100000):
+    """Yields the file's rows as Arrow tables of at most batch_size rows, keeping only `columns` if given."""
+    if fmt == 'parquet':
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        if columns is not None:
+            columns = [column for column in parquet_file.schema_arrow.names if column in set(columns)]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield pa.Table.from_batches([batch])
+        return
+    table = read_table(path, fmt, columns) # Memory-mapped, so slices only touch the pages they use
+    for start in range(0, table.num_rows, batch_size):
+        yield table.slice(start, batch_size)
+
+
+def _buffer_view(array, typecode, width):
+    """Returns the values of a null-free fixed-width Arrow array as a memoryview (no copy)."""
+    data = memoryview(array.buffers()[1]).cast('B')
+    return data[array.offset * width:(array.offset + len(array)) * width].cast(typecode)
+
+
+def _single_chunk(chunked):
+    return chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+
+
+def _str_column(array):
+    """StrColumn for an Arrow string array; shares its offsets buffer when the text is ASCII."""
+    array = pc.fill_null(pc.cast(array, pa.large_string()), '') # Missing text is '' as in CSV input
+    offsets = memoryview(array.buffers()[1]).cast('B')[array.offset * 8:(array.offset + len(array) + 1) * 8].cast('q')
+    start, end = offsets[0], offsets[-1]
+    text = bytes(memoryview(array.buffers()[2])[start:end]).decode('utf-8')
+    if len(text) != end - start: # Non-ASCII: character offsets differ from byte offsets
+        return StrColumn.from_values(array.to_pylist())
+    if start: # A slice of a larger array: offsets must start at 0
+        offsets = array_('q', [offset - start for offset in offsets.tolist()])
+    return StrColumn(offsets, text)
+
+
+def _convert_value(value, target):
+    """Converts a non-text Arrow value to `target` as a CSV cell would be; raises ValueError if it cannot."""
+    if target is int and isinstance(value, float) and value.is_integer():
+        return int(value)
+    if target is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if target is datetime and isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    raise ValueError(value)
+
+
+def _python_column(array, target, header, converter, first_row):
+    """
+    Converts an Arrow column value by value, for types without a buffer mapping (e.g. dates
+    exported as text). Values that do not convert are kept as text and reported through
+    converter.record_failure, like CSV cells.
+    """
+    values = []
+    convert = CONVERTERS.get(target)
+    for position, value in enumerate(array.to_pylist()):
+        if isinstance(value, str):
+            value = value.strip()
+            if convert is None:
+                values.append(value)
+                continue
+            if not value:
+                values.append(None)
+                continue
+            try:
+                values.append(convert(value))
+            except ValueError:
+                converter.record_failure(header, value, f"row {first_row + position}")
+                values.append(value)
+        elif value is None:
+            values.append('' if convert is None else None)
+        elif convert is None:
+            values.append(str(value))
+        else:
+            try:
+                values.append(_convert_value(value, target))
+            except ValueError:
+                converter.record_failure(header, str(value), f"row {first_row + position}")
+                values.append(str(value))
+    return build_column(values, target)
+
+
+def _column(chunked, target, header, converter, first_row):
+    """Returns the Table column for one Arrow column, typed as column_types asks."""
+    arrow_type = chunked.type
+    array = _single_chunk(chunked)
+    if len(array) == 0:
+        return build_column([], target)
+    if target is int and pa.types.is_integer(arrow_type):
+        return IntColumn(_buffer_view(pc.fill_null(pc.cast(array, pa.int64()), NULL_INT), 'q', 8))
+    if target is float and (pa.types.is_floating(arrow_type) or pa.types.is_integer(arrow_type)):
+        return FloatColumn(_buffer_view(pc.fill_null(pc.cast(array, pa.float64()), float('nan')), 'd', 8))
+    if target is datetime and (pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type)):
+        days = pc.cast(pc.cast(pc.cast(array, pa.date32()), pa.int32()), pa.int64())
+        ordinals = pc.fill_null(pc.add(days, _EPOCH_ORDINAL), NULL_DATE)
+        return DateColumn(_buffer_view(ordinals, 'q', 8))
+    if target is None and (pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)):
+        return _str_column(array)
+    return _python_column(array, target, header, converter, first_row)
+
+
+def to_table(arrow_table, column_types, converter, first_row=1):
+    """
+    Converts an Arrow table into a Table with the loader's column types.
+    Args:
+        arrow_table (pyarrow.Table): The rows read from a Parquet or Arrow IPC file.
+        column_types (dict): {column name: int/float/datetime}; other columns are text.
+        converter (RowConverter): Receives values that fail to convert (record_failure).
+        first_row (int): Row number of the first row in the file (1-based), for those reports.
+    """
+    column_types = column_types or {}
+    headers = list(arrow_table.column_names)
+    columns = {
+        header: _column(arrow_table.column(header), column_types.get(header), header, converter, first_row)
+        for header in headers
+    }
+    return Table(headers, columns)
@@ -0,0 +1,125 @@
+# utils/batch.py
+import argparse
+import contextlib
+import os
+import shlex
+import sys
+from utils.data_loader import DataStore
+from utils.timings import timings
+
+# --format -> extension of the per-command output files
+OUTPUT_EXTENSIONS = {'table': 'txt', 'csv': 'csv', 'tsv': 'tsv', 'jsonl': 'jsonl'}
+
+
+class BatchRunner:
+    """
+    Runs the commands of a batch file (one main.py command line per line) in one process.
+    All commands are parsed first, then planned together: the tables they read are loaded
+    once, and every sales aggregate any of them needs is computed in a single fused pass over
+    the sales rows, so commands that share an aggregate do not scan the sales data again.
+    Each command's result is then written to its own output.
+    """
+    def __init__(self, create_parser, dispatch, requirements, command_name, output_format='table', output_dir=None):
+        """
+        Args:
+            create_parser (callable): Returns the CLI's argparse parser.
+            dispatch (callable): Runs parsed arguments, printing results to stdout.
+            requirements (callable): Returns (tables, {table: columns}, sales aggregates) a
+                parsed command needs; a table without columns is read whole.
+            command_name (callable): Returns the (command, subcommand) of parsed arguments.
+            output_format (str): --format of commands whose line does not set one.
+            output_dir (str): Directory for one output file per command; results are printed
+                one after another to stdout if None.
+        """
+        self.create_parser = create_parser
+        self.dispatch = dispatch
+        self.requirements = requirements
+        self.command_name = command_name
+        self.output_format = output_format
+        self.output_dir = output_dir
+
+    def parse(self, lines):
+        """
+        Parses batch lines; blank lines and lines starting with '#' are skipped.
+        Returns:
+            list: (line number, line, parsed arguments) per command.
+            int: Number of lines that could not be parsed (reported on stderr).
+        """
+        parser = self.create_parser()
+        commands = []
+        errors = 0
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                # Lines inherit the batch's --format unless they set their own
+                args = parser.parse_args(shlex.split(line), namespace=argparse.Namespace(format=self.output_format))
+            except (SystemExit, ValueError): # argparse exits on usage errors; shlex raises on unbalanced quotes
+                print(f"Error: Could not parse batch line {number}: {line}", file=sys.stderr)
+                errors += 1
+                continue
+            if args.command in ('serve', 'batch') or args.connect:
+                print(f"Error: Batch line {number} cannot run '{args.command}'{' with --connect' if args.connect else ''}.", file=sys.stderr)
+                errors += 1
+                continue
+            # Loading options, --timings and --profile come from the batch invocation
+            args.timings = False
+            args.profile = None
+            commands.append((number, line, args))
+        return commands, errors
+
+    def plan(self, commands):
+        """Loads the tables of all commands and computes their sales aggregates in one pass."""
+        tables = {} # {table: union of the columns read, None if some command reads all}
+        aggregates = {}
+        for _, _, args in commands:
+            command_tables, command_columns, command_aggregates = self.requirements(args)
+            for name in command_tables:
+                columns = command_columns.get(name)
+                if name in tables and (tables[name] is None or columns is None):
+                    tables[name] = None
+                else:
+                    tables[name] = list(dict.fromkeys([*tables.get(name, ()), *columns])) if columns is not None else None
+            aggregates.update(dict.fromkeys(command_aggregates))
+        with timings.phase("batch plan"):
+            data_store = DataStore()
+            data_store.preload(list(tables), tables)
+            if aggregates:
+                data_store.get_sales_aggregates(list(aggregates))
+
+    def output_path(self, number, args):
+        """Returns the output file of the command on line `number`, e.g. 003-products-worst-performing.csv."""
+        name = '-'.join(self.command_name(args))
+        return os.path.join(self.output_dir, f"{number:03d}-{name}.{OUTPUT_EXTENSIONS[args.format]}")
+
+    def run(self, lines):
+        """
+        Parses, plans and runs the batch. Progress and errors go to stderr.
+        Returns:
+            int: Exit code, 0 if every line ran, 1 otherwise.
+        """
+        commands, errors = self.parse(lines)
+        with contextlib.redirect_stdout(sys.stderr):
+            self.plan(commands)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        succeeded = 0
+        for number, line, args in commands:
+            try:
+                if self.output_dir:
+                    path = self.output_path(number, args)
+                    with open(path, 'w', encoding='utf-8', newline='') as out, contextlib.redirect_stdout(out):
+                        self.dispatch(args)
+                    print(f"Line {number}: {line} -> {path}", file=sys.stderr)
+                else:
+                    print(f"==> {line} <==")
+                    self.dispatch(args)
+                    print()
+                succeeded += 1
+            except Exception as e:
+                print(f"Error in batch line {number} ({line}): {e}", file=sys.stderr)
+                errors += 1
+        print(f"Batch finished: {succeeded} command(s) succeeded, {errors} failed.", file=sys.stderr)
+        return 1 if errors else 0
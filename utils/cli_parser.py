@@ -3,6 +3,32 @@ import argparse
 
 def create_parser():
     parser = argparse.ArgumentParser(description="Python CLI for Sales Data Analysis")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always parse the CSV files instead of reusing binary snapshots from data/.cache.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read sales_transactions.csv in chunks instead of loading it into memory (for files larger than RAM).")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="Number of sales rows per chunk in --stream mode. Defaults to 100000.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for sales aggregations. Above 1, the sales file is split into byte ranges aggregated in parallel. Defaults to 1.")
+    parser.add_argument("--load-workers", type=int, default=1,
+                        help="Worker processes for parsing CSV files that have no snapshot. Above 1, the data files and byte ranges of large files are parsed concurrently. Defaults to 1.")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory",
+                        help="Storage backend: 'memory' holds the tables in memory (default); 'sqlite' loads them into an indexed database under data/.cache (rebuilt when a data file changes) and answers commands with SQL queries, keeping memory use bounded.")
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python",
+                        help="Aggregation backend for sales commands: pure Python loops or NumPy vectorized kernels (requires numpy). Defaults to 'python'.")
+    parser.add_argument("--strict", action="store_true",
+                        help="Fail with one error listing every value that cannot be converted to its column's type (e.g. a bad date), instead of printing a warning per row and keeping the value as text.")
+    parser.add_argument("--format", choices=["table", "csv", "tsv", "jsonl"], default="table",
+                        help="Output format: an aligned 'table' (default), or 'csv', 'tsv' or 'jsonl' (one JSON object per line) for export. Only the table format prints titles.")
+    parser.add_argument("--connect", action="store_true",
+                        help="Send this command to a running query server ('serve') instead of loading the data in this process.")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Unix socket path of the query server. Defaults to data/.cache/query.sock.")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print a per-phase breakdown (wall time, rows, memory allocated) to stderr after the command. Memory tracing (tracemalloc) makes Python-heavy phases such as CSV parsing run several times slower; compare phases relative to each other.")
+    parser.add_argument("--profile", type=str, default=None, metavar="OUT.prof",
+                        help="Run the command under cProfile and write the stats to this file (view with pstats or snakeviz).")
     subparsers = parser.add_subparsers(dest="command", help="Available commands", required=True)
 
     # --- Common Pagination and Sorting Arguments (Helper Function) ---
@@ -18,6 +44,19 @@ def create_parser():
         parser_obj.add_argument("--selects", type=str, default=None,
                                 help="Comma-separated list of columns to display (e.g., 'col1,col2').")
 
+    # --- Common Date Window Arguments (sales are read only for orders within the dates) ---
+    def add_date_window_args(parser_obj):
+        parser_obj.add_argument("--from", dest="date_from", type=str, default=None, metavar="YYYY-MM-DD",
+                                help="Only count sales ordered on or after this date.")
+        parser_obj.add_argument("--to", dest="date_to", type=str, default=None, metavar="YYYY-MM-DD",
+                                help="Only count sales ordered on or before this date.")
+
+    # --- Common Approximate Mode Argument (answers from sketches instead of exact aggregates) ---
+    def add_approx_arg(parser_obj, bounds):
+        parser_obj.add_argument("--approx", action="store_true",
+                                help="Estimate from compact sketches of the sales (built in one pass and cached) "
+                                     f"instead of exact aggregates. Adds an error_bound column: {bounds}")
+
     # --- Customer Commands ---
     customer_parser = subparsers.add_parser("customers", help="Customer related operations.")
     customer_subparsers = customer_parser.add_subparsers(dest="customer_command", help="Customer commands", required=True)
@@ -53,20 +92,29 @@ def create_parser():
     )
     top_customers_orders_parser.add_argument("--order", choices=["asc", "desc"], default="desc",
                                              help="Order of sorting by number of orders (asc for least orders, desc for most orders). Defaults to 'desc'.")
+    add_approx_arg(top_customers_orders_parser,
+                   "each order_count is at least the exact count and at most error_bound above it "
+                   "(always for customers the sketch monitors, otherwise with about 98%% confidence). "
+                   "Exact counts are computed when a bound exceeds half its estimate.")
 
 
     # --- Product Commands ---
     product_parser = subparsers.add_parser("products", help="Product related operations.")
     product_subparsers = product_parser.add_subparsers(dest="product_command", help="Product commands", required=True)
 
-    # Command: products worst-performing --limit 5
+    # Command: products worst-performing --limit 5 --from 2021-01-01 --to 2021-03-31
     worst_performing_products_parser = product_subparsers.add_parser(
         "worst-performing", help="Provide a list of the worst-performing products by total sales quantity."
     )
     worst_performing_products_parser.add_argument("--limit", type=int, default=5,
                                                   help="Limit the number of worst-performing products to display. Defaults to 5.")
+    add_date_window_args(worst_performing_products_parser)
+    add_approx_arg(worst_performing_products_parser,
+                   "each total is at least the exact total and at most error_bound above it (always for "
+                   "products the sketch monitors, otherwise with about 98%% confidence). --from/--to must then "
+                   "cover whole months, and no bound may exceed half its estimate, or exact totals are computed.")
 
-    # Command: products quarterly-sales --quarters 1 2 --order desc
+    # Command: products quarterly-sales --quarters 1 2 --order desc --from 2020-01-01
     quarterly_sales_parser = product_subparsers.add_parser(
         "quarterly-sales", help="List products by quarterly sales from highest to lowest."
     )
@@ -74,16 +122,18 @@ def create_parser():
                                         help="Specify one or more quarters (1, 2, 3, or 4) to include in the analysis (e.g., '--quarters 1 2').")
     quarterly_sales_parser.add_argument("--order", choices=["asc", "desc"], default="desc",
                                         help="Order of sorting by total quarterly sales (asc/desc). Defaults to 'desc'.")
+    add_date_window_args(quarterly_sales_parser)
 
 
     # --- Sales Commands ---
     sales_parser = subparsers.add_parser("sales", help="Sales related operations.")
     sales_subparsers = sales_parser.add_subparsers(dest="sales_command", help="Sales commands", required=True)
 
-    # Command: sales most-orders-per-month
+    # Command: sales most-orders-per-month --from 2021-01-01
     most_orders_per_month_parser = sales_subparsers.add_parser(
         "most-orders-per-month", help="List customers who place the most orders in any single month."
     )
+    add_date_window_args(most_orders_per_month_parser)
 
     # Command: sales return-rate-top-customers
     # NOTE: The "return rate" part requires data not present in your CSVs (e.g., a return flag or separate returns data).
@@ -91,5 +141,31 @@ def create_parser():
     return_rate_parser = sales_subparsers.add_parser(
         "return-rate-top-customers", help="Provides purchase details for the top 3 customers by total orders. (Note: 'Return Rate' concept is placeholder as no return data is available.)"
     )
+    add_date_window_args(return_rate_parser)
+
+    # Command: sales distinct-customers --by location --approx
+    distinct_customers_parser = sales_subparsers.add_parser(
+        "distinct-customers", help="Count the distinct customers with orders in each month or location."
+    )
+    distinct_customers_parser.add_argument("--by", choices=["month", "location"], default="month",
+                                           help="Group by order month or by customer location (the part of the address after the first comma). Defaults to 'month'.")
+    add_approx_arg(distinct_customers_parser,
+                   "the exact count is within error_bound of the estimate about 95%% of the time.")
+
+    # --- Query Server ---
+    # Command: serve --socket /tmp/sales.sock
+    subparsers.add_parser(
+        "serve", help="Keep the data loaded and answer commands sent with --connect over a Unix socket."
+    )
+
+    # --- Batch ---
+    # Command: batch --file nightly.txt --output-dir reports/
+    batch_parser = subparsers.add_parser(
+        "batch", help="Run the commands listed in a file (one command line per line) in one process, sharing loaded tables and computing their sales aggregates in one pass."
+    )
+    batch_parser.add_argument("--file", type=str, required=True,
+                              help="File with one command per line, written as for main.py (e.g. 'products worst-performing --limit 3'). Blank lines and lines starting with '#' are skipped.")
+    batch_parser.add_argument("--output-dir", type=str, default=None,
+                              help="Write each command's result to its own file in this directory (e.g. 001-customers-top-orders.csv). Defaults to printing the results one after another.")
 
     return parser
\ No newline at end of file
@@ -0,0 +1,137 @@
+# utils/converters.py
+# Conversion of parsed CSV cells to typed values. Dates use an ISO fast path with a bounded
+# memo, since the same few thousand date strings repeat across millions of sales rows.
+from datetime import datetime
+from functools import lru_cache
+
+DATE_CACHE_SIZE = 1 << 14 # Distinct date strings remembered (about 45 years of days)
+MAX_EXAMPLES = 5 # Failed values kept per column for reports
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_date(value):
+    """
+    Parses a 'YYYY-MM-DD' date; same result as datetime.strptime(value, '%Y-%m-%d').
+    Raises:
+        ValueError: If the value is not a valid date.
+    """
+    if (len(value) == 10 and value[4] == '-' and value[7] == '-' and value.isascii()
+            and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit()):
+        return datetime(int(value[:4]), int(value[5:7]), int(value[8:]))
+    return datetime.strptime(value, '%Y-%m-%d') # Other spellings strptime accepts (e.g. '2020-1-5')
+
+
+# Column type (as used in column_types) -> converter for non-empty cells
+CONVERTERS = {int: int, float: float, datetime: parse_date}
+
+
+class ConversionError(ValueError):
+    """Raised in strict mode when values of a file could not be converted to their column's type."""
+
+
+class RowConverter:
+    """
+    Converts the cells of parsed CSV rows of one file into values aligned with its headers,
+    applying column_types. Empty typed cells become None; cells that fail to convert are kept
+    as strings and counted per column.
+
+    By default each failure prints a warning. In strict mode nothing is printed and check()
+    raises one ConversionError summarizing every failure once the rows have been converted.
+    """
+    def __init__(self, headers, column_types, filename, strict=False, location_kind='row', report=None):
+        """
+        Args:
+            headers (list): Column names of the file.
+            column_types (dict): {column name: int/float/datetime}; other columns stay strings.
+            filename (str): File name used in warnings and errors.
+            strict (bool): Collect failures for check() instead of printing a warning for each.
+            location_kind (str): What the location passed with each row is, e.g. 'row' or 'byte offset'.
+            report (callable): If given, called as report(header, value, location) with the
+                unformatted location for each failure, instead of warning or collecting it
+                (e.g. in worker processes that hand failures back to the parent).
+        """
+        self.width = len(headers)
+        self.filename = filename
+        self.strict = strict
+        self.location_kind = location_kind
+        self.report = report
+        column_types = column_types or {}
+        self._typed = [
+            (i, header, CONVERTERS[column_types[header]])
+            for i, header in enumerate(headers) if column_types.get(header) in CONVERTERS
+        ]
+        self.failures = {} # {header: {'count': int, 'examples': [[location, value], ...]}}
+        self.warnings = [] # [[location, header, value]] for every warning printed, so cached loads can repeat them
+
+    def __call__(self, row, location):
+        """
+        Args:
+            row (list): Cell strings from csv.reader (may be shorter than the headers).
+            location: Where the row is (e.g. its line number), formatted only for failures.
+        Returns:
+            list: The converted values.
+        """
+        width = self.width
+        values = [value.strip() for value in row[:width]]
+        if len(values) < width: # Handle rows shorter than the headers
+            values.extend([''] * (width - len(values)))
+        for i, header, convert in self._typed:
+            value = values[i]
+            if not value:
+                values[i] = None
+                continue
+            try:
+                values[i] = convert(value)
+            except ValueError:
+                # Fallback to the original string value if conversion fails
+                if self.report is not None:
+                    self.report(header, value, location)
+                else:
+                    self.record_failure(header, value, f"{self.location_kind} {location}")
+        return values
+
+    def record_failure(self, header, value, location):
+        """Warns about (or, in strict mode, collects) one value that failed to convert at `location`."""
+        if not self.strict:
+            print_conversion_warnings(self.filename, [[location, header, value]])
+            self.warnings.append([location, header, value])
+        failure = self.failures.setdefault(header, {'count': 0, 'examples': []})
+        failure['count'] += 1
+        if len(failure['examples']) < MAX_EXAMPLES:
+            failure['examples'].append([location, value])
+
+    @property
+    def failed(self):
+        """True once a strict converter has seen a failure (its rows should not be used)."""
+        return self.strict and bool(self.failures)
+
+    def check(self):
+        """Raises ConversionError in strict mode if any value failed to convert."""
+        if self.strict and self.failures:
+            raise conversion_error(self.filename, self.failures)
+
+
+def print_conversion_warnings(filename, warnings):
+    """Prints the warning for each [location, header, value] of a file (see RowConverter.warnings)."""
+    for location, header, value in warnings or ():
+        print(f"Warning: Could not convert '{value}' for column '{header}' in {filename} {location}. Storing as string.")
+
+
+def merge_failures(target, failures):
+    """Adds the failure summary `failures` into `target` (both as in RowConverter.failures)."""
+    for header, failure in (failures or {}).items():
+        merged = target.setdefault(header, {'count': 0, 'examples': []})
+        merged['count'] += failure['count']
+        merged['examples'] = (merged['examples'] + failure['examples'])[:MAX_EXAMPLES]
+    return target
+
+
+def conversion_error(filename, failures):
+    """Builds the ConversionError reporting a failure summary for one file."""
+    total = sum(failure['count'] for failure in failures.values())
+    details = "; ".join(
+        f"column '{header}': {failure['count']} (e.g. "
+        + ", ".join(f"'{value}' at {location}" for location, value in failure['examples']) + ")"
+        for header, failure in failures.items()
+    )
+    return ConversionError(f"{total} value(s) in {filename} could not be converted: {details}")
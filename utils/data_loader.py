@@ -1,129 +1,913 @@
 # utils/data_loader.py
 import csv
+import io
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from utils.snapshot import HashingReader, SnapshotCache, file_fingerprint
+from utils.table import KeyIndex, Table, column_from_blocks
+from utils.temporal_index import TemporalIndex
+from utils.text_index import TrigramIndex
+from utils.sort_index import SortedIndex
+from utils.partitions import MonthPartitions
+from utils.sketches import SKETCHES_VERSION, SalesSketches
+from utils.helpers import address_location
+from utils.timings import timings
+from utils.aggregations import AGGREGATES, compute_aggregates
+from utils.materialized import MaterializedAggregates
+from utils.incremental import IncrementalAggregates, append_marker, complete_lines_end, is_appended
+from utils.parallel import iter_byte_range_chunks, parallel_aggregates, parse_byte_range, split_byte_ranges
+from utils.converters import RowConverter, conversion_error, merge_failures, print_conversion_warnings
+from utils.sqlite_store import SqliteStore
+from utils import arrow_source
+
+MIN_RANGE_BYTES = 1 << 20 # Smallest byte range worth parsing in its own worker
 
 class DataLoader:
-    def __init__(self, data_dir='data'):
+    def __init__(self, data_dir='data', use_snapshots=True, strict=False, workers=1):
         # Construct the absolute path to the data directory relative to the current script
         current_script_dir = os.path.dirname(os.path.abspath(__file__))
         self.data_path = os.path.join(current_script_dir, '..', data_dir)
+        # Binary snapshots of parsed CSVs, reused while the source files are unchanged
+        self.snapshot_cache = SnapshotCache(os.path.join(self.data_path, '.cache')) if use_snapshots else None
+        # Strict: values that fail type conversion abort the load with one ConversionError
+        # listing them all, instead of a warning per value
+        self.strict = strict
+        # Processes that parse CSV files without a snapshot (1: parse in this process)
+        self.workers = workers
+        self._skipped_sources = set() # Columnar files ignored for lack of pyarrow (warned once)
+
+    def row_converter(self, headers, column_types, filename, location_kind='row'):
+        """Returns a RowConverter for one file, strict if this loader is."""
+        return RowConverter(headers, column_types, filename, strict=self.strict, location_kind=location_kind)
+
+    def get_file_path(self, filename):
+        return os.path.join(self.data_path, filename)
+
+    def source(self, filename):
+        """
+        Returns (path, format) of the data file named by `filename` (e.g. 'customer_dim.csv').
+        A Parquet or Arrow IPC/Feather file with the same base name (customer_dim.parquet,
+        .feather or .arrow) is read instead of the CSV when there is one and pyarrow is
+        installed. The format is 'parquet', 'arrow' or 'csv'.
+        """
+        base = os.path.splitext(filename)[0]
+        for extension, fmt in arrow_source.EXTENSIONS.items():
+            path = self.get_file_path(base + extension)
+            if os.path.exists(path):
+                if arrow_source.is_available():
+                    return path, fmt
+                if path not in self._skipped_sources:
+                    self._skipped_sources.add(path)
+                    print(f"Warning: Reading {base + extension} requires pyarrow (pip install pyarrow). Using {filename} instead.")
+                break
+        return self.get_file_path(filename), 'csv'
+
+    def is_csv(self, filename):
+        """True if `filename` is read from its CSV (see source)."""
+        return self.source(filename)[1] == 'csv'
+
+    def load_table(self, filename, column_types=None, columns=None):
+        """
+        Loads a data file into a columnar Table, from the CSV or a columnar version of it (see source).
+        Args:
+            filename (str): The name of the CSV file.
+            column_types (dict): {column name: int/float/datetime}, as for _load_csv.
+            columns (iterable): The columns to read, or None for all. Only columnar files are
+                pruned (each CSV line is parsed whole), so the Table may have more columns.
+        Returns:
+            Table: The rows.
+            list: A list of header names.
+        """
+        path, fmt = self.source(filename)
+        if fmt == 'csv':
+            return self._load_csv(filename, column_types)
+        name = os.path.basename(path)
+        try:
+            with timings.phase(f"read {fmt} {name}") as phase:
+                arrow_table = arrow_source.read_table(path, fmt, columns)
+                convert = self.row_converter(arrow_table.column_names, column_types, name)
+                table = arrow_source.to_table(arrow_table, column_types, convert)
+                phase.rows = len(table)
+        except Exception as e:
+            print(f"An error occurred while loading {name}: {e}")
+            return Table.empty(), []
+        convert.check()
+        return table, list(table.headers)
 
     def _load_csv(self, filename, column_types=None):
         """
-        Loads a CSV file into a list of dictionaries.
+        Loads a CSV file into a columnar Table.
         Args:
             filename (str): The name of the CSV file.
             column_types (dict): A dictionary mapping column names to their target types (e.g., {'age': int, 'date': datetime}).
         Returns:
-            list: A list of dictionaries, where each dictionary represents a row.
+            Table: The rows, readable as a sequence of dictionary-like Row views.
             list: A list of header names.
         """
-        file_path = os.path.join(self.data_path, filename)
-        data = []
+        return self.load_csv_files({filename: column_types})[filename]
+
+    def load_csv_files(self, files):
+        """
+        Loads several CSV files. Snapshots are read first; the files without a usable one are
+        parsed one after another or, with workers > 1, all together: each file is split into
+        byte ranges that a process pool parses concurrently, so loading takes about as long as
+        the largest file rather than the sum of all of them.
+        Args:
+            files (dict): {filename: column_types}, as for _load_csv.
+        Returns:
+            dict: {filename: (Table, headers)}
+        """
+        loaded = {}
+        to_parse = {}
+        for filename, column_types in files.items():
+            table = self._load_cached(filename, column_types)
+            if table is not None:
+                loaded[filename] = (table, list(table.headers))
+            else:
+                to_parse[filename] = column_types
+        if self.workers > 1 and to_parse:
+            loaded.update(self._parse_csv_parallel(to_parse))
+        else:
+            for filename, column_types in to_parse.items():
+                loaded[filename] = self._parse_csv(filename, column_types)
+        return {filename: loaded[filename] for filename in files}
+
+    def _load_cached(self, filename, column_types):
+        """Returns the file's Table from its snapshot (extended with appended rows), or None."""
+        if not self.snapshot_cache:
+            return None
+        with timings.phase(f"read snapshot {filename}") as phase:
+            table, source = self.snapshot_cache.load(self.get_file_path(filename), with_source=True)
+            failures = source and source.get('conversion_failures')
+            if table is None:
+                table, failures = self._load_appended(filename, column_types)
+            elif not self.strict: # Repeat the warnings printed when the rows were parsed
+                print_conversion_warnings(filename, source.get('conversion_warnings'))
+            phase.rows = None if table is None else len(table)
+        if table is not None and self.strict and failures: # Recorded when the rows were parsed
+            raise conversion_error(filename, failures)
+        return table
+
+    def _parse_csv(self, filename, column_types):
+        """Parses a CSV file in this process and stores its snapshot. Returns (Table, headers)."""
+        file_path = self.get_file_path(filename)
+        rows = []
         headers = []
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
+            fingerprint = file_fingerprint(file_path, with_hash=False)
+            source = HashingReader(file_path) # The snapshot records the hash of the bytes parsed here
+            with timings.phase(f"parse csv {filename}") as phase, \
+                    io.TextIOWrapper(io.BufferedReader(source, 1 << 20), encoding='utf-8') as f:
                 reader = csv.reader(f)
                 headers = [h.strip() for h in next(reader)] # Read headers from the first row
+                convert = self.row_converter(headers, column_types, filename)
 
-                for row_num, row in enumerate(reader):
+                convert_seconds = 0.0 # Type conversion (incl. date parsing) share of the parse, with --timings
+                for row_num, row in enumerate(reader, 2):
                     if not row: # Skip empty rows
                         continue
-
-                    item = {}
-                    for i, header in enumerate(headers):
-                        value = row[i].strip() if i < len(row) else '' # Handle rows potentially shorter than headers
-
-                        # Apply type conversion if specified
-                        if column_types and header in column_types:
-                            try:
-                                if column_types[header] == int:
-                                    item[header] = int(value) if value else None
-                                elif column_types[header] == float:
-                                    item[header] = float(value) if value else None
-                                elif column_types[header] == datetime:
-                                    # Attempt to parse date in YYYY-MM-DD format
-                                    item[header] = datetime.strptime(value, '%Y-%m-%d') if value else None
-                                else:
-                                    item[header] = value # Default to string if type not specified
-                            except ValueError:
-                                # Fallback to original string value if conversion fails
-                                print(f"Warning: Could not convert '{value}' for column '{header}' in {filename} row {row_num + 2}. Storing as string.")
-                                item[header] = value
-                        else:
-                            item[header] = value # Store as string if no type conversion specified
-
-                    data.append(item)
+                    if timings.enabled:
+                        started = time.perf_counter()
+                        rows.append(convert(row, row_num))
+                        convert_seconds += time.perf_counter() - started
+                    else:
+                        rows.append(convert(row, row_num))
+                phase.rows = len(rows)
+                timings.record("convert values (types, dates)", convert_seconds, len(rows))
+                fingerprint['hash'] = source.hexdigest()
+            with timings.phase(f"build columns {filename}", rows=len(rows)):
+                table = Table.from_rows(headers, rows, column_types)
         except FileNotFoundError:
             print(f"Error: Data file not found at {file_path}")
-            return [], [] # Return empty data and headers
+            return Table.empty(), [] # Return empty data and headers
         except Exception as e:
             print(f"An error occurred while loading {filename}: {e}")
-            return [], []
-
-        return data, headers
-
-    def load_customer_data(self):
-        column_types = {
-            'cust_id': int,
-            'cust_age': int,
-            'effective_start_date': datetime,
-            'effective_end_date': datetime
-        }
-        return self._load_csv('customer_dim.csv', column_types)
-
-    def load_product_data(self):
-        column_types = {
-            'product_id': int,
-            'product_price': float,
-            'effective_start_date': datetime,
-            'effective_end_date': datetime
-        }
-        return self._load_csv('product_dim.csv', column_types)
-
-    def load_sales_data(self):
-        column_types = {
-            'order_id': int,
-            'product_id': int,
-            'cust_id': int,
-            'product_quantity': int,
-            'order_date': datetime
-        }
-        return self._load_csv('sales_transactions.csv', column_types)
-
-
-# Singleton DataStore to load data once and provide consistent access
+            return Table.empty(), []
+
+        if self.snapshot_cache:
+            with timings.phase(f"write snapshot {filename}", rows=len(table)):
+                self._store_snapshot(filename, table, fingerprint, convert.failures, convert.warnings)
+
+        convert.check()
+        return table, headers
+
+    def _parse_csv_parallel(self, files):
+        """
+        Parses CSV files ({filename: column_types}) in a pool of `workers` processes. Each
+        worker returns the column buffers of one byte range (see parse_byte_range); they are
+        concatenated here in file order. Files that cannot be split (missing, empty, or with
+        quoted fields spanning lines) are parsed by _parse_csv instead.
+        Returns:
+            dict: {filename: (Table, headers)}
+        """
+        plans = {} # {filename: (fingerprint, headers, byte ranges)}
+        for filename in files:
+            try:
+                # Hashed before the workers read it: their byte ranges cannot be hashed as one stream
+                fingerprint = file_fingerprint(self.get_file_path(filename))
+                # Large files get a few ranges per worker; small ones are parsed whole
+                parts = max(1, min(self.workers * 2, fingerprint['size'] // MIN_RANGE_BYTES))
+                headers, ranges = split_byte_ranges(self.get_file_path(filename), parts, fingerprint['size'])
+            except OSError:
+                continue
+            if headers:
+                plans[filename] = (fingerprint, headers, ranges)
+
+        parsed = {}
+        if sum(len(ranges) for _, _, ranges in plans.values()) > 1: # A single range is parsed faster in this process
+            results = {}
+            with timings.phase(f"parse csv {', '.join(plans)} ({self.workers} workers)"), \
+                    ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {
+                    filename: [executor.submit(parse_byte_range, (self.get_file_path(filename), start, end, headers, files[filename]))
+                               for start, end in ranges]
+                    for filename, (_, headers, ranges) in plans.items()
+                }
+                for filename, file_futures in futures.items():
+                    try:
+                        results[filename] = [future.result() for future in file_futures]
+                    except Exception as e:
+                        print(f"An error occurred while loading {filename}: {e}")
+                        parsed[filename] = (Table.empty(), [])
+            for filename, file_results in results.items():
+                if all(result is not None for result in file_results):
+                    fingerprint, headers, _ = plans[filename]
+                    parsed[filename] = self._assemble_ranges(filename, files[filename], fingerprint, headers, file_results)
+
+        for filename, column_types in files.items():
+            if filename not in parsed:
+                parsed[filename] = self._parse_csv(filename, column_types)
+        return parsed
+
+    def _assemble_ranges(self, filename, column_types, fingerprint, headers, results):
+        """Joins the parsed byte ranges of one file into its Table and stores its snapshot."""
+        convert = self.row_converter(headers, column_types, filename)
+        tables = []
+        records_before = 0
+        with timings.phase(f"build columns {filename}") as phase:
+            for columns, records, failures in results:
+                tables.append(Table(headers, {header: column_from_blocks(kind, blocks) for header, kind, blocks in columns}))
+                for index, header, value in failures: # Reported in file order, as a serial parse does
+                    convert.record_failure(header, value, f"row {records_before + index + 2}")
+                records_before += records
+            table = Table.concat(tables, column_types) if tables else Table.from_rows(headers, [], column_types)
+            phase.rows = len(table)
+
+        if self.snapshot_cache:
+            with timings.phase(f"write snapshot {filename}", rows=len(table)):
+                self._store_snapshot(filename, table, fingerprint, convert.failures, convert.warnings)
+
+        convert.check()
+        return table, headers
+
+    def _store_snapshot(self, filename, table, fingerprint, failures=None, warnings=None):
+        """
+        Writes the snapshot of a parsed file. If the file is unchanged since `fingerprint` was
+        taken and ends with a complete line, an append marker is recorded so rows appended
+        later can be parsed on their own (see _load_appended). Conversion failures and warnings
+        are recorded too, so runs that reuse the snapshot still report them.
+        """
+        file_path = self.get_file_path(filename)
+        try:
+            current = file_fingerprint(file_path, with_hash=False)
+            size = fingerprint['size']
+            if current['size'] != size or current['mtime_ns'] != fingerprint['mtime_ns']:
+                # Changed while it was parsed: the hash may not describe the parsed rows
+                fingerprint = dict(fingerprint, hash=None)
+            elif complete_lines_end(file_path, size) == size:
+                fingerprint = dict(fingerprint, append_marker=append_marker(file_path, size))
+            if failures:
+                fingerprint = dict(fingerprint, conversion_failures=failures)
+            if warnings:
+                fingerprint = dict(fingerprint, conversion_warnings=warnings)
+            self.snapshot_cache.store(file_path, table, fingerprint)
+        except OSError as e:
+            print(f"Warning: Could not write snapshot for {filename}: {e}")
+
+    def _load_appended(self, filename, column_types=None):
+        """
+        If rows were only appended to a CSV since its last snapshot, parses just those rows,
+        adds them to the snapshot's table and stores the extended snapshot.
+        Returns:
+            Table: All rows of the file, or None if the snapshot cannot be extended.
+            dict: Conversion failures of all its rows (see RowConverter.failures), or None.
+        """
+        file_path = self.get_file_path(filename)
+        snapshot = self.snapshot_cache.open_previous(file_path)
+        if snapshot is None:
+            return None, None
+        marker = snapshot.meta['source'].get('append_marker')
+        try:
+            # Only rows appended after an unchanged prefix are parsed; any other change
+            # (including an edit that keeps the size) means a full parse
+            if not is_appended(file_path, marker, grown=True):
+                snapshot.close()
+                return None, None
+            table = snapshot.table()
+            fingerprint = file_fingerprint(file_path)
+            previous_warnings = snapshot.meta['source'].get('conversion_warnings') or []
+            if not self.strict: # The snapshot's rows come first, then the appended ones
+                print_conversion_warnings(filename, previous_warnings)
+            convert = self.row_converter(table.headers, column_types, filename)
+            tail = list(iter_byte_range_chunks(file_path, marker['offset'], fingerprint['size'],
+                                               table.headers, column_types, convert, first_row=marker['lines'] + 1))
+        except (OSError, ValueError, TypeError, KeyError):
+            snapshot.close()
+            return None, None
+        if tail:
+            table = Table.concat([table] + tail, column_types)
+        failures = merge_failures(merge_failures({}, snapshot.meta['source'].get('conversion_failures')), convert.failures)
+        self._store_snapshot(filename, table, fingerprint, failures, previous_warnings + convert.warnings)
+        return table, failures
+
+    def load_derived_columns(self, filename, name):
+        """Returns columns derived from `filename` (e.g. an index) cached under `name`, or None."""
+        if not self.snapshot_cache or not self.is_csv(filename): # Cached next to CSV snapshots only
+            return None
+        return self.snapshot_cache.load_columns(self.get_file_path(filename), name)
+
+    def store_derived_columns(self, filename, name, columns):
+        """Caches columns derived from `filename` next to its snapshot (no-op without snapshots)."""
+        if not self.snapshot_cache or not self.is_csv(filename):
+            return
+        try:
+            self.snapshot_cache.store_columns(self.get_file_path(filename), name, columns)
+        except OSError as e:
+            print(f"Warning: Could not write {name} cache for {filename}: {e}")
+
+    def _iter_csv_chunks(self, filename, column_types=None, chunk_size=100000, report=None):
+        """
+        Streams a CSV file as Tables of at most chunk_size rows.
+        Only one chunk is held in memory at a time, so callers that fold each chunk into
+        running aggregates use memory bounded by chunk_size rather than by file size.
+        Yields nothing if the file is missing or empty. If `report` is a dict, it receives the
+        file's 'headers' and, once every row has been read, its conversion 'failures' (as in
+        RowConverter.failures).
+        """
+        file_path = self.get_file_path(filename)
+        try:
+            f = open(file_path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            print(f"Error: Data file not found at {file_path}")
+            return
+
+        with f:
+            reader = csv.reader(f)
+            try:
+                headers = [h.strip() for h in next(reader)]
+            except StopIteration:
+                return
+            if report is not None:
+                report['headers'] = headers
+
+            convert = self.row_converter(headers, column_types, filename)
+            chunk = []
+            for row_num, row in enumerate(reader, 2):
+                if not row:
+                    continue
+                chunk.append(convert(row, row_num))
+                if len(chunk) >= chunk_size:
+                    if not convert.failed: # Strict: keep converting to report every failure, but stop yielding
+                        yield Table.from_rows(headers, chunk, column_types)
+                    chunk = []
+            if chunk and not convert.failed:
+                yield Table.from_rows(headers, chunk, column_types)
+            if report is not None:
+                report['failures'] = convert.failures
+            convert.check()
+
+    CUSTOMER_COLUMN_TYPES = {
+        'cust_id': int,
+        'cust_age': int,
+        'effective_start_date': datetime,
+        'effective_end_date': datetime
+    }
+
+    def load_customer_data(self, columns=None):
+        return self.load_table('customer_dim.csv', self.CUSTOMER_COLUMN_TYPES, columns)
+
+    PRODUCT_COLUMN_TYPES = {
+        'product_id': int,
+        'product_price': float,
+        'effective_start_date': datetime,
+        'effective_end_date': datetime
+    }
+
+    def load_product_data(self, columns=None):
+        return self.load_table('product_dim.csv', self.PRODUCT_COLUMN_TYPES, columns)
+
+    SALES_COLUMN_TYPES = {
+        'order_id': int,
+        'product_id': int,
+        'cust_id': int,
+        'product_quantity': int,
+        'order_date': datetime
+    }
+
+    # Source file -> column types, for loading several files at once (load_csv_files)
+    FILE_COLUMN_TYPES = {
+        'customer_dim.csv': CUSTOMER_COLUMN_TYPES,
+        'product_dim.csv': PRODUCT_COLUMN_TYPES,
+        'sales_transactions.csv': SALES_COLUMN_TYPES,
+    }
+
+    def load_sales_data(self, columns=None):
+        return self.load_table('sales_transactions.csv', self.SALES_COLUMN_TYPES, columns)
+
+    def iter_sales_chunks(self, chunk_size=100000, columns=None):
+        """Streams the sales rows as Table chunks (see iter_file_chunks)."""
+        return self.iter_file_chunks('sales_transactions.csv', chunk_size, columns=columns)
+
+    def iter_file_chunks(self, filename, chunk_size=100000, report=None, columns=None):
+        """
+        Streams one of the data files (a key of FILE_COLUMN_TYPES) as Table chunks, from the CSV
+        (see _iter_csv_chunks) or, reading only `columns` if given, from a columnar version of it.
+        """
+        column_types = self.FILE_COLUMN_TYPES[filename]
+        path, fmt = self.source(filename)
+        if fmt == 'csv':
+            return self._iter_csv_chunks(filename, column_types, chunk_size, report)
+        return self._iter_columnar_chunks(path, fmt, column_types, chunk_size, report, columns)
+
+    def _iter_columnar_chunks(self, path, fmt, column_types, chunk_size, report, columns):
+        """Streams a Parquet or Arrow IPC file as Tables of at most chunk_size rows (as _iter_csv_chunks)."""
+        name = os.path.basename(path)
+        headers = [column for column in arrow_source.column_names(path, fmt) if columns is None or column in columns]
+        if report is not None:
+            report['headers'] = headers
+        convert = self.row_converter(headers, column_types, name)
+        first_row = 1
+        for batch in arrow_source.iter_batches(path, fmt, columns, chunk_size):
+            chunk = arrow_source.to_table(batch, column_types, convert, first_row)
+            first_row += len(chunk)
+            if not convert.failed: # Strict: keep converting to report every failure, but stop yielding
+                yield chunk
+        if report is not None:
+            report['failures'] = convert.failures
+        convert.check()
+
+
+# Singleton DataStore to load data once and provide consistent access.
+# Tables (and the indexes built on them) are loaded on first access, so a command only
+# pays for the files it actually reads.
 class DataStore:
     _instance = None
+    # Options applied when the singleton is first created (see configure)
+    options = {
+        'data_dir': 'data', # Relative to the project root, or an absolute path
+        'use_snapshots': True,
+        'streaming': False, # Read sales_transactions.csv chunk by chunk instead of holding it in memory
+        'chunk_size': 100000,
+        'workers': 1, # Processes used for sales aggregations; >1 aggregates byte ranges of the CSV in parallel
+        'engine': 'python', # Aggregation kernels: 'python' or 'numpy' (see utils.vectorized)
+        'strict': False, # Fail on values that do not convert to their column's type (see RowConverter)
+        'load_workers': 1, # Processes parsing CSV files without a snapshot; >1 parses files and byte ranges concurrently
+        'backend': 'memory', # Where tables live: 'memory' (columnar Tables) or 'sqlite' (an indexed database file, see SqliteStore)
+    }
+    # Columns that get a SortedIndex for --order-by (others are sorted per query)
+    SORTED_COLUMNS = {
+        'customer': ('cust_id', 'cust_age', 'effective_start_date', 'effective_end_date'),
+    }
+    # Table name -> DataLoader method that loads it
+    TABLE_LOADERS = {
+        'customer': 'load_customer_data',
+        'product': 'load_product_data',
+        'sales': 'load_sales_data',
+    }
+    # Sales columns the aggregations read, the only ones streamed from a Parquet/Arrow source
+    SALES_SCAN_COLUMNS = ('cust_id', 'product_id', 'product_quantity', 'order_date')
+    # Table name -> source file, for caches derived from a table
+    TABLE_FILES = {
+        'customer': 'customer_dim.csv',
+        'product': 'product_dim.csv',
+        'sales': 'sales_transactions.csv',
+    }
+
+    @classmethod
+    def configure(cls, **options):
+        """
+        Sets loading options before the DataStore is first instantiated.
+        Raises ValueError for unknown options.
+        """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError(f"Unknown DataStore option(s): {', '.join(sorted(unknown))}")
+        cls.options = dict(cls.options, **options)
+
+    @classmethod
+    def reset(cls):
+        """Drops the shared instance, so the next DataStore() starts empty with the current options."""
+        cls._instance = None
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
             cls._instance = super(DataStore, cls).__new__(cls, *args, **kwargs)
-            cls._instance.data_loader = DataLoader()
-            print("Loading data...")
-            # Store data and their original headers
-            cls._instance.customer_data, cls._instance.customer_headers = cls._instance.data_loader.load_customer_data()
-            cls._instance.product_data, cls._instance.product_headers = cls._instance.data_loader.load_product_data()
-            cls._instance.sales_data, cls._instance.sales_headers = cls._instance.data_loader.load_sales_data()
-            print("Data loaded.")
+            cls._instance.data_loader = DataLoader(cls.options['data_dir'], use_snapshots=cls.options['use_snapshots'],
+                                                   strict=cls.options['strict'], workers=cls.options['load_workers'])
+            # Streaming and parallel aggregation read sales from disk, so it is never loaded whole
+            cls._instance.sales_in_memory = not cls.options['streaming'] and cls.options['workers'] <= 1
+            cls._instance.backend = cls.options['backend']
+            cls._instance._tables = {} # {table name: (Table, headers)}
+            cls._instance._table_columns = {} # {table name: columns it was read with, None if all}
+            cls._instance._indexes = {} # {index name: index}
+            # Computed group-bys shared by all services, persisted with the cache when it is enabled
+            snapshot_cache = cls._instance.data_loader.snapshot_cache
+            cls._instance.materialized = MaterializedAggregates(
+                os.path.join(snapshot_cache.cache_dir, 'materialized') if snapshot_cache else None)
         return cls._instance
 
+    def _get_table(self, name, columns=None):
+        loaded = self._tables.get(name)
+        if loaded is None:
+            if name not in self.TABLE_LOADERS:
+                raise ValueError(f"Unknown table: {name}")
+            if name == 'sales' and not self.sales_in_memory:
+                # Sales rows are read on demand by iter_sales_chunks
+                loaded = (Table.empty(), [])
+            else:
+                with timings.phase(f"load {name}") as phase:
+                    loaded = getattr(self.data_loader, self.TABLE_LOADERS[name])(columns)
+                    phase.rows = len(loaded[0])
+            self._tables[name] = loaded
+            # Only columnar sources are pruned; a CSV table always has every column
+            self._table_columns[name] = None if self.data_loader.is_csv(self.TABLE_FILES[name]) else columns
+        return loaded
+
+    def _unload(self, name):
+        """Drops a loaded table and the indexes built over it."""
+        self._tables.pop(name, None)
+        self._table_columns.pop(name, None)
+        for index_name in [index_name for index_name in self._indexes if index_name.startswith(name + '_')]:
+            del self._indexes[index_name]
+
+    def _get_index(self, name, build):
+        index = self._indexes.get(name)
+        if index is None:
+            with timings.phase(f"index {name}"):
+                index = self._indexes[name] = build()
+        return index
+
+    @property
+    def sql_store(self):
+        """The SqliteStore holding the tables with the 'sqlite' backend (built on first use), or None."""
+        if self.backend != 'sqlite':
+            return None
+        return self._get_index('sqlite_store', self._open_sql_store)
+
+    def _open_sql_store(self):
+        filenames = list(self.TABLE_FILES.values())
+        return SqliteStore(
+            os.path.join(self.data_loader.data_path, '.cache', 'store.sqlite'),
+            self.data_loader,
+            {name: (filename, self.data_loader.FILE_COLUMN_TYPES[filename]) for name, filename in self.TABLE_FILES.items()},
+            self.data_version(filenames),
+            rebuild=not self.options['use_snapshots'],
+            chunk_size=self.options['chunk_size'],
+        )
+
+    def preload(self, tables, columns=None):
+        """
+        Loads the given tables (names from TABLE_LOADERS) up front, e.g. the tables a
+        command declares it reads. Already-loaded tables are skipped. With the 'sqlite'
+        backend the database holding every table is opened (or built) instead.
+        Args:
+            tables (iterable): Table names.
+            columns (dict): {table name: the only columns read from it}, for tables read
+                from Parquet/Arrow files (see DataLoader.source); other tables are read whole.
+                A table loaded with fewer columns than asked for is loaded again.
+        """
+        columns = columns or {}
+        if self.backend == 'sqlite':
+            if 'sqlite_store' not in self._indexes:
+                print("Loading data...")
+                self.sql_store
+                print("Data loaded.")
+            return
+        missing = {}
+        for name in tables:
+            wanted = columns.get(name)
+            if name in self._tables:
+                loaded = self._table_columns.get(name)
+                if loaded is None or (wanted is not None and set(wanted) <= set(loaded)):
+                    continue
+                # Read with fewer columns than this command needs: read again with all of them
+                wanted = None if wanted is None else list(dict.fromkeys([*loaded, *wanted]))
+                self._unload(name)
+            missing[name] = wanted
+        if not missing:
+            return
+        print("Loading data...")
+        loader = self.data_loader
+        together = [
+            name for name in missing
+            if (name != 'sales' or self.sales_in_memory) and loader.is_csv(self.TABLE_FILES[name])
+        ]
+        if loader.workers > 1 and len(together) > 1:
+            # Parse the tables in one process pool, so they load concurrently
+            files = {self.TABLE_FILES[name]: loader.FILE_COLUMN_TYPES[self.TABLE_FILES[name]] for name in together}
+            with timings.phase(f"load {', '.join(together)}") as phase:
+                loaded = loader.load_csv_files(files)
+                phase.rows = sum(len(table) for table, _ in loaded.values())
+            for name in together:
+                self._tables[name] = loaded[self.TABLE_FILES[name]]
+                self._table_columns[name] = None
+        for name, wanted in missing.items():
+            self._get_table(name, wanted)
+        print("Data loaded.")
+
+    def warm(self):
+        """Loads every table and builds every index, e.g. for a long-running query server."""
+        self.preload(self.TABLE_LOADERS)
+        if self.backend == 'sqlite':
+            return
+        self.get_customer_index()
+        self.get_customer_age_index()
+        self.get_product_index()
+        self.get_customer_temporal_index()
+        self.get_product_temporal_index()
+        self.get_customer_address_index()
+        for column in self.SORTED_COLUMNS['customer']:
+            self.get_sort_index('customer', column)
+        if self.sales_in_memory:
+            self.get_sales_partitions()
+
+    def default_socket_path(self):
+        return os.path.join(self.data_loader.data_path, '.cache', 'query.sock')
+
+    # Tables are read-only, so services share them instead of receiving copies
     def get_customer_data(self):
-        return list(self.customer_data) # Return a shallow copy to prevent external modification
+        return self._get_table('customer')[0]
 
     def get_product_data(self):
-        return list(self.product_data)
+        return self._get_table('product')[0]
 
     def get_sales_data(self):
-        return list(self.sales_data)
+        return self._get_table('sales')[0]
+
+    def iter_sales_chunks(self, window=None):
+        """
+        Yields the sales rows as a sequence of Table chunks.
+        When sales are not held in memory (streaming or parallel mode) each chunk is read from
+        disk as it is consumed; otherwise the in-memory sales data is yielded as a single chunk.
+        Args:
+            window (DateWindow): If given, only rows whose order_date is in the window are
+                yielded (still in file order): taken from the matching month partitions when
+                sales are in memory, filtered chunk by chunk otherwise.
+        """
+        if not self.sales_in_memory:
+            for chunk in self.data_loader.iter_sales_chunks(self.options['chunk_size'], self.SALES_SCAN_COLUMNS):
+                if window is not None:
+                    chunk = chunk.take(window.positions(chunk, 'order_date'))
+                if chunk:
+                    yield chunk
+        else:
+            sales_data = self.get_sales_data()
+            if window is not None:
+                headers = [header for header in sales_data.headers if header in self.SALES_SCAN_COLUMNS]
+                sales_data = sales_data.take(self.get_sales_partitions().positions(window), headers)
+            if sales_data:
+                yield sales_data
+
+    def get_sales_aggregates(self, names, window=None):
+        """
+        Computes the named sales group-by aggregates (see utils.aggregations) in one pass
+        over the sales chunks, or with a process pool when the 'workers' option is above 1, or
+        as GROUP BY queries with the 'sqlite' backend.
+        With the cache enabled, running aggregates are kept on disk and only the rows appended
+        to sales_transactions.csv since the previous run are aggregated.
+        Args:
+            names (iterable): Aggregate names.
+            window (DateWindow): If given, only sales whose order_date is in the window are
+                aggregated, reading just the month partitions it overlaps (see iter_sales_chunks).
+        Returns:
+            dict: {aggregate name: {group key: value}}
+        """
+        names = list(dict.fromkeys(names))
+        unknown = [name for name in names if name not in AGGREGATES]
+        if unknown:
+            raise ValueError(f"Unknown aggregate(s): {', '.join(unknown)}")
+        if window is not None:
+            with timings.phase(f"sales aggregates {', '.join(names)} in {window.key()}"):
+                return self._get_window_sales_aggregates(names, window)
+        with timings.phase(f"sales aggregates {', '.join(names)}"):
+            return self._get_sales_aggregates(names)
+
+    def _get_window_sales_aggregates(self, names, window):
+        # Cached per window and data version, like the all-time aggregates without the disk cache
+        keys = {f"sales:{name}@{window.key()}": name for name in names}
+        def compute(missing):
+            missing_names = [keys[key] for key in missing]
+            if self.backend == 'sqlite':
+                computed = self.sql_store.sales_aggregates(missing_names, window)
+            else:
+                computed = compute_aggregates(self.iter_sales_chunks(window), missing_names, self.options['engine'])
+            return {key: computed[keys[key]] for key in missing}
+        cached = self.materialized.get_many(list(keys), self.result_version(['sales_transactions.csv']), compute)
+        return {name: cached[key] for key, name in keys.items()}
+
+    def _get_sales_aggregates(self, names):
+        if (self.options['use_snapshots'] and self.backend == 'memory'
+                and self.data_loader.is_csv('sales_transactions.csv')):
+            # Running aggregates persisted in the cache; only rows appended since the last run are read
+            aggregates = self._get_index('sales_aggregates', self._running_sales_aggregates).refresh()
+            return {name: aggregates[name] for name in names}
+
+        # Otherwise (no disk cache, or SQL group-bys with the sqlite backend) aggregates are
+        # computed once per data version and shared; all missing ones are computed together
+        def compute(missing):
+            computed = self._compute_sales_aggregates([key.split(':', 1)[1] for key in missing])
+            return {f"sales:{name}": values for name, values in computed.items()}
+        cached = self.materialized.get_many([f"sales:{name}" for name in names], self.result_version(['sales_transactions.csv']), compute)
+        return {key.split(':', 1)[1]: values for key, values in cached.items()}
+
+    def _compute_sales_aggregates(self, names):
+        if self.backend == 'sqlite':
+            return self.sql_store.sales_aggregates(names)
+        if self.options['workers'] > 1 and self.data_loader.is_csv('sales_transactions.csv'):
+            # Byte ranges of the CSV in parallel (a columnar source is streamed in this process)
+            return parallel_aggregates(
+                self.data_loader.get_file_path('sales_transactions.csv'), names,
+                workers=self.options['workers'],
+                column_types=self.data_loader.SALES_COLUMN_TYPES,
+                chunk_size=self.options['chunk_size'],
+                engine=self.options['engine'],
+                strict=self.data_loader.strict,
+            )
+        return compute_aggregates(self.iter_sales_chunks(), names, self.options['engine'])
+
+    def data_version(self, filenames):
+        """
+        Describes the current state of data files for cache invalidation.
+        Returns:
+            tuple: (source file name, size, mtime_ns) per file, where the source is the CSV or
+                the Parquet/Arrow file read instead; size and mtime are None for a missing file.
+        """
+        version = []
+        for filename in filenames:
+            path = self.data_loader.source(filename)[0]
+            try:
+                fingerprint = file_fingerprint(path, with_hash=False)
+                version.append((os.path.basename(path), fingerprint['size'], fingerprint['mtime_ns']))
+            except OSError:
+                version.append((os.path.basename(path), None, None))
+        return tuple(version)
+
+    def result_version(self, filenames):
+        """
+        Version of cached results derived from data files: their data_version, plus a marker
+        in strict mode so strict runs never reuse results computed without the strict checks.
+        """
+        version = self.data_version(filenames)
+        return version + (('strict',),) if self.data_loader.strict else version
+
+    def get_materialized(self, name, filenames, compute):
+        """
+        Returns a result derived from the given data files, computed with compute() only when
+        it is not cached for the files' current version (see MaterializedAggregates).
+        """
+        with timings.phase(f"cached result {name}"):
+            return self.materialized.get(name, self.result_version(filenames), compute)
+
+    def _running_sales_aggregates(self):
+        file_path = self.data_loader.get_file_path('sales_transactions.csv')
+        return IncrementalAggregates(
+            os.path.join(self.data_loader.snapshot_cache.cache_dir, 'sales_transactions.csv.aggregates.pkl'),
+            file_path,
+            self.data_loader.SALES_COLUMN_TYPES,
+            strict=self.data_loader.strict,
+            chunk_size=self.options['chunk_size'],
+            engine=self.options['engine'],
+            workers=self.options['workers'],
+        )
+
+    def _headers(self, name):
+        if self.backend == 'sqlite':
+            return self.sql_store.headers(name)
+        return list(self._get_table(name)[1])
 
     def get_customer_headers(self):
-        return list(self.customer_headers)
+        return self._headers('customer')
 
     def get_product_headers(self):
-        return list(self.product_headers)
+        return self._headers('product')
 
     def get_sales_headers(self):
-        return list(self.sales_headers)
\ No newline at end of file
+        return self._headers('sales')
+
+    def _key_index(self, name, key):
+        if self.backend == 'sqlite':
+            return self.sql_store.key_index(name, key)
+        return KeyIndex(self._get_table(name)[0], key)
+
+    def _temporal_index(self, name, key):
+        if self.backend == 'sqlite':
+            return self.sql_store.temporal_index(name, key)
+        return TemporalIndex(self._get_table(name)[0], key)
+
+    # Primary-key indexes so services can join without scanning the dimension tables
+    # (with the 'sqlite' backend, lookups through the database's indexes)
+    def get_customer_index(self):
+        """Returns the shared cust_id -> [customer rows] KeyIndex."""
+        return self._get_index('customer_id', lambda: self._key_index('customer', 'cust_id'))
+
+    def get_product_index(self):
+        """Returns the shared product_id -> [product rows] KeyIndex."""
+        return self._get_index('product_id', lambda: self._key_index('product', 'product_id'))
+
+    def get_customer_age_index(self):
+        """Returns the shared cust_age -> [customer rows] KeyIndex, for exact --age filters."""
+        return self._get_index('customer_age', lambda: KeyIndex(self.get_customer_data(), 'cust_age'))
+
+    # Effective-date (SCD2) indexes for "version as of date" lookups
+    def get_customer_temporal_index(self):
+        """Returns the TemporalIndex over customer_dim effective dates."""
+        return self._get_index('customer_temporal', lambda: self._temporal_index('customer', 'cust_id'))
+
+    def get_product_temporal_index(self):
+        """Returns the TemporalIndex over product_dim effective dates."""
+        return self._get_index('product_temporal', lambda: self._temporal_index('product', 'product_id'))
+
+    # Sorted permutation indexes for ordered pages, persisted next to the table's snapshot
+    def get_sort_index(self, table_name, column):
+        """
+        Returns the SortedIndex of a column listed in SORTED_COLUMNS, or None for other
+        columns (and for columns whose values cannot be ordered).
+        """
+        if column not in self.SORTED_COLUMNS.get(table_name, ()):
+            return None
+        def build():
+            table, headers = self._get_table(table_name)
+            if column not in headers:
+                return None
+            filename = self.TABLE_FILES[table_name]
+            columns = self.data_loader.load_derived_columns(filename, f"sort_{column}")
+            if columns is not None:
+                return SortedIndex.from_columns(table, column, columns)
+            index = SortedIndex.build(table, column)
+            if index is not None and table:
+                self.data_loader.store_derived_columns(filename, f"sort_{column}", index.to_columns())
+            return index
+        return self._get_index(f"{table_name}_sort:{column}", build)
+
+    def get_sales_partitions(self):
+        """
+        Returns the MonthPartitions of the in-memory sales rows by order_date, stored next to
+        the sales snapshot so later runs do not rebuild them.
+        """
+        def build():
+            sales_data = self.get_sales_data()
+            columns = self.data_loader.load_derived_columns('sales_transactions.csv', 'month_partitions')
+            if columns is not None:
+                return MonthPartitions.from_columns(sales_data, 'order_date', columns)
+            partitions = MonthPartitions.build(sales_data, 'order_date')
+            if sales_data:
+                self.data_loader.store_derived_columns('sales_transactions.csv', 'month_partitions', partitions.to_columns())
+            return partitions
+        return self._get_index('sales_partitions', build)
+
+    def get_sales_sketches(self):
+        """
+        Returns the SalesSketches of the sales rows (see utils.sketches) for --approx, built in
+        one pass over the sales chunks and cached until sales_transactions.csv or a dimension
+        file changes (customer_dim.csv gives each customer's location, and the sketches are
+        sized for the ids in both dimension files).
+        """
+        def build():
+            customer_index = self.get_customer_index()
+            product_index = self.get_product_index()
+            locations = {} # {cust_id: location}
+            def location_of(cust_id):
+                location = locations.get(cust_id)
+                if location is None:
+                    rows = customer_index.get(cust_id)
+                    location = locations[cust_id] = address_location(rows[0].get('cust_address') if rows else None)
+                return location
+            if self.backend == 'sqlite':
+                # The sales rows are in the database; stream the data file instead of loading it
+                chunks = self.data_loader.iter_sales_chunks(self.options['chunk_size'], self.SALES_SCAN_COLUMNS)
+            else:
+                chunks = self.iter_sales_chunks()
+            sketches = SalesSketches(len(customer_index.keys()), len(product_index.keys()))
+            for chunk in chunks:
+                sketches.update(chunk, location_of)
+            return sketches
+        return self.get_materialized(f"sales:sketches:{SKETCHES_VERSION}",
+                                     ['sales_transactions.csv', 'customer_dim.csv', 'product_dim.csv'], build)
+
+    # Text search index, persisted next to the customer_dim snapshot
+    def get_customer_address_index(self):
+        """Returns the TrigramIndex over lowercased cust_address values."""
+        def build():
+            columns = self.data_loader.load_derived_columns('customer_dim.csv', 'address_trigrams')
+            if columns is not None:
+                return TrigramIndex.from_columns(columns)
+            customer_data = self.get_customer_data()
+            addresses = customer_data.column_values('cust_address') if 'cust_address' in customer_data.headers else []
+            index = TrigramIndex.build(addresses)
+            if customer_data:
+                self.data_loader.store_derived_columns('customer_dim.csv', 'address_trigrams', index.to_columns())
+            return index
+        return self._get_index('customer_address', build)
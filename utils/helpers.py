@@ -1,5 +1,82 @@
 # utils/helpers.py
+import heapq
 from datetime import datetime
+from utils.timings import timings
+from utils.writers import get_writer
+
+def top_k(items, k, key=None, reverse=False):
+    """
+    Returns the first k items of sorted(items, key=key, reverse=reverse).
+
+    When k is small relative to the number of items, a heap selection (O(n log k)) is used
+    instead of a full sort. heapq.nsmallest/nlargest are stable, so ties keep their input
+    order exactly as sorted() does.
+
+    Args:
+        items (iterable): The items to rank.
+        k (int): Number of items to return; None (or a negative value) falls back to
+            slicing a full sort, with the usual slice semantics.
+        key (callable): Sort key, as for sorted().
+        reverse (bool): True for descending order.
+
+    Returns:
+        list: The selected items in sorted order.
+    """
+    items = items if isinstance(items, list) else list(items)
+    if k is None or k < 0 or k * 4 >= len(items): # A full sort is as cheap for large k
+        return sorted(items, key=key, reverse=reverse)[:k]
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    return select(k, items, key=key)
+
+def sort_value(value, order):
+    """
+    Sort key for one value: None sorts last for 'asc' and first for 'desc', so missing values
+    end up after the others either way; other values (numbers, dates, strings) compare as-is.
+    """
+    if value is None:
+        return float('inf') if order == 'asc' else float('-inf')
+    return value
+
+def resolve_selects(selects, available_columns):
+    """
+    Parses a --selects value against the available columns, printing a warning for each
+    problem.
+
+    Args:
+        selects (str): Comma-separated column names.
+        available_columns (collection): The columns the data has.
+
+    Returns:
+        list: The valid columns in the order given, or None when no valid column remains
+        (callers then return all columns).
+    """
+    selected_columns = [col.strip() for col in selects.split(',') if col.strip()] # Split and clean
+    if not selected_columns:
+        print("Warning: No valid columns specified for --selects. Returning all columns.")
+        return None
+
+    valid_selects = []
+    for col in selected_columns:
+        if col in available_columns:
+            valid_selects.append(col)
+        else:
+            print(f"Warning: Selected column '{col}' does not exist in the data.")
+
+    if not valid_selects: # If no valid columns remain after validation
+        print("Warning: No valid selected columns found. Returning original data.")
+        return None
+    return valid_selects
+
+def address_location(address):
+    """
+    Returns the location part of a cust_address: the text after its first comma
+    ('462 Main St, Austin, TX' -> 'Austin, TX'), the whole address if it has no comma,
+    or 'Unknown' if it is missing.
+    """
+    if not address:
+        return 'Unknown'
+    _, _, location = str(address).partition(',')
+    return location.strip() or str(address).strip()
 
 def apply_pagination_and_sorting(data_list, skip=0, limit=None, order=None, order_by=None, selects=None):
     """
@@ -19,6 +96,10 @@ def apply_pagination_and_sorting(data_list, skip=0, limit=None, order=None, orde
     if not data_list:
         return []
 
+    with timings.phase("sort/paginate/select", rows=len(data_list)):
+        return _apply_pagination_and_sorting(data_list, skip, limit, order, order_by, selects)
+
+def _apply_pagination_and_sorting(data_list, skip, limit, order, order_by, selects):
     processed_data = list(data_list) # Work on a copy of the list
 
     # 1. Sorting
@@ -27,16 +108,13 @@ def apply_pagination_and_sorting(data_list, skip=0, limit=None, order=None, orde
         if order_by not in processed_data[0]:
             print(f"Warning: Sorting column '{order_by}' not found. Skipping sort.")
         else:
-            # Custom sort key to handle None values (put None at the end for asc, start for desc)
-            # and ensure proper comparison for different types (numbers, dates, strings)
-            def sort_key_func(item):
-                value = item.get(order_by)
-                if value is None:
-                    # Put None values at the end for ascending, beginning for descending
-                    return (float('inf') if order == 'asc' else float('-inf'))
-                return value
+            sort_key_func = lambda item: sort_value(item.get(order_by), order)
 
-            processed_data.sort(key=sort_key_func, reverse=(order == "desc"))
+            if limit is not None and limit >= 0:
+                # Only the first skip + limit rows survive pagination, so select just those
+                processed_data = top_k(processed_data, max(skip or 0, 0) + limit, key=sort_key_func, reverse=(order == "desc"))
+            else:
+                processed_data.sort(key=sort_key_func, reverse=(order == "desc"))
 
     # 2. Pagination (Skip and Limit)
     if skip is not None and skip > 0:
@@ -47,69 +125,18 @@ def apply_pagination_and_sorting(data_list, skip=0, limit=None, order=None, orde
 
     # 3. Column Selection
     if selects:
-        selected_columns = [col.strip() for col in selects.split(',') if col.strip()] # Split and clean
-        if not selected_columns:
-            print("Warning: No valid columns specified for --selects. Returning all columns.")
-            return processed_data
-
-        # Validate selected columns against the actual keys of the first item
-        available_columns = processed_data[0].keys()
-        valid_selects = []
-        for col in selected_columns:
-            if col in available_columns:
-                valid_selects.append(col)
-            else:
-                print(f"Warning: Selected column '{col}' does not exist in the data.")
-
-        if not valid_selects: # If no valid columns remain after validation
-            print("Warning: No valid selected columns found. Returning original data.")
-            return processed_data
-
-        result = []
-        for item in processed_data:
-            new_item = {col: item.get(col) for col in valid_selects}
-            result.append(new_item)
-        processed_data = result
+        valid_selects = resolve_selects(selects, processed_data[0].keys())
+        if valid_selects:
+            processed_data = [{col: item.get(col) for col in valid_selects} for item in processed_data]
 
     return processed_data
 
-def print_table(data, headers=None):
+def print_table(data, headers=None, output_format='table', out=None):
     """
-    Prints a list of dictionaries as a formatted table.
-    If headers are not provided, it infers them from the first dictionary's keys.
+    Writes rows in the given output format (see utils.writers.FORMATS); 'table' prints them
+    as a formatted table. If headers are not provided, they are inferred from the first row's keys.
+    Rows may be any iterable, including a generator; they are written as they are consumed.
+    Output goes to `out` (default: sys.stdout).
     """
-    if not data:
-        print("No data to display.")
-        return
-
-    if headers is None:
-        # Use keys from the first dictionary as headers if not provided
-        headers = list(data[0].keys())
-
-    # Calculate maximum width for each column
-    column_widths = {header: len(str(header)) for header in headers}
-    for row in data:
-        for header in headers:
-            # Handle cases where a key might be missing in a row (though data should be consistent)
-            value = str(row.get(header, ''))
-            column_widths[header] = max(column_widths[header], len(value))
-
-    # Print header row
-    header_line_parts = []
-    for header in headers:
-        header_line_parts.append(header.ljust(column_widths[header]))
-    print(" | ".join(header_line_parts))
-
-    # Print separator line
-    separator_line_parts = []
-    for header in headers:
-        separator_line_parts.append("-" * column_widths[header])
-    print("-+-".join(separator_line_parts))
-
-    # Print data rows
-    for row in data:
-        row_line_parts = []
-        for header in headers:
-            value = str(row.get(header, '')).ljust(column_widths[header])
-            row_line_parts.append(value)
-        print(" | ".join(row_line_parts))
\ No newline at end of file
+    with timings.phase("print_table") as phase:
+        phase.rows = get_writer(output_format, out).write(data, headers)
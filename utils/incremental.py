@@ -0,0 +1,239 @@
+# utils/incremental.py
+# Append-only ingestion for CSV files that only ever grow at the end (e.g. sales_transactions.csv).
+# A processed prefix of the file is identified by an "append marker": its byte length plus a hash
+# of its content. If the current file still starts with that prefix, only the bytes after it need
+# to be parsed.
+import hashlib
+import os
+import pickle
+from utils.aggregations import AGGREGATES, compute_aggregates, merge_aggregates
+from utils.converters import RowConverter, conversion_error, merge_failures, print_conversion_warnings
+from utils.parallel import iter_byte_range_chunks, parallel_aggregates, split_byte_ranges
+
+STATE_VERSION = 4
+_WINDOW = 1 << 16
+
+
+def append_marker(file_path, offset, block_size=1 << 20):
+    """
+    Identifies the first `offset` bytes of a file by their length and content hash (as
+    snapshot.hash_file for the whole file), and counts their lines so rows after them keep
+    their row numbers.
+    Returns:
+        dict: {'offset': int, 'hash': str, 'lines': int}
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    lines = 0
+    with open(file_path, 'rb') as f:
+        remaining = offset
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            lines += block.count(b'\n')
+            remaining -= len(block)
+    return {'offset': offset, 'hash': digest.hexdigest(), 'lines': lines}
+
+
+def is_appended(file_path, marker, grown=False):
+    """
+    Whether the file still starts with the prefix described by `marker`, i.e. it is unchanged
+    or rows were only appended. The whole prefix is re-hashed, so an edit anywhere in it (even
+    one that keeps the file size) is detected.
+    Args:
+        grown (bool): Also require the file to be longer than the prefix (rows were appended).
+    """
+    if not marker or 'hash' not in marker:
+        return False
+    try:
+        size = os.path.getsize(file_path)
+        if size < marker['offset'] or (grown and size == marker['offset']):
+            return False
+        return append_marker(file_path, marker['offset']) == marker
+    except OSError:
+        return False
+
+
+def complete_lines_end(file_path, size=None):
+    """
+    Returns the offset just past the file's last newline (0 if it has none).
+    Bytes after it are a row that may still be being written.
+    """
+    size = os.path.getsize(file_path) if size is None else size
+    with open(file_path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - _WINDOW)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+class IncrementalAggregates:
+    """
+    Running sales aggregates (every entry of utils.aggregations.AGGREGATES) persisted in a
+    state file together with the append marker and row count of the data they cover.
+    refresh() folds in only the rows appended since the last call, so repeated queries on a
+    growing file cost time proportional to the new rows. If the file was rewritten rather
+    than appended to, the aggregates are rebuilt from scratch.
+    """
+    def __init__(self, state_path, file_path, column_types, chunk_size=100000, engine='python', workers=1, strict=False):
+        """
+        Args:
+            state_path (str): Where the running aggregates are persisted.
+            file_path (str): The CSV file being aggregated.
+            column_types (dict): Column conversions, as for DataLoader._load_csv.
+            chunk_size (int): Rows converted at a time.
+            engine (str): Aggregation engine ('python' or 'numpy').
+            workers (int): Processes used when the whole file has to be (re)aggregated.
+            strict (bool): Raise a ConversionError for values that fail to convert in the
+                rows read (see RowConverter).
+        """
+        self.state_path = state_path
+        self.file_path = file_path
+        self.column_types = column_types
+        self.strict = strict
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.workers = workers
+        self._state = None # Kept after the first refresh, so a long-running process skips reloading it
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            return None
+        if set(state['aggregates']) != set(AGGREGATES):
+            return None
+        return state
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.state_path)
+
+    def _aggregate_range(self, headers, start, end, counter, first_row, state=None):
+        """
+        Aggregates the lines in [start, end), adding the number of rows read to counter[0]
+        and, if a state is given, the values that failed to convert to its 'failures' and
+        'warnings' (as in RowConverter). `first_row` is the row number of the line at `start`.
+        """
+        def counted(chunks):
+            for chunk in chunks:
+                counter[0] += len(chunk)
+                yield chunk
+        convert = RowConverter(headers, self.column_types, os.path.basename(self.file_path), self.strict)
+        chunks = iter_byte_range_chunks(self.file_path, start, end, headers, self.column_types, convert, self.chunk_size, first_row)
+        aggregates = compute_aggregates(counted(chunks), AGGREGATES, self.engine)
+        convert.check()
+        if state is not None:
+            merge_failures(state['failures'], convert.failures)
+            state['warnings'].extend(convert.warnings)
+        return aggregates
+
+    def _rebuild(self, end):
+        """Aggregates every data row before `end` into a fresh state."""
+        headers, ranges = split_byte_ranges(self.file_path, max(self.workers, 1) * 4, end)
+        state = {'version': STATE_VERSION, 'headers': headers, 'data_start': self._data_start(),
+                 'rows': 0, 'marker': None, 'aggregates': compute_aggregates([], AGGREGATES),
+                 'failures': {}, 'warnings': []}
+        if not ranges:
+            return state
+        if self.workers > 1:
+            state['aggregates'] = parallel_aggregates(
+                self.file_path, AGGREGATES, self.workers, self.column_types, self.chunk_size,
+                self.engine, end=end, strict=self.strict, report=state)
+            state['rows'] = self._count_rows(ranges[0][0], end) # Workers only return aggregates
+        else:
+            counter = [0]
+            state['aggregates'] = self._aggregate_range(headers, ranges[0][0], end, counter, first_row=2, state=state)
+            state['rows'] = counter[0]
+        return state
+
+    def _data_start(self):
+        """Offset of the first data row (just past the header line)."""
+        with open(self.file_path, 'rb') as f:
+            f.readline()
+            return f.tell()
+
+    def _count_rows(self, start, end):
+        rows = 0
+        with open(self.file_path, 'rb') as f:
+            f.seek(start)
+            position = start
+            for line in f:
+                if position >= end:
+                    break
+                position += len(line)
+                rows += bool(line.strip())
+        return rows
+
+    def _repeat_warnings(self, state, loaded):
+        """Prints the warnings recorded when the state's rows were aggregated, as a --no-cache run would."""
+        if loaded and not self.strict:
+            print_conversion_warnings(os.path.basename(self.file_path), state['warnings'])
+
+    def refresh(self):
+        """
+        Brings the persisted aggregates up to date with the file and returns them.
+        Returns:
+            dict: {aggregate name: {group key: value}}; empty aggregates if the file is missing.
+        """
+        if not os.path.exists(self.file_path):
+            print(f"Error: Data file not found at {self.file_path}")
+            return compute_aggregates([], AGGREGATES)
+
+        stat = os.stat(self.file_path)
+        size = stat.st_size
+        end = complete_lines_end(self.file_path, size) # A trailing partial row is not persisted
+        loaded = self._state is None # Read from disk in this process: its warnings are repeated once
+        state = self._state or self._load_state()
+        changed = True
+        file_stat = (size, stat.st_mtime_ns)
+        if state is not None and state.get('file_stat') == file_stat and state['marker'] and state['marker']['offset'] == end:
+            changed = False # Untouched since the state was saved: no need to re-hash the file
+            self._repeat_warnings(state, loaded)
+        elif state is not None and is_appended(self.file_path, state['marker']) and state['marker']['offset'] <= end:
+            self._repeat_warnings(state, loaded) # The earlier rows' warnings come first, then the appended ones
+            start = state['marker']['offset']
+            if end > start:
+                counter = [0]
+                merge_aggregates(state['aggregates'], self._aggregate_range(state['headers'], start, end, counter,
+                                                                            state['marker']['lines'] + 1, state))
+                state['rows'] += counter[0]
+            else:
+                state['file_stat'] = file_stat # Only touched: remember it so the next run skips the hash
+        else:
+            state = self._rebuild(end)
+        self._state = state
+        if self.strict and state['failures']:
+            # Failures found by an earlier, non-strict run are still in the aggregates
+            raise conversion_error(os.path.basename(self.file_path), state['failures'])
+
+        if changed and end >= state['data_start']: # Only persist once the header line is complete
+            if not state['marker'] or state['marker']['offset'] != end:
+                state['marker'] = append_marker(self.file_path, end)
+            state['file_stat'] = file_stat
+            try:
+                self._save_state(state)
+            except OSError as e:
+                print(f"Warning: Could not save incremental aggregates to {self.state_path}: {e}")
+
+        aggregates = state['aggregates']
+        if size > max(end, state['data_start']):
+            # The file does not end with a newline: include its last row in this result only
+            marker = state['marker']
+            first_row = marker['lines'] + 1 if marker and end > state['data_start'] else 2
+            aggregates = merge_aggregates({name: dict(values) for name, values in aggregates.items()},
+                                          self._aggregate_range(state['headers'], max(end, state['data_start']), size, [0], first_row))
+        return aggregates
@@ -0,0 +1,133 @@
+# utils/materialized.py
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+
+class MaterializedAggregates:
+    """
+    Cache of computed results (group-by dictionaries and values derived from them), each
+    stored under a name together with the version of the data it was computed from.
+
+    A lookup whose version differs from the stored one is a miss, so results are invalidated
+    automatically when their source files change. Entries are kept in memory (bounded by
+    max_entries, least recently used first out) and, when a cache directory is given, also
+    pickled to disk so later runs can reuse them. On disk, the least recently used files are
+    removed once there are more than max_entries of them or they take more than max_bytes.
+    """
+    def __init__(self, cache_dir=None, max_entries=32, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            cache_dir (str): Directory for persisted entries; None keeps them in memory only.
+            max_entries (int): Maximum number of entries kept (in memory and on disk).
+            max_bytes (int): Maximum total size of the persisted entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # {name: (version, value)}, least recently used first
+
+    def _path(self, name):
+        digest = hashlib.blake2b(name.encode('utf-8'), digest_size=10).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def _load(self, name, version):
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('name') != name or entry.get('version') != version:
+            return None
+        try:
+            os.utime(path) # Marks the entry as recently used for eviction
+        except OSError:
+            pass
+        return entry
+
+    def _store(self, name, version, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'name': name, 'version': version, 'value': value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._evict_files()
+
+    def _evict_files(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.pkl'):
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+                entries.append((stat.st_mtime_ns, stat.st_size, filename))
+        entries.sort() # Least recently used first
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, filename = entries.pop(0)
+            os.remove(os.path.join(self.cache_dir, filename))
+            total -= size
+
+    def _lookup(self, name, version):
+        """Returns (True, result) if `name` is cached for `version`, else (False, None)."""
+        cached = self._entries.get(name)
+        if cached is not None and cached[0] == version:
+            self._entries.move_to_end(name)
+            return True, cached[1]
+        entry = self._load(name, version) if self.cache_dir else None
+        if entry is None:
+            return False, None
+        self._remember(name, version, entry['value'])
+        return True, entry['value']
+
+    def _remember(self, name, version, value):
+        self._entries[name] = (version, value)
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, name, version, value):
+        """Stores a result for `version`, replacing any other version of `name`."""
+        self._remember(name, version, value)
+        if self.cache_dir:
+            try:
+                self._store(name, version, value)
+            except (OSError, pickle.PicklingError) as e:
+                print(f"Warning: Could not persist cached result '{name}': {e}")
+
+    def get(self, name, version, compute):
+        """
+        Returns the result stored under `name` for `version`, computing and storing it on a miss.
+        Args:
+            name (str): Result name, e.g. 'sales:orders_by_customer'.
+            version: Any picklable, comparable description of the source data (e.g. file fingerprints).
+            compute (callable): Builds the result when it is not cached.
+        """
+        found, value = self._lookup(name, version)
+        if not found:
+            value = compute()
+            self.put(name, version, value)
+        return value
+
+    def get_many(self, names, version, compute):
+        """
+        Like get() for several names at once: compute(missing_names) is called a single time
+        for all names that are not cached and must return {name: result}.
+        Returns:
+            dict: {name: result}
+        """
+        results = {}
+        missing = []
+        for name in names:
+            found, value = self._lookup(name, version)
+            if found:
+                results[name] = value
+            else:
+                missing.append(name)
+        if missing:
+            computed = compute(missing)
+            for name in missing:
+                results[name] = computed[name]
+                self.put(name, version, computed[name])
+        return {name: results[name] for name in names}
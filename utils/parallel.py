@@ -0,0 +1,172 @@
+# utils/parallel.py
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from utils.aggregations import compute_aggregates, merge_aggregates
+from utils.converters import RowConverter
+from utils.table import Table
+
+
+def split_byte_ranges(file_path, parts, end=None):
+    """
+    Splits the data rows of a CSV file (those before byte `end`, by default all of them)
+    into up to `parts` contiguous byte ranges.
+    Every boundary is moved forward to the start of a line, so no row is cut in two.
+    This assumes fields contain no embedded newlines, which holds for sales_transactions.csv
+    (ids, quantities and dates only).
+    Returns:
+        tuple: (headers, [(start, end), ...]) with ranges in file order.
+    """
+    size = os.path.getsize(file_path) if end is None else end
+    with open(file_path, 'rb') as f:
+        header_line = f.readline()
+        data_start = f.tell()
+        bounds = [data_start]
+        for i in range(1, parts):
+            target = data_start + (size - data_start) * i // parts
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline() # Skip to the start of the next line
+            position = f.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+        bounds.append(max(size, data_start))
+
+    headers = [h.strip() for h in next(csv.reader([header_line.decode('utf-8')]), [])]
+    ranges = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+    return headers, ranges
+
+
+def iter_byte_range_chunks(file_path, start, end, headers, column_types, convert=None, chunk_size=100000, first_row=None):
+    """
+    Yields Tables of converted rows for the lines in [start, end) of a CSV file.
+    Args:
+        convert (RowConverter): Converts each row; by default a non-strict one for this file.
+            Its failures are left for the caller to check. Once a strict converter has
+            failed, the remaining rows are only converted (to collect their failures), not yielded.
+        first_row (int): Row number (1-based, the header being row 1) of the line at `start`.
+            If given, rows are passed to `convert` with their row number as location instead
+            of their byte offset.
+    """
+    if convert is None:
+        convert = RowConverter(headers, column_types, os.path.basename(file_path), location_kind='byte offset')
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        position = start
+        lines = []
+        row_num = first_row
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            if first_row is None:
+                lines.append((position, line))
+            else:
+                lines.append((row_num, line))
+                row_num += 1
+            position += len(line)
+            if len(lines) >= chunk_size or position >= end:
+                chunk = []
+                for location, line in lines:
+                    row = next(csv.reader([line.decode('utf-8')]), None)
+                    if row: # Skip empty rows
+                        chunk.append(convert(row, location))
+                lines = []
+                if chunk and not convert.failed:
+                    yield Table.from_rows(headers, chunk, column_types)
+
+
+def parse_byte_range(task):
+    """
+    Worker: parses the lines in [start, end) of a CSV file into columns.
+    Returns:
+        tuple: ([(header, column kind, column blocks)], number of records read (empty ones
+        included), [(record index in the range, header, value) for each failed conversion]),
+        or None if a quoted field spans lines, so the range cannot be parsed on its own.
+    """
+    file_path, start, end, headers, column_types = task
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    failures = []
+    convert = RowConverter(headers, column_types, os.path.basename(file_path),
+                           report=lambda header, value, location: failures.append((location, header, value)))
+    reader = csv.reader(io.StringIO(text))
+    rows = []
+    records = 0
+    for row in reader:
+        if row: # Skip empty rows
+            rows.append(convert(row, records))
+        records += 1
+    if reader.line_num != records:
+        return None
+    table = Table.from_rows(headers, rows, column_types)
+    columns = [(header, table.column_kind(header), table.column(header).blocks()) for header in headers]
+    return columns, records, failures
+
+
+def _aggregate_byte_range(task):
+    """
+    Worker: computes partial aggregates for one byte range of the file.
+    Returns:
+        tuple: ({name: {group key: value}}, [(byte offset, header, value) for each failed conversion])
+    """
+    file_path, start, end, headers, column_types, names, chunk_size, engine = task
+    failures = []
+    convert = RowConverter(headers, column_types, os.path.basename(file_path),
+                           report=lambda header, value, location: failures.append((location, header, value)))
+    chunks = iter_byte_range_chunks(file_path, start, end, headers, column_types, convert, chunk_size)
+    return compute_aggregates(chunks, names, engine), failures
+
+
+def parallel_aggregates(file_path, names, workers, column_types=None, chunk_size=100000, engine='python', end=None,
+                        strict=False, report=None):
+    """
+    Map/reduce version of compute_aggregates over a CSV file: the data rows are split into
+    byte ranges, each worker process builds partial group-by dictionaries for its ranges,
+    and the partials are merged in file order so the result is identical to a serial pass.
+    Values that fail to convert are handed back by the workers and warned about (or, in
+    strict mode, raised) here, in file order.
+    Args:
+        file_path (str): Path of the CSV file.
+        names (iterable): Aggregate names (see utils.aggregations.AGGREGATES).
+        workers (int): Number of worker processes.
+        column_types (dict): Column conversions, as for DataLoader._load_csv.
+        chunk_size (int): Rows converted at a time inside each worker.
+        engine (str): Aggregation engine used by each worker ('python' or 'numpy').
+        end (int): Only aggregate the rows before this byte offset (default: the whole file).
+        strict (bool): Raise a ConversionError for values that fail to convert (see RowConverter).
+        report (dict): If given, receives the conversion 'failures' and 'warnings' (as in
+            RowConverter.failures and RowConverter.warnings).
+    Returns:
+        dict: {name: {group key: value}}
+    """
+    names = list(dict.fromkeys(names))
+    if not os.path.exists(file_path):
+        print(f"Error: Data file not found at {file_path}")
+        return compute_aggregates([], names)
+
+    # A few ranges per worker evens out skew between ranges
+    headers, ranges = split_byte_ranges(file_path, workers * 4, end)
+    tasks = [
+        (file_path, start, end, headers, column_types, names, chunk_size, engine)
+        for start, end in ranges
+    ]
+
+    result = compute_aggregates([], names)
+    convert = RowConverter(headers, column_types, os.path.basename(file_path), strict, location_kind='byte offset')
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial, failures in executor.map(_aggregate_byte_range, tasks):
+                merge_aggregates(result, partial)
+                for location, header, value in failures:
+                    convert.record_failure(header, value, f"byte offset {location}")
+    convert.check()
+    if report is not None:
+        report['failures'] = convert.failures
+        report['warnings'] = convert.warnings
+    return result
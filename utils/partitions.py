@@ -0,0 +1,189 @@
+# utils/partitions.py
+# Year/month partitioning of dated rows (sales by order_date), so queries over a date window
+# read only the months it overlaps instead of every row.
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from itertools import chain
+from utils.converters import parse_date
+from utils.table import NULL_DATE, IntColumn
+
+
+def month_key(ordinal):
+    """Partition key of a date ordinal: months since year 0 (year * 12 + month - 1)."""
+    day = date.fromordinal(ordinal)
+    return day.year * 12 + day.month - 1
+
+
+def month_start_ordinal(day, months_after=0):
+    """Returns the ordinal of the first day of the month `months_after` months after the month of `day`."""
+    key = day.year * 12 + day.month - 1 + months_after
+    return date(key // 12, key % 12 + 1, 1).toordinal()
+
+
+def date_ordinals(table, column):
+    """
+    Returns the date ordinal of each row of `column` (NULL_DATE where it is missing or is not
+    a date, e.g. text that failed to convert).
+    """
+    if column not in table.headers:
+        return array('q')
+    values = table.column(column)
+    if values.kind == 'date':
+        return values.data
+    return array('q', [value.toordinal() if hasattr(value, 'toordinal') else NULL_DATE for value in values.to_list()])
+
+
+class DateWindow:
+    """
+    Inclusive range of dates, either end of which may be open, optionally limited to some
+    months of the year (e.g. the months of --quarters 1 2 in every year of the range).
+    Rows without a date are outside every window.
+    """
+    def __init__(self, start=None, end=None, months=None):
+        """
+        Args:
+            start (datetime): First date in the window, or None for no lower bound.
+            end (datetime): Last date in the window, or None for no upper bound.
+            months (iterable): Months of the year (1-12) to keep, or None for all.
+        """
+        self.start = start
+        self.end = end
+        self.months = frozenset(months) if months is not None else None
+        self.first_ordinal = start.toordinal() if start else 1
+        self.last_ordinal = end.toordinal() if end else date.max.toordinal()
+
+    @classmethod
+    def parse(cls, start=None, end=None, months=None):
+        """
+        Builds the window of --from/--to values ('YYYY-MM-DD' strings), or returns None when
+        neither is given.
+        Raises:
+            ValueError: If a date is not valid.
+        """
+        if not start and not end:
+            return None
+        bounds = []
+        for value in (start, end):
+            try:
+                bounds.append(parse_date(value.strip()) if value else None)
+            except ValueError:
+                raise ValueError(f"Invalid date '{value}' for --from/--to. Expected YYYY-MM-DD.") from None
+        return cls(bounds[0], bounds[1], months)
+
+    def key(self):
+        """Text identifying the window, for cache keys (e.g. '2021-01-01..2021-03-31')."""
+        text = f"{self.start.date() if self.start else ''}..{self.end.date() if self.end else ''}"
+        if self.months is not None:
+            text += f" months {','.join(map(str, sorted(self.months)))}"
+        return text
+
+    def month_range(self):
+        """
+        Returns the first and last (year, month) of a window made of whole months (None for an
+        open end), e.g. for sketches kept per month.
+        Raises:
+            ValueError: If the window starts or ends within a month, or keeps only some months.
+        """
+        if self.months is not None:
+            raise ValueError("The window keeps only some months of the year.")
+        if self.start and self.start.day != 1:
+            raise ValueError(f"The window starts within a month ({self.start.date()}).")
+        if self.end and (self.end.toordinal() + 1) != month_start_ordinal(self.end, 1):
+            raise ValueError(f"The window ends within a month ({self.end.date()}).")
+        return ((self.start.year, self.start.month) if self.start else None,
+                (self.end.year, self.end.month) if self.end else None)
+
+    def positions(self, table, column):
+        """
+        Returns the positions of the rows of `table` whose `column` date is in the window, in
+        file order, by checking every row (MonthPartitions.positions avoids that for a whole table).
+        """
+        first, last, months = self.first_ordinal, self.last_ordinal, self.months
+        inside = {} # Dates repeat heavily, so each distinct ordinal is checked once
+        positions = []
+        for position, ordinal in enumerate(date_ordinals(table, column)):
+            keep = inside.get(ordinal)
+            if keep is None:
+                keep = inside[ordinal] = (ordinal != NULL_DATE and first <= ordinal <= last
+                                          and (months is None or date.fromordinal(ordinal).month in months))
+            if keep:
+                positions.append(position)
+        return positions
+
+
+class MonthPartitions:
+    """
+    The rows of a table partitioned by the year and month of a date column: one partition
+    per month, holding the positions of its rows in file order.
+
+    A DateWindow then reads only the partitions of the months it overlaps (and that its
+    months allow), checking row dates only in its first and last month, so a one-quarter
+    query over several years of sales touches about that quarter's rows.
+    """
+    def __init__(self, ordinals, months, offsets, positions):
+        """
+        Use build() or from_columns() instead of calling this directly.
+        Args:
+            ordinals (sequence): Date ordinal of each row of the table (see date_ordinals).
+            months (sequence): Sorted partition keys (year * 12 + month - 1).
+            offsets (sequence): Start of each partition in `positions`, plus its length at the end.
+            positions (sequence): Row positions grouped by partition, in file order within each.
+        """
+        self._ordinals = ordinals
+        self._months = months
+        self._offsets = offsets
+        self._positions = positions
+
+    @classmethod
+    def build(cls, table, column):
+        """Partitions the rows of `table` by the month of `column` (rows without a date are left out)."""
+        ordinals = date_ordinals(table, column)
+        keys = {} # {ordinal: partition key}, for each distinct date
+        partitions = {} # {partition key: [positions]}
+        for position, ordinal in enumerate(ordinals):
+            if ordinal == NULL_DATE:
+                continue
+            key = keys.get(ordinal)
+            if key is None:
+                key = keys[ordinal] = month_key(ordinal)
+            rows = partitions.get(key)
+            if rows is None:
+                partitions[key] = [position]
+            else:
+                rows.append(position)
+        months = array('q', sorted(partitions))
+        offsets = array('q', [0])
+        positions = array('q')
+        for key in months:
+            positions.extend(partitions[key])
+            offsets.append(len(positions))
+        return cls(ordinals, months, offsets, positions)
+
+    @classmethod
+    def from_columns(cls, table, column, columns):
+        """Rebuilds partitions from the columns returned by to_columns() (e.g. read from a snapshot)."""
+        return cls(date_ordinals(table, column), columns['months'].data, columns['offsets'].data, columns['positions'].data)
+
+    def to_columns(self):
+        """Returns the partitions as {name: column} so they can be stored next to the table's snapshot."""
+        return {'months': IntColumn(self._months), 'offsets': IntColumn(self._offsets), 'positions': IntColumn(self._positions)}
+
+    def __len__(self):
+        return len(self._months)
+
+    def positions(self, window):
+        """Returns the positions of the rows whose date is in `window`, in file order."""
+        first, last = window.first_ordinal, window.last_ordinal
+        low, high = month_key(first), month_key(last)
+        months, offsets, ordinals = self._months, self._offsets, self._ordinals
+        runs = []
+        for i in range(bisect_left(months, low), bisect_right(months, high)):
+            key = months[i]
+            if window.months is not None and key % 12 + 1 not in window.months:
+                continue
+            run = self._positions[offsets[i]:offsets[i + 1]]
+            if key == low or key == high: # The window may start or end within this month
+                run = [position for position in run.tolist() if first <= ordinals[position] <= last]
+            runs.append(run)
+        return sorted(chain.from_iterable(runs)) # Partitions are in date order; rows go back to file order
@@ -0,0 +1,166 @@
+# utils/query.py
+# A small query plan over a Table: filters are pushed into the scan as row positions, the
+# most selective filter drives it, --selects columns are read only for the rows returned,
+# and without an ordering the scan stops as soon as skip + limit rows have been found.
+from itertools import islice
+from utils.helpers import resolve_selects, sort_value, top_k
+from utils.timings import timings
+
+SET_FRACTION = 4 # Check the other filters through position sets when over 1/SET_FRACTION of the rows are candidates
+
+
+class EqualsFilter:
+    """Rows whose `column` equals `value`, looked up in a KeyIndex on that column."""
+    def __init__(self, table, column, index, value):
+        self._values = table.column(column) if column in table.headers else None
+        self._index = index
+        self._value = value
+
+    def estimate(self):
+        return len(self._index.positions(self._value)) # Exact
+
+    def positions(self):
+        return self._index.positions(self._value)
+
+    def matches(self, position):
+        return self._values is not None and self._values[position] == self._value
+
+
+class ContainsFilter:
+    """Rows whose text contains `query` (case-insensitive), through a TrigramIndex."""
+    def __init__(self, index, query):
+        self._index = index
+        self._query = query.lower()
+
+    def estimate(self):
+        return self._index.estimate(self._query)
+
+    def positions(self):
+        return self._index.search(self._query)
+
+    def matches(self, position):
+        return self._index.contains(position, self._query)
+
+
+class AsOfFilter:
+    """Rows of an SCD2 dimension in effect on a date, through a TemporalIndex."""
+    def __init__(self, index, when):
+        self._index = index
+        self._when = when
+        self._positions = None
+        self._position_set = None
+
+    def estimate(self):
+        return self._index.key_count() # About one version per key is in effect on any date
+
+    def positions(self):
+        if self._positions is None:
+            self._positions = self._index.positions_as_of(self._when)
+        return self._positions
+
+    def matches(self, position):
+        if self._position_set is None:
+            self._position_set = set(self.positions())
+        return position in self._position_set
+
+
+class QueryPlan:
+    """
+    Filters, orders, paginates and projects the rows of a Table, producing the same results
+    as apply_pagination_and_sorting over the fully filtered rows.
+
+    The filter with the smallest estimate supplies the candidate positions (in file order);
+    the others are checked per candidate, most selective first. Filters are objects with
+    estimate() (an upper bound on matching rows), positions() (sorted matching positions)
+    and matches(position), such as EqualsFilter, ContainsFilter and AsOfFilter.
+
+    Ordered pages over a column with a SortedIndex walk the index instead of sorting, when
+    most rows match: the walk stops after skip + limit matching rows.
+    """
+    def __init__(self, table, filters=(), positions=None, sort_index=None):
+        """
+        Args:
+            table (Table): The table to query.
+            filters (iterable): Filters every returned row must match.
+            positions (list): Candidate positions in output order; all rows in file order if None.
+            sort_index (callable): Returns the SortedIndex of a column, or None if it has none
+                (e.g. DataStore.get_sort_index bound to a table).
+        """
+        self.table = table
+        self.filters = list(filters)
+        self.positions = positions
+        self.sort_index = sort_index
+
+    def _matching_positions(self):
+        """Returns an iterator over the matching positions, in candidate order."""
+        filters = sorted(self.filters, key=lambda query_filter: query_filter.estimate())
+        if self.positions is not None:
+            candidates = self.positions
+        elif filters:
+            candidates = filters.pop(0).positions()
+        else:
+            candidates = range(len(self.table))
+        if not filters:
+            return iter(candidates)
+        if len(candidates) * SET_FRACTION > len(self.table):
+            # With this many candidates, one index lookup per filter is cheaper than row-by-row checks
+            checks = [set(query_filter.positions()).__contains__ for query_filter in filters]
+        else:
+            checks = [query_filter.matches for query_filter in filters]
+        return (position for position in candidates if all(check(position) for check in checks))
+
+    def execute(self, skip=0, limit=None, order=None, order_by=None, selects=None):
+        """
+        Runs the plan; the arguments mean the same as for apply_pagination_and_sorting.
+        Returns:
+            list: Row views, or dictionaries of the selected columns when `selects` is given.
+        """
+        with timings.phase("query plan") as phase:
+            result = self._execute(skip, limit, order, order_by, selects)
+            phase.rows = len(result)
+        return result
+
+    def _execute(self, skip, limit, order, order_by, selects):
+        matching = self._matching_positions()
+        skip = skip if skip is not None and skip > 0 else 0
+        limit = limit if limit is not None and limit >= 0 else None
+
+        page_end = None if limit is None else skip + limit
+        if order_by and order and order_by not in self.table.headers:
+            positions = list(matching)
+            if positions:
+                print(f"Warning: Sorting column '{order_by}' not found. Skipping sort.")
+            positions = positions[skip:page_end]
+        elif order_by and order:
+            index = self.sort_index(order_by) if self.sort_index and self.positions is None else None
+            if index is not None and not self.filters:
+                # Rows come out of the index already ordered; stop at the end of the page
+                positions = list(islice(index.walk(order), skip, page_end))
+            else:
+                positions = list(matching)
+                if index is not None and limit is not None and len(positions) * SET_FRACTION > len(self.table):
+                    # Most rows match, so walking the index to the end of the page beats sorting them
+                    matching_set = set(positions)
+                    positions = list(islice((position for position in index.walk(order) if position in matching_set), skip, page_end))
+                else:
+                    values = self.table.column(order_by)
+                    sort_key = lambda position: sort_value(values[position], order)
+                    if limit is not None:
+                        # Only the first skip + limit rows survive pagination, so select just those
+                        positions = top_k(positions, page_end, key=sort_key, reverse=(order == "desc"))
+                    else:
+                        positions.sort(key=sort_key, reverse=(order == "desc"))
+                    positions = positions[skip:page_end]
+        else:
+            # No ordering: stop scanning once the requested page is complete
+            positions = list(islice(matching, skip, page_end))
+
+        if not positions:
+            return []
+        if selects:
+            columns = resolve_selects(selects, self.table.headers)
+            if columns:
+                # Read only the selected columns, and only for the returned rows
+                column_values = [(column, self.table.column(column)) for column in columns]
+                return [{column: values[position] for column, values in column_values} for position in positions]
+        return self.table.rows_at(positions)
@@ -0,0 +1,175 @@
+# utils/server.py
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Response frames: 1-byte channel + 4-byte big-endian payload length + payload.
+# 'o' and 'e' carry stdout/stderr text as it is produced, 'x' carries the exit code and ends the response.
+_FRAME_HEADER = struct.Struct('>cI')
+STDOUT, STDERR, EXIT = b'o', b'e', b'x'
+
+
+class _FrameWriter:
+    """
+    File-like object that forwards text written by a command (on the executor thread) to the
+    client as frames. Writes are buffered up to buffer_size characters and handed to the event
+    loop thread, so output streams to the client while the command is still running.
+    """
+    def __init__(self, loop, writer, channel, buffer_size=65536):
+        self._loop = loop
+        self._writer = writer
+        self._channel = channel
+        self._buffer_size = buffer_size
+        self._parts = []
+        self._buffered = 0
+
+    def write(self, text):
+        if text:
+            self._parts.append(text)
+            self._buffered += len(text)
+            if self._buffered >= self._buffer_size:
+                self.flush()
+        return len(text)
+
+    def flush(self):
+        if not self._parts:
+            return
+        payload = ''.join(self._parts).encode('utf-8')
+        self._parts = []
+        self._buffered = 0
+        self._loop.call_soon_threadsafe(self._writer.write, _FRAME_HEADER.pack(self._channel, len(payload)) + payload)
+
+
+class QueryServer:
+    """
+    Serves CLI commands over a Unix domain socket from one warm process, so the DataStore
+    and its indexes are loaded once instead of on every invocation.
+    Clients send one JSON line {"argv": [...]} with the same arguments main.py accepts;
+    asyncio handles many connections concurrently while commands run one at a time on a
+    worker thread (the DataStore is not thread-safe).
+    """
+    def __init__(self, socket_path, create_parser, dispatch):
+        """
+        Args:
+            socket_path (str): Filesystem path of the Unix socket.
+            create_parser (callable): Returns the CLI's argparse parser.
+            dispatch (callable): Runs parsed arguments, printing results to stdout.
+        """
+        self.socket_path = socket_path
+        self.create_parser = create_parser
+        self.dispatch = dispatch
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _execute(self, argv, stdout, stderr):
+        """Parses and runs one command with its output redirected to the client. Returns the exit code."""
+        try:
+            return self._run_command(argv, stdout, stderr)
+        finally:
+            stdout.flush()
+            stderr.flush()
+
+    def _run_command(self, argv, stdout, stderr):
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                args = self.create_parser().parse_args(argv)
+            except SystemExit as e: # argparse reports usage errors (and --help) by exiting
+                return e.code if isinstance(e.code, int) else 2
+            if args.command in ('serve', 'batch'):
+                print(f"Error: '{args.command}' cannot be run through the query server.", file=sys.stderr)
+                return 2
+            try:
+                self.dispatch(args)
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}", file=sys.stderr)
+                return 1
+        return 0
+
+    async def _handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            request = json.loads(await reader.readline())
+            argv = [str(arg) for arg in request['argv']]
+        except (ValueError, KeyError, TypeError):
+            argv = None
+
+        if argv is None:
+            message = b"Error: expected a JSON line with an 'argv' list.\n"
+            writer.write(_FRAME_HEADER.pack(STDERR, len(message)) + message)
+            exit_code = 2
+        else:
+            stdout = _FrameWriter(loop, writer, STDOUT)
+            stderr = _FrameWriter(loop, writer, STDERR)
+            exit_code = await loop.run_in_executor(self._executor, self._execute, argv, stdout, stderr)
+
+        payload = str(exit_code).encode('ascii')
+        writer.write(_FRAME_HEADER.pack(EXIT, len(payload)) + payload)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path) # Left behind by a server that is no longer running
+        else:
+            raise RuntimeError(f"A query server is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    async def serve_forever(self):
+        self._remove_stale_socket()
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        print(f"Query server listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            print("Query server stopped.")
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        block = sock.recv(size - len(data))
+        if not block:
+            raise ConnectionError("query server closed the connection")
+        data += block
+    return data
+
+
+def run_client(socket_path, argv, stdout=None, stderr=None):
+    """
+    Forwards argv to a running query server and streams its output.
+    Returns:
+        int: The command's exit code.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'argv': list(argv)}).encode('utf-8') + b'\n')
+        while True:
+            channel, length = _FRAME_HEADER.unpack(_recv_exactly(sock, _FRAME_HEADER.size))
+            payload = _recv_exactly(sock, length).decode('utf-8')
+            if channel == EXIT:
+                return int(payload)
+            (stdout if channel == STDOUT else stderr).write(payload)
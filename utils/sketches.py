@@ -0,0 +1,428 @@
+# utils/sketches.py
+# Streaming sketches for approximate analytics (--approx) over sales tables too large to
+# aggregate exactly: Count-Min for per-key totals, Space-Saving for heavy hitters and
+# HyperLogLog for distinct counts. Each uses memory fixed when it is created, sized for the
+# number of distinct keys expected (e.g. the ids in the dimension tables), and sketches of
+# different slices of the data (months, files, byte ranges) merge into the sketch of their union.
+import hashlib
+import math
+from array import array
+from collections import Counter
+from functools import lru_cache
+from heapq import heapify, heappop, heappush
+from operator import add
+from utils.partitions import month_key, date_ordinals
+from utils.table import NULL_DATE
+
+# Count-Min: an estimate exceeds the true total by at most e / width of the sketch's total, except
+# with probability exp(-depth) (about 2%). Merging adds counters, so a merged sketch equals the
+# sketch of the union and the bound holds for any range of merged months, with that range's total.
+CMS_MIN_WIDTH = 2048 # Counters per row for small key sets...
+CMS_WIDTH_PER_KEY = 8 # ...otherwise the power of two >= this many per expected key (bound <= e/8 of the mean total)
+CMS_DEPTH = 4
+# Space-Saving: count - error <= true total <= count for monitored keys. A summary that never
+# fills is exact (error 0); merging adds each side's minimum() to keys missing on that side, so a
+# merged summary's errors are at most the sum of the merged summaries' minimums (0 while none fill).
+SPACE_SAVING_MIN_CAPACITY = 1000 # Keys monitored per summary, at least...
+SPACE_SAVING_HEADROOM = 1.25 # ...this many per expected key, so summaries do not fill
+MAX_ERROR_SHARE = 0.5 # --approx answers with an error_bound above this share of an estimate are computed exactly
+HLL_PRECISION = 12 # 2 ** 12 registers: about 1.6% relative standard error
+HASH_CACHE_SIZE = 1 << 16 # Distinct keys whose hash is remembered
+SKETCHES_VERSION = 2 # Part of the cached SalesSketches' name; bump when their layout changes
+
+_MASK64 = (1 << 64) - 1
+
+
+def cms_width(keys):
+    """Count-Min width for about `keys` distinct keys (a power of two, at least CMS_MIN_WIDTH)."""
+    return max(CMS_MIN_WIDTH, 1 << math.ceil(math.log2(max(keys, 1) * CMS_WIDTH_PER_KEY)))
+
+
+def space_saving_capacity(keys):
+    """Space-Saving capacity for about `keys` distinct keys."""
+    return max(SPACE_SAVING_MIN_CAPACITY, math.ceil(keys * SPACE_SAVING_HEADROOM))
+
+
+@lru_cache(maxsize=HASH_CACHE_SIZE)
+def stable_hash(key):
+    """
+    64-bit hash of a key that is the same in every process and run (unlike hash() of
+    strings), so persisted sketches stay valid. Integers are mixed with splitmix64.
+    """
+    if isinstance(key, int) and not isinstance(key, bool):
+        x = (key + 0x9E3779B97F4A7C15) & _MASK64
+        x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+        return x ^ (x >> 31)
+    return int.from_bytes(hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+@lru_cache(maxsize=HASH_CACHE_SIZE)
+def _cms_cells(key, width, depth):
+    """Counter positions of a key in a Count-Min sketch, one per row."""
+    # Double hashing: row i uses h1 + i * h2, from the two halves of one 64-bit hash
+    h = stable_hash(key)
+    h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+    return tuple(row * width + (h1 + row * h2) % width for row in range(depth))
+
+
+class CountMinSketch:
+    """
+    Approximate per-key totals in depth * width counters. An estimate never undercounts, and
+    with probability 1 - exp(-depth) it overcounts by at most error_bound (e / width of the
+    sketch's total).
+    """
+    def __init__(self, width=CMS_MIN_WIDTH, depth=CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = array('q', bytes(8 * width * depth))
+        self.total = 0
+
+    def add(self, key, count=1):
+        counters = self.counters
+        for cell in _cms_cells(key, self.width, self.depth):
+            counters[cell] += count
+        self.total += count
+
+    def estimate(self, key):
+        counters = self.counters
+        return min(counters[cell] for cell in _cms_cells(key, self.width, self.depth))
+
+    @property
+    def error_bound(self):
+        return math.ceil(math.e / self.width * self.total)
+
+    @property
+    def confidence(self):
+        return 1 - math.exp(-self.depth)
+
+    def merge(self, *others):
+        """Adds the counts of other sketches of the same shape (in place), in one pass over the counters."""
+        if any((other.width, other.depth) != (self.width, self.depth) for other in others):
+            raise ValueError("Cannot merge Count-Min sketches of different shapes.")
+        if len(others) == 1:
+            self.counters = array('q', map(add, self.counters, others[0].counters))
+        elif others:
+            self.counters = array('q', map(sum, zip(self.counters, *(other.counters for other in others))))
+        self.total += sum(other.total for other in others)
+        return self
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters: monitors at most `capacity` keys. When a new key arrives and
+    the summary is full, it replaces the key with the smallest count and inherits that count
+    as its error. For every monitored key, count - error <= true total <= count, and any key
+    whose total exceeds total / capacity is monitored. Until it is full the counts are exact.
+    """
+    def __init__(self, capacity=SPACE_SAVING_MIN_CAPACITY):
+        self.capacity = capacity
+        self.counts = {} # {key: count}
+        self.errors = {} # {key: maximum overcount}
+        self.total = 0
+        self.evicted = 0 # Keys dropped to make room (0: every key seen is monitored)
+        self._heap = [] # (count, sequence, key) entries; stale ones are skipped when popped
+        self._sequence = 0 # Tie-breaker, so keys of different types are never compared
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_heap'] = [] # Rebuilt from counts when needed
+        return state
+
+    def _push(self, key, count):
+        self._sequence += 1
+        heappush(self._heap, (count, self._sequence, key))
+
+    def _pop_min(self):
+        if len(self._heap) > 4 * self.capacity or not self._heap: # Drop stale entries
+            self._heap = [(count, i, key) for i, (key, count) in enumerate(self.counts.items())]
+            heapify(self._heap)
+            self._sequence = len(self._heap)
+        while True:
+            count, _, key = heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
+
+    def add(self, key, count=1):
+        self.total += count
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            evicted, minimum = self._pop_min()
+            del counts[evicted]
+            del self.errors[evicted]
+            self.evicted += 1
+            counts[key] = minimum + count
+            self.errors[key] = minimum
+        self._push(key, counts[key])
+
+    def minimum(self):
+        """Upper bound on the total of any key that is not monitored."""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def bounds(self, key):
+        """Returns (upper, lower) bounds on the total of a key (exact while nothing was evicted)."""
+        count = self.counts.get(key)
+        if count is None:
+            return (self.minimum() if self.evicted else 0), 0
+        return count, count - self.errors[key]
+
+    def top(self, k=None):
+        """Returns up to k (key, count, error) triples, highest counts first (ties in insertion order)."""
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+    def merge(self, other):
+        """
+        Combines another summary into this one (in place). Keys monitored by only one side
+        are counted with the other side's minimum as both count and error, which keeps the
+        count - error <= total <= count guarantee; the `capacity` highest counts are kept.
+        """
+        own_minimum, other_minimum = self.minimum(), other.minimum()
+        counts, errors = {}, {}
+        for key in dict.fromkeys([*self.counts, *other.counts]):
+            counts[key] = self.counts.get(key, own_minimum) + other.counts.get(key, other_minimum)
+            errors[key] = self.errors.get(key, own_minimum) + other.errors.get(key, other_minimum)
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.evicted += other.evicted + len(counts) - len(kept)
+        self.counts = {key: counts[key] for key in kept}
+        self.errors = {key: errors[key] for key in kept}
+        self.total += other.total
+        self._heap = []
+        return self
+
+
+@lru_cache(maxsize=None)
+def _high_bits(size):
+    """Integer whose `size` little-endian bytes are all 0x80."""
+    return int.from_bytes(b'\x80' * size, 'little')
+
+
+class HyperLogLog:
+    """
+    Approximate distinct count in 2 ** precision one-byte registers, with a relative standard
+    error of about 1.04 / sqrt(2 ** precision).
+    """
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key):
+        h = stable_hash(key)
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1 # Position of the first 1 bit
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros: # Small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def merge(self, *others):
+        """Takes the union with other sketches of the same precision (in place)."""
+        if any(other.precision != self.precision for other in others):
+            raise ValueError("Cannot merge HyperLogLog sketches of different precisions.")
+        # Register-wise max on the registers as one integer: ranks are below 128, so the high
+        # bit of each byte of (a | 0x80..) - b is set exactly where a's register is >= b's
+        size = len(self.registers)
+        high = _high_bits(size)
+        merged = int.from_bytes(self.registers, 'little')
+        for other in others:
+            registers = int.from_bytes(other.registers, 'little')
+            keep = ((((merged | high) - registers) & high) >> 7) * 0xFF
+            merged = (merged & keep) | (registers & ~keep)
+        self.registers = bytearray(merged.to_bytes(size, 'little'))
+        return self
+
+
+def estimate_total(key, totals, heavy_hitters):
+    """
+    Estimates the total of a key from a Count-Min sketch and a Space-Saving summary of the
+    same rows.
+    Returns:
+        tuple: (estimate, error_bound). The estimate is never below the true total, which is
+            at least estimate - error_bound: certainly for keys the summary monitors (or when
+            it never filled), otherwise with the Count-Min confidence.
+    """
+    upper, lower = heavy_hitters.bounds(key)
+    estimate = min(upper, totals.estimate(key))
+    if key not in heavy_hitters.counts and heavy_hitters.evicted:
+        lower = max(lower, estimate - totals.error_bound)
+    return estimate, estimate - lower
+
+
+def too_uncertain(error_bounds, estimates):
+    """True if any error bound is more than MAX_ERROR_SHARE of its (nonzero) estimate."""
+    return any(error_bounds[key] > MAX_ERROR_SHARE * estimate for key, estimate in estimates)
+
+
+class SketchSet:
+    """
+    The sketches of one slice of the sales rows (e.g. one month), sized for about `customers`
+    and `products` distinct keys. Per-customer totals and locations are only kept with
+    customer_totals (the all-time set); every set keeps product totals and distinct customers.
+    """
+    def __init__(self, customers=0, products=0, customer_totals=True):
+        self.rows = 0
+        self.quantity_by_product = CountMinSketch(cms_width(products)) # product_id -> total quantity
+        self.top_products = SpaceSaving(space_saving_capacity(products)) # Products with the highest quantity
+        self.customers = HyperLogLog() # Distinct customers with orders
+        self.orders_by_customer = CountMinSketch(cms_width(customers)) if customer_totals else None # cust_id -> order count
+        self.top_customers = SpaceSaving(space_saving_capacity(customers)) if customer_totals else None # Customers with the most orders
+        self.customers_by_location = {} # {location: HyperLogLog}, with customer_totals
+
+    def add_orders(self, counts, location_of):
+        """Adds {cust_id: order count}; location_of(cust_id) gives the location (see address_location)."""
+        add_customer = self.customers.add
+        if self.orders_by_customer is None:
+            for cust_id in counts:
+                add_customer(cust_id)
+            return
+        by_location = self.customers_by_location
+        add_count, add_top = self.orders_by_customer.add, self.top_customers.add
+        for cust_id, count in counts.items():
+            add_count(cust_id, count)
+            add_top(cust_id, count)
+            add_customer(cust_id)
+            location = location_of(cust_id)
+            location_sketch = by_location.get(location)
+            if location_sketch is None:
+                location_sketch = by_location[location] = HyperLogLog()
+            location_sketch.add(cust_id)
+
+    def add_quantities(self, totals):
+        """Adds {product_id: quantity}."""
+        add_quantity, add_top = self.quantity_by_product.add, self.top_products.add
+        for product_id, quantity in totals.items():
+            add_quantity(product_id, quantity)
+            add_top(product_id, quantity)
+
+    def merge(self, *others):
+        """Combines other SketchSets of the same sizes into this one (in place)."""
+        self.rows += sum(other.rows for other in others)
+        self.quantity_by_product.merge(*(other.quantity_by_product for other in others))
+        self.customers.merge(*(other.customers for other in others))
+        if self.orders_by_customer is not None:
+            self.orders_by_customer.merge(*(other.orders_by_customer for other in others))
+        locations = {}
+        for other in others:
+            self.top_products.merge(other.top_products)
+            if self.top_customers is not None:
+                self.top_customers.merge(other.top_customers)
+            for location, sketch in other.customers_by_location.items():
+                locations.setdefault(location, []).append(sketch)
+        for location, sketches in locations.items():
+            self.customers_by_location.setdefault(location, HyperLogLog()).merge(*sketches)
+        return self
+
+
+class SalesSketches:
+    """
+    Sketches of sales rows: one all-time SketchSet updated on the whole stream, plus product
+    totals and distinct customers per year/month of order_date (the partitions of
+    MonthPartitions; rows without a date go to a partition of their own), so any range of
+    whole months is answered by merging its partitions. Sketches built separately with the
+    same sizes (e.g. for other files or byte ranges of one file) are combined with merge().
+    """
+    def __init__(self, customers=0, products=0):
+        """
+        Args:
+            customers (int): Distinct customers expected (e.g. the cust_ids in customer_dim).
+            products (int): Distinct products expected (e.g. the product_ids in product_dim).
+        """
+        self.customers = customers
+        self.products = products
+        self.overall = SketchSet(customers, products)
+        self.partitions = {} # {month key (year * 12 + month - 1) or None: SketchSet without customer totals}
+
+    def update(self, chunk, location_of):
+        """
+        Adds a Table chunk of sales rows.
+        Args:
+            chunk (Table): Sales rows with cust_id, product_id, product_quantity and order_date.
+            location_of (callable): Returns the location of a cust_id (see address_location).
+        """
+        month_keys = {NULL_DATE: None}
+        months = []
+        for ordinal in date_ordinals(chunk, 'order_date'):
+            month = month_keys.get(ordinal)
+            if month is None and ordinal not in month_keys:
+                month = month_keys[ordinal] = month_key(ordinal)
+            months.append(month)
+        if len(months) != len(chunk): # No order_date column
+            months = [None] * len(chunk)
+        for month, rows in Counter(months).items():
+            self._partition(month).rows += rows
+        self.overall.rows += len(chunk)
+
+        # Fold each chunk's (month, key) totals into the sketches once per distinct pair. The
+        # all-time totals keep first-seen key order, so exact summaries break ties like the
+        # exact aggregates
+        cust_ids = chunk.column_values('cust_id')
+        orders = {} # {month: {cust_id: order count}}
+        for (month, cust_id), count in Counter(zip(months, cust_ids)).items():
+            if cust_id is not None:
+                orders.setdefault(month, {})[cust_id] = count
+        for month, counts in orders.items():
+            self._partition(month).add_orders(counts, location_of)
+        all_orders = Counter(cust_ids)
+        all_orders.pop(None, None)
+        self.overall.add_orders(all_orders, location_of)
+
+        quantities = {} # {month: {product_id: total quantity}}
+        all_quantities = {}
+        for month, product_id, quantity in zip(months, chunk.column_values('product_id'), chunk.column_values('product_quantity')):
+            if product_id is not None and quantity is not None:
+                totals = quantities.get(month)
+                if totals is None:
+                    totals = quantities[month] = {}
+                totals[product_id] = totals.get(product_id, 0) + quantity
+                all_quantities[product_id] = all_quantities.get(product_id, 0) + quantity
+        for month, totals in quantities.items():
+            self._partition(month).add_quantities(totals)
+        self.overall.add_quantities(all_quantities)
+
+    def _partition(self, month):
+        sketches = self.partitions.get(month)
+        if sketches is None:
+            sketches = self.partitions[month] = SketchSet(products=self.products, customer_totals=False)
+        return sketches
+
+    def merge(self, other):
+        """Adds another SalesSketches built with the same sizes (in place)."""
+        self.overall.merge(other.overall)
+        for month, sketches in other.partitions.items():
+            self._partition(month).merge(sketches)
+        return self
+
+    def by_month(self):
+        """Returns ((year, month), SketchSet) for every dated partition, in month order."""
+        return [((key // 12, key % 12 + 1), self.partitions[key]) for key in sorted(key for key in self.partitions if key is not None)]
+
+    def merged(self, first=None, last=None):
+        """
+        Returns the all-time SketchSet if neither first nor last is given, else one SketchSet
+        (without customer totals) for the partitions of months first..last ((year, month)
+        pairs, inclusive; either may be None for an open end).
+        """
+        if first is None and last is None:
+            return self.overall
+        low = None if first is None else first[0] * 12 + first[1] - 1
+        high = None if last is None else last[0] * 12 + last[1] - 1
+        selected = [sketches for month, sketches in self.partitions.items()
+                    if month is not None and (low is None or month >= low) and (high is None or month <= high)]
+        return SketchSet(products=self.products, customer_totals=False).merge(*selected)
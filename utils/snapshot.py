@@ -0,0 +1,281 @@
+# utils/snapshot.py
+import hashlib
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+from utils.table import Table, column_from_blocks
+
+SNAPSHOT_MAGIC = b'CSVSNAP1'
+SNAPSHOT_VERSION = 2
+
+_HEADER_LENGTH = struct.Struct('<Q')
+_ALIGNMENT = 8
+
+
+def file_fingerprint(file_path, with_hash=True):
+    """
+    Builds the fingerprint used to decide whether a snapshot is still valid for a CSV.
+    Args:
+        file_path (str): Path of the source file.
+        with_hash (bool): Whether to include a content hash (requires reading the whole file).
+    Returns:
+        dict: {'size': int, 'mtime_ns': int, 'hash': str or None}
+    """
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': None}
+    if with_hash:
+        fingerprint['hash'] = hash_file(file_path)
+    return fingerprint
+
+
+def hash_file(file_path, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class HashingReader(io.RawIOBase):
+    """
+    Binary reader over a file that hashes the bytes as they are read, so a parse can record
+    the hash of exactly the bytes it parsed (equal to hash_file once read to the end).
+    """
+    def __init__(self, file_path):
+        self._file = open(file_path, 'rb')
+        self._digest = hashlib.blake2b(digest_size=16)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self._file.readinto(buffer)
+        if count:
+            self._digest.update(memoryview(buffer)[:count])
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class Snapshot:
+    """
+    A memory-mapped, column-typed snapshot of one CSV file.
+    Numeric and date columns are exposed as zero-copy memoryviews over the mapped file.
+    """
+    def __init__(self, file_path):
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file cannot be mapped
+            self._file.close()
+            raise
+        try:
+            self._view = memoryview(self._map)
+            if self._view[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError("not a snapshot file")
+            start = len(SNAPSHOT_MAGIC)
+            (header_length,) = _HEADER_LENGTH.unpack_from(self._map, start)
+            start += _HEADER_LENGTH.size
+            self.meta = json.loads(bytes(self._view[start:start + header_length]))
+            if self.meta.get('version') != SNAPSHOT_VERSION:
+                raise ValueError("unsupported snapshot version")
+        except (ValueError, struct.error):
+            self.close()
+            raise
+        self.headers = self.meta['headers']
+        self.row_count = self.meta['rows']
+        self.columns = {column['name']: column for column in self.meta['columns']}
+
+    def _block(self, column, index):
+        offset, length = column['blocks'][index]
+        return self._view[offset:offset + length]
+
+    def column_objects(self):
+        """Returns {name: column object} for every stored column (zero-copy where possible)."""
+        columns = {}
+        for header in self.headers:
+            column = self.columns[header]
+            blocks = [self._block(column, i) for i in range(len(column['blocks']))]
+            columns[header] = column_from_blocks(column['kind'], blocks)
+        return columns
+
+    def table(self):
+        """
+        Returns the snapshot as a Table whose numeric and date columns are zero-copy views
+        of the mapped file. The Table keeps this snapshot open for as long as it is alive.
+        """
+        return Table(self.headers, self.column_objects(), owner=self)
+
+    def close(self):
+        view = getattr(self, '_view', None)
+        if view is not None:
+            try:
+                view.release()
+            except BufferError: # Columns still reference the mapping; it is freed with them
+                return
+        self._map.close()
+        self._file.close()
+
+
+class SnapshotCache:
+    """
+    Stores a binary snapshot next to each CSV (under `cache_dir`) so later runs can skip
+    CSV parsing. A snapshot is reused while the source file's size and mtime are unchanged;
+    if only the mtime moved (e.g. the file was touched or copied), the content hash decides.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def snapshot_path(self, file_path, name=None):
+        """
+        Path of the snapshot for `file_path`, or of the derived data (e.g. an index) stored
+        under `name` next to it.
+        """
+        suffix = f'.{name}.snap' if name else '.snap'
+        return os.path.join(self.cache_dir, os.path.basename(file_path) + suffix)
+
+    def open(self, file_path, name=None):
+        """
+        Returns a valid Snapshot for `file_path` (or its derived data `name`), or None if
+        there is none (or it is stale).
+        """
+        snapshot_path = self.snapshot_path(file_path, name)
+        if not os.path.exists(snapshot_path) or not os.path.exists(file_path):
+            return None
+        try:
+            snapshot = Snapshot(snapshot_path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        source = snapshot.meta['source']
+        current = file_fingerprint(file_path, with_hash=False)
+        if current['size'] == source['size'] and current['mtime_ns'] == source['mtime_ns']:
+            return snapshot
+        if current['size'] == source['size'] and source.get('hash') and hash_file(file_path) == source['hash']:
+            return snapshot
+        snapshot.close()
+        return None
+
+    def open_previous(self, file_path):
+        """
+        Returns the last snapshot stored for `file_path` without checking that it is still
+        up to date, or None. Used to extend a snapshot when rows were appended to its file.
+        """
+        snapshot_path = self.snapshot_path(file_path)
+        if not os.path.exists(snapshot_path):
+            return None
+        try:
+            return Snapshot(snapshot_path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def load(self, file_path, with_source=False):
+        """
+        Returns the Table from a valid snapshot, or None on a cache miss.
+        With with_source, returns (Table, source fingerprint dict) instead, or (None, None).
+        """
+        snapshot = self.open(file_path)
+        if snapshot is None:
+            return (None, None) if with_source else None
+        try:
+            table = snapshot.table()
+        except (ValueError, TypeError, KeyError, pickle.UnpicklingError):
+            snapshot.close() # Corrupt snapshot: treat as a miss and re-parse the CSV
+            return (None, None) if with_source else None
+        return (table, snapshot.meta['source']) if with_source else table
+
+    def load_columns(self, file_path, name):
+        """
+        Returns the derived columns stored under `name` for `file_path` as {name: column},
+        or None on a cache miss. Columns may reference the mapped file, which stays open
+        for as long as they are used.
+        """
+        snapshot = self.open(file_path, name)
+        if snapshot is None:
+            return None
+        try:
+            return snapshot.column_objects()
+        except (ValueError, TypeError, KeyError, pickle.UnpicklingError):
+            snapshot.close()
+            return None
+
+    def store_columns(self, file_path, name, columns):
+        """
+        Stores derived columns (e.g. an index built from the parsed table) under `name`.
+        Columns need not have equal lengths. They are tied to the fingerprint of the current
+        snapshot of `file_path`, so nothing is stored unless that snapshot is valid.
+        Returns:
+            bool: Whether the columns were written.
+        """
+        snapshot = self.open(file_path)
+        if snapshot is None:
+            return False
+        fingerprint = snapshot.meta['source']
+        snapshot.close()
+        self._write(self.snapshot_path(file_path, name), fingerprint, columns, rows=None)
+        return True
+
+    def store(self, file_path, table, fingerprint=None):
+        """
+        Writes a snapshot of an already-parsed Table for `file_path`.
+        Args:
+            fingerprint (dict): Size/mtime of the source taken before it was parsed, so a file
+                modified while loading is not recorded as up to date, and the 'hash' of the
+                bytes that were parsed (None: the snapshot is only valid for that size/mtime).
+                By default the file's current fingerprint.
+        The file is written to a temporary name and renamed, so readers never see a partial snapshot.
+        """
+        if fingerprint is None:
+            fingerprint = file_fingerprint(file_path)
+        columns = {header: table.column(header) for header in table.headers}
+        self._write(self.snapshot_path(file_path), fingerprint, columns, rows=len(table))
+
+    def _write(self, snapshot_path, fingerprint, column_objects, rows):
+        columns = []
+        blocks = []
+        for header, column in column_objects.items():
+            column_blocks = [memoryview(block).cast('B') for block in column.blocks()]
+            columns.append({'name': header, 'kind': column.kind, 'blocks': [None] * len(column_blocks)})
+            blocks.append(column_blocks)
+
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'source': fingerprint,
+            'headers': list(column_objects),
+            'rows': rows,
+            'columns': columns,
+        }
+
+        # Block offsets depend on the header size, so lay out with placeholders until stable
+        header_bytes = b''
+        while True:
+            offset = len(SNAPSHOT_MAGIC) + _HEADER_LENGTH.size + len(header_bytes)
+            for column, column_blocks in zip(columns, blocks):
+                for i, block in enumerate(column_blocks):
+                    offset += -offset % _ALIGNMENT
+                    column['blocks'][i] = [offset, len(block)]
+                    offset += len(block)
+            previous_length = len(header_bytes)
+            header_bytes = json.dumps(meta).encode('utf-8')
+            if len(header_bytes) == previous_length:
+                break
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+            f.write(header_bytes)
+            for column, column_blocks in zip(columns, blocks):
+                for (offset, _), block in zip(column['blocks'], column_blocks):
+                    f.write(b'\0' * (offset - f.tell()))
+                    f.write(block)
+        os.replace(tmp_path, snapshot_path)
@@ -0,0 +1,73 @@
+# utils/sort_index.py
+from array import array
+from utils.table import IntColumn
+
+
+class SortedIndex:
+    """
+    Sorted permutation of one column: the positions of its rows ordered by value, ties in
+    file order, with missing values kept apart (they sort last in either direction).
+
+    Walking it gives rows in the same order as a stable sort by that column with
+    apply_pagination_and_sorting's key, so an ordered page can be read with O(skip + limit)
+    work instead of sorting every row.
+    """
+    def __init__(self, column, order, nulls):
+        """
+        Use build() or from_columns() instead of calling this directly.
+        Args:
+            column: The indexed column object (values are compared to group ties in 'desc' walks).
+            order (sequence): Positions of rows with a value, sorted by (value, position).
+            nulls (sequence): Positions of rows without a value, in file order.
+        """
+        self._column = column
+        self._order = order
+        self._nulls = nulls
+
+    @classmethod
+    def build(cls, table, column):
+        """
+        Returns the index of `column` in `table`, or None when its values cannot be ordered
+        (e.g. numbers mixed with text that failed to convert).
+        """
+        values = table.column_values(column)
+        order = [position for position, value in enumerate(values) if value is not None]
+        try:
+            order.sort(key=values.__getitem__) # Stable, so ties stay in file order
+        except TypeError:
+            return None
+        nulls = [position for position, value in enumerate(values) if value is None]
+        return cls(table.column(column), array('q', order), array('q', nulls))
+
+    @classmethod
+    def from_columns(cls, table, column, columns):
+        """Rebuilds an index from the columns returned by to_columns() (e.g. read from a snapshot)."""
+        return cls(table.column(column), columns['order'].data, columns['nulls'].data)
+
+    def to_columns(self):
+        """Returns the index as {name: column} so it can be stored next to the table's snapshot."""
+        return {'order': IntColumn(self._order), 'nulls': IntColumn(self._nulls)}
+
+    def __len__(self):
+        return len(self._order) + len(self._nulls)
+
+    def walk(self, order='asc'):
+        """
+        Yields every position in sorted order: ascending values for 'asc', descending for
+        'desc'; ties in file order and missing values last either way.
+        """
+        if order == 'desc':
+            column = self._column
+            positions = self._order
+            i = len(positions) - 1
+            while i >= 0:
+                # Find the run of rows sharing this value and yield it in file order
+                value = column[positions[i]]
+                start = i
+                while start > 0 and column[positions[start - 1]] == value:
+                    start -= 1
+                yield from positions[start:i + 1]
+                i = start - 1
+        else:
+            yield from self._order
+        yield from self._nulls
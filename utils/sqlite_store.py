@@ -0,0 +1,413 @@
+# utils/sqlite_store.py
+# SQLite storage backend: the three tables live in an indexed database file under the cache
+# directory instead of in memory, and services run their filters, lookups and group-bys as SQL.
+# Memory stays bounded by the page of rows a query returns, and the file is reused by later
+# runs until a data file changes.
+import json
+import os
+import sqlite3
+from datetime import datetime
+from utils.converters import conversion_error
+from utils.helpers import resolve_selects
+from utils.query import QueryPlan
+from utils.table import Table
+from utils.timings import timings
+
+# Python date ordinal -> SQLite julian day number (dates are stored as ordinals, like DateColumn)
+JULIAN_DAY_OFFSET = 1721424.5
+# Columns with a lowercased copy for case-insensitive substring search
+SEARCH_COLUMNS = {'customer': ('cust_address',)}
+# Indexes created per table (only those whose columns the file has)
+INDEXES = {
+    'customer': (('cust_id',), ('cust_age',), ('effective_start_date', 'effective_end_date')),
+    'product': (('product_id', 'effective_start_date'), ('effective_start_date', 'effective_end_date')),
+    'sales': (('cust_id',), ('product_id',), ('order_date',)),
+}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _search_column(column):
+    return f"_lower_{column}"
+
+
+def _year_month_sql(column):
+    """SQL for the (year, month) of a date column stored as an ordinal."""
+    julian_day = f"{_quote(column)} + {JULIAN_DAY_OFFSET}"
+    return (f"CAST(strftime('%Y', {julian_day}) AS INTEGER)", f"CAST(strftime('%m', {julian_day}) AS INTEGER)")
+
+
+# Conditions are (SQL expression, parameters) pairs, combined with AND by SqliteStore.select.
+# Each matches the same rows as the in-memory filter of the same name in utils.query.
+
+def equals_condition(column, value):
+    """Rows whose `column` equals `value` (EqualsFilter)."""
+    return f"{_quote(column)} = ?", (value,)
+
+
+def contains_condition(column, query):
+    """Rows whose text in `column` contains `query`, case-insensitively (ContainsFilter)."""
+    search = _quote(_search_column(column))
+    return f"{search} <> '' AND instr({search}, ?) > 0", (query.lower(),)
+
+
+def as_of_condition(key, when, start_column='effective_start_date', end_column='effective_end_date'):
+    """Versions of an SCD2 dimension in effect on `when` (AsOfFilter, see TemporalIndex)."""
+    start, end = _quote(start_column), _quote(end_column)
+    return (f"{_quote(key)} IS NOT NULL AND typeof({start}) = 'integer' AND typeof({end}) = 'integer'"
+            f" AND {start} <= ? AND {end} >= ?", (when.toordinal(), when.toordinal()))
+
+
+def window_condition(column, window):
+    """Rows whose date in `column` is in a DateWindow (see DateWindow.positions)."""
+    sql = f"typeof({_quote(column)}) = 'integer' AND {_quote(column)} BETWEEN ? AND ?"
+    if window.months is not None:
+        month = _year_month_sql(column)[1]
+        sql += f" AND {month} IN ({', '.join(str(month_number) for month_number in sorted(window.months))})"
+    return sql, (window.first_ordinal, window.last_ordinal)
+
+
+class SqliteStore:
+    """
+    The data files loaded into one SQLite database, one table per DataStore table, with rows
+    in file order (rowid) and indexes on the key and date columns (see INDEXES).
+
+    Values keep their converted types: dates are stored as day ordinals and turned back into
+    datetimes when read, and values that failed to convert stay text, as in a Table. The
+    database is rebuilt from the CSVs (streamed chunk by chunk) when their version differs
+    from the one it was built from.
+    """
+    def __init__(self, db_path, data_loader, tables, version, rebuild=False, chunk_size=100000):
+        """
+        Args:
+            db_path (str): Database file.
+            data_loader (DataLoader): Reads the data files (see DataLoader.iter_file_chunks).
+            tables (dict): {table name: (file name, column types)}.
+            version: JSON-serializable description of the data files (see DataStore.data_version);
+                the database is rebuilt when it changes.
+            rebuild (bool): Rebuild even if the version matches (e.g. with --no-cache).
+            chunk_size (int): Rows inserted per batch while building.
+        """
+        self.db_path = db_path
+        self.data_loader = data_loader
+        self.tables = tables
+        self.chunk_size = chunk_size
+        version = json.dumps(version)
+        self._conn = None if rebuild else self._open(version)
+        if self._conn is None:
+            with timings.phase("build sqlite store"):
+                self._build(version)
+            self._conn = self._open(version)
+        self._columns = {} # {table name: [(column, kind)]}
+        for table_name, column, kind in self._conn.execute("SELECT table_name, name, kind FROM _columns ORDER BY table_name, position"):
+            self._columns.setdefault(table_name, []).append((column, kind))
+        failures = json.loads(self._meta('failures'))
+        if self.data_loader.strict and failures: # Recorded when the rows were converted
+            filename, file_failures = next(iter(failures.items()))
+            raise conversion_error(filename, file_failures)
+
+    def _open(self, version):
+        """Returns a connection to the database if it was built from `version`, else None."""
+        if not os.path.exists(self.db_path):
+            return None
+        # Queries may run on another thread than the one that opened the store (the query
+        # server's executor), one at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            if conn.execute("SELECT value FROM _meta WHERE key = 'version'").fetchone() == (version,):
+                return conn
+        except sqlite3.DatabaseError: # Not (yet) a store, or an interrupted build
+            pass
+        conn.close()
+        return None
+
+    def _meta(self, key):
+        return self._conn.execute("SELECT value FROM _meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _build(self, version):
+        """Loads every table into a new database file, which then replaces db_path."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        tmp_path = f"{self.db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF") # A failed build is discarded as a whole
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE _meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE _columns (table_name TEXT, position INTEGER, name TEXT, kind TEXT)")
+            failures = {}
+            for table_name, (filename, column_types) in self.tables.items():
+                file_failures = self._load_table(conn, table_name, filename, column_types)
+                if file_failures:
+                    failures[filename] = file_failures
+            conn.executemany("INSERT INTO _meta VALUES (?, ?)", [('version', version), ('failures', json.dumps(failures))])
+            conn.commit()
+        except BaseException:
+            conn.close()
+            os.unlink(tmp_path)
+            raise
+        conn.close()
+        os.replace(tmp_path, self.db_path)
+
+    def _load_table(self, conn, table_name, filename, column_types):
+        """Creates and fills one table from its data file. Returns the file's conversion failures."""
+        report = {}
+        kinds = {} # Column kind over all chunks; 'object' if they disagree
+        headers = None
+        search_columns = ()
+        insert = None
+        for chunk in self.data_loader.iter_file_chunks(filename, self.chunk_size, report):
+            if headers is None:
+                headers = list(chunk.headers)
+                search_columns = [column for column in SEARCH_COLUMNS.get(table_name, ()) if column in headers]
+                self._create_table(conn, table_name, headers, search_columns)
+                placeholders = ', '.join('?' * (len(headers) + len(search_columns)))
+                insert = f"INSERT INTO {_quote(table_name)} VALUES ({placeholders})"
+            columns = []
+            for header in headers:
+                kind = chunk.column_kind(header)
+                kinds[header] = kind if kinds.get(header, kind) == kind else 'object'
+                values = chunk.column_values(header)
+                if column_types.get(header) is datetime:
+                    values = [value.toordinal() if isinstance(value, datetime) else value for value in values]
+                columns.append(values)
+            for column in search_columns:
+                columns.append([value.lower() if isinstance(value, str) else '' for value in chunk.column_values(column)])
+            conn.executemany(insert, zip(*columns))
+
+        if headers is None: # No data rows: the table still gets the file's columns
+            headers = report.get('headers')
+            if not headers:
+                raise ValueError(f"The sqlite backend needs every data file; {filename} is missing or empty.")
+            search_columns = [column for column in SEARCH_COLUMNS.get(table_name, ()) if column in headers]
+            self._create_table(conn, table_name, headers, search_columns)
+        conn.executemany("INSERT INTO _columns VALUES (?, ?, ?, ?)",
+                         [(table_name, position, header, kinds.get(header, 'object')) for position, header in enumerate(headers)])
+        for number, columns in enumerate(INDEXES.get(table_name, ())):
+            if all(column in headers for column in columns):
+                conn.execute(f"CREATE INDEX {_quote(f'{table_name}_{number}')} ON {_quote(table_name)} ({', '.join(map(_quote, columns))})")
+        return report.get('failures')
+
+    def _create_table(self, conn, table_name, headers, search_columns):
+        # Columns without a declared type, so every value keeps the type it was inserted with
+        columns = [_quote(header) for header in headers] + [_quote(_search_column(column)) for column in search_columns]
+        conn.execute(f"CREATE TABLE {_quote(table_name)} ({', '.join(columns)})")
+
+    def headers(self, table_name):
+        return [column for column, _ in self._columns.get(table_name, ())]
+
+    def _decoder(self, table_name, columns):
+        """Returns a function turning fetched value tuples of `columns` into row dictionaries."""
+        column_types = self.tables[table_name][1]
+        dates = [i for i, column in enumerate(columns) if column_types.get(column) is datetime]
+        def decode(values):
+            if dates:
+                values = list(values)
+                for i in dates:
+                    if isinstance(values[i], int):
+                        values[i] = datetime.fromordinal(values[i])
+            return dict(zip(columns, values))
+        return decode
+
+    def rows(self, table_name, conditions=(), order_sql='rowid', limit=None, offset=0):
+        """
+        Returns the rows matching all conditions as dictionaries of the file's columns.
+        Args:
+            conditions (iterable): (SQL expression, parameters) pairs, e.g. from equals_condition.
+            order_sql (str): ORDER BY clause.
+            limit (int): Maximum number of rows (all if None), after skipping `offset`.
+        """
+        headers = self.headers(table_name)
+        sql = f"SELECT {', '.join(map(_quote, headers))} FROM {_quote(table_name)}"
+        where, params = self._where(conditions)
+        sql += f"{where} ORDER BY {order_sql} LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        decode = self._decoder(table_name, headers)
+        return [decode(values) for values in self._conn.execute(sql, params)]
+
+    def _where(self, conditions):
+        conditions = list(conditions)
+        params = [param for _, condition_params in conditions for param in condition_params]
+        if not conditions:
+            return '', params
+        return ' WHERE ' + ' AND '.join(f"({sql})" for sql, _ in conditions), params
+
+    def count(self, table_name, conditions=()):
+        where, params = self._where(conditions)
+        return self._conn.execute(f"SELECT COUNT(*) FROM {_quote(table_name)}{where}", params).fetchone()[0]
+
+    def select(self, table_name, conditions=(), skip=0, limit=None, order=None, order_by=None, selects=None):
+        """
+        Filters, orders, paginates and projects rows in SQL; the arguments mean the same as for
+        apply_pagination_and_sorting and the results match QueryPlan over the in-memory table.
+        Ordering runs in SQL (missing values last, ties in file order) unless the column mixes
+        value types, which SQLite and Python order differently; those queries run the matching
+        rows through a QueryPlan instead.
+        Returns:
+            list: Row dictionaries, or dictionaries of the selected columns when `selects` is given.
+        """
+        with timings.phase("sqlite query") as phase:
+            result = self._select(table_name, conditions, skip, limit, order, order_by, selects)
+            phase.rows = len(result)
+        return result
+
+    def _select(self, table_name, conditions, skip, limit, order, order_by, selects):
+        skip = skip if skip is not None and skip > 0 else 0
+        limit = limit if limit is not None and limit >= 0 else None
+        kinds = dict(self._columns.get(table_name, ()))
+        if order_by and order:
+            if kinds.get(order_by, 'object') == 'object':
+                rows = self.rows(table_name, conditions)
+                return self.query_rows(table_name, rows, skip=skip, limit=limit, order=order, order_by=order_by, selects=selects)
+            direction = 'DESC' if order == 'desc' else 'ASC'
+            order_sql = f"({_quote(order_by)} IS NULL), {_quote(order_by)} {direction}, rowid"
+        else:
+            order_sql = 'rowid'
+        rows = self.rows(table_name, conditions, order_sql, limit, skip)
+        if rows and selects:
+            columns = resolve_selects(selects, kinds)
+            if columns:
+                return [{column: row[column] for column in columns} for row in rows]
+        return rows
+
+    def query_rows(self, table_name, rows, **kwargs):
+        """Runs QueryPlan(**kwargs) over fetched rows of a table, e.g. candidates gathered in Python."""
+        headers = self.headers(table_name)
+        table = Table.from_rows(headers, [[row[header] for header in headers] for row in rows], self.tables[table_name][1])
+        return QueryPlan(table).execute(**kwargs)
+
+    def first_matches(self, table_name, column, queries):
+        """
+        Returns the rows whose `column` contains any of `queries` (case-insensitive), ordered by
+        the first query each contains and then by file order (as TrigramIndex.search_any).
+        """
+        search = _quote(_search_column(column))
+        cases = ' '.join(f"WHEN instr({search}, ?) > 0 THEN {i}" for i in range(len(queries)))
+        if not cases:
+            return []
+        params = [query.lower() for query in queries]
+        headers = self.headers(table_name)
+        decode = self._decoder(table_name, headers)
+        sql = (f"SELECT {', '.join(map(_quote, headers))} FROM"
+               f" (SELECT *, rowid AS _position, CASE {cases} END AS _match FROM {_quote(table_name)} WHERE {search} <> '')"
+               f" WHERE _match IS NOT NULL ORDER BY _match, _position")
+        return [decode(values) for values in self._conn.execute(sql, params)]
+
+    def key_index(self, table_name, column):
+        return SqlKeyIndex(self, table_name, column)
+
+    def temporal_index(self, table_name, key):
+        return SqlTemporalIndex(self, table_name, key)
+
+    def sales_aggregates(self, names, window=None):
+        """
+        Computes the named sales aggregates (see utils.aggregations) with GROUP BY queries.
+        Groups are returned in order of their first row, like the in-memory aggregation.
+        With a DateWindow only its sales are aggregated (a range scan of the order_date index).
+        Returns:
+            dict: {aggregate name: {group key: value}}
+        """
+        year, month = _year_month_sql('order_date')
+        in_window, params = window_condition('order_date', window) if window is not None else ('1', ())
+        queries = {
+            'orders_by_customer': (
+                f"SELECT cust_id, COUNT(*) FROM sales WHERE cust_id IS NOT NULL AND {in_window}"
+                " GROUP BY cust_id ORDER BY MIN(rowid)",
+                lambda values: (values[0], values[1])),
+            'quantity_by_product': (
+                f"SELECT product_id, SUM(product_quantity) FROM sales WHERE product_id IS NOT NULL AND {in_window}"
+                " GROUP BY product_id ORDER BY MIN(rowid)",
+                lambda values: (values[0], values[1])),
+            'quantity_by_product_quarter': (
+                f"SELECT product_id, {year} AS year, ({month} - 1) / 3 + 1 AS quarter, SUM(product_quantity) FROM sales"
+                f" WHERE product_id IS NOT NULL AND typeof(order_date) = 'integer' AND {in_window}"
+                " GROUP BY product_id, year, quarter ORDER BY MIN(rowid)",
+                lambda values: ((values[0], values[1], values[2]), values[3])),
+            'orders_by_customer_month': (
+                f"SELECT cust_id, {year} AS year, {month} AS month, COUNT(*) FROM sales"
+                f" WHERE cust_id IS NOT NULL AND typeof(order_date) = 'integer' AND {in_window}"
+                " GROUP BY cust_id, year, month ORDER BY MIN(rowid)",
+                lambda values: ((values[0], (values[1], values[2])), values[3])),
+        }
+        aggregates = {}
+        for name in names:
+            sql, item = queries[name]
+            aggregates[name] = dict(item(values) for values in self._conn.execute(sql, params))
+        return aggregates
+
+    def sales_of_customers(self, cust_ids, window=None):
+        """Yields (cust_id, product_id, order_date) of the given customers' sales (in `window` if given), in file order."""
+        cust_ids = list(cust_ids)
+        if not cust_ids:
+            return
+        in_window, params = window_condition('order_date', window) if window is not None else ('1', ())
+        decode = self._decoder('sales', ['cust_id', 'product_id', 'order_date'])
+        sql = (f"SELECT cust_id, product_id, order_date FROM sales"
+               f" WHERE cust_id IN ({', '.join('?' * len(cust_ids))}) AND {in_window} ORDER BY rowid")
+        for values in self._conn.execute(sql, [*cust_ids, *params]):
+            row = decode(values)
+            yield row['cust_id'], row['product_id'], row['order_date']
+
+
+class SqlKeyIndex:
+    """KeyIndex over a SqliteStore table: get() returns the rows for a key in file order."""
+    def __init__(self, store, table_name, column):
+        self._store = store
+        self._table_name = table_name
+        self._column = column
+        self._rows = {} # {key value: [rows]}, memo of looked-up keys
+
+    def get(self, key_value, default=None):
+        if key_value is None:
+            return default
+        rows = self._rows.get(key_value)
+        if rows is None:
+            rows = self._rows[key_value] = self._store.rows(self._table_name, [equals_condition(self._column, key_value)])
+        return rows or default
+
+    def __getitem__(self, key_value):
+        rows = self.get(key_value)
+        if rows is None:
+            raise KeyError(key_value)
+        return rows
+
+    def __contains__(self, key_value):
+        return self.get(key_value) is not None
+
+    def keys(self):
+        """Returns the distinct key values in order of their first row, like KeyIndex.keys()."""
+        if self._column not in self._store.headers(self._table_name):
+            return []
+        column = _quote(self._column)
+        sql = (f"SELECT {column} FROM {_quote(self._table_name)} WHERE {column} IS NOT NULL"
+               f" GROUP BY {column} ORDER BY MIN(rowid)")
+        return [values[0] for values in self._store._conn.execute(sql)]
+
+
+class SqlTemporalIndex:
+    """TemporalIndex over a SqliteStore table, answering "version in effect on a date" lookups in SQL."""
+    def __init__(self, store, table_name, key):
+        self._store = store
+        self._table_name = table_name
+        self._key = key
+
+    def as_of(self, key_value, when):
+        """Returns the version of `key_value` in effect on `when` (the latest-starting one), or None."""
+        if key_value is None or not when:
+            return None
+        rows = self._store.rows(self._table_name, [equals_condition(self._key, key_value), as_of_condition(self._key, when)],
+                                order_sql='effective_start_date DESC, rowid DESC', limit=1)
+        return rows[0] if rows else None
+
+    def join_as_of(self, pairs):
+        """Resolves many (key, date) pairs; see TemporalIndex.join_as_of."""
+        resolved = {}
+        results = []
+        for pair in pairs:
+            if pair not in resolved:
+                resolved[pair] = self.as_of(*pair)
+            results.append(resolved[pair])
+        return results
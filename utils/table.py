@@ -0,0 +1,440 @@
+# utils/table.py
+import pickle
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+
+NULL_INT = -2 ** 63 # Sentinel stored in integer columns for missing values
+NULL_DATE = 0 # date ordinals start at 1, so 0 marks a missing date
+
+
+class IntColumn:
+    """int64 column; missing values are stored as NULL_INT."""
+    kind = 'int'
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data # array('q') or a memoryview cast to 'q'
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(array('q', [NULL_INT if v is None else v for v in values]))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        value = self.data[i]
+        return None if value == NULL_INT else value
+
+    def to_list(self):
+        return [None if v == NULL_INT else v for v in self.data.tolist()]
+
+    def blocks(self):
+        return [self.data]
+
+    def take(self, positions):
+        return IntColumn(array('q', [self.data[i] for i in positions]))
+
+
+class FloatColumn:
+    """float64 column; missing values are stored as NaN."""
+    kind = 'float'
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(array('d', [float('nan') if v is None else v for v in values]))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        value = self.data[i]
+        return None if value != value else value
+
+    def to_list(self):
+        return [None if v != v else v for v in self.data.tolist()]
+
+    def blocks(self):
+        return [self.data]
+
+    def take(self, positions):
+        return FloatColumn(array('d', [self.data[i] for i in positions]))
+
+
+class DateColumn:
+    """
+    Date column stored as int64 proleptic ordinals (NULL_DATE when missing).
+    Values are returned as datetime objects, like the CSV loader produces; each distinct
+    date is converted once and shared.
+    """
+    kind = 'date'
+    __slots__ = ('data', '_dates')
+
+    def __init__(self, data):
+        self.data = data
+        self._dates = {NULL_DATE: None}
+
+    @classmethod
+    def from_values(cls, values):
+        ordinals = {}
+        data = array('q')
+        for value in values:
+            if value is None:
+                data.append(NULL_DATE)
+            else:
+                ordinal = ordinals.get(value)
+                if ordinal is None:
+                    ordinal = ordinals[value] = value.toordinal()
+                data.append(ordinal)
+        return cls(data)
+
+    def _to_datetime(self, ordinal):
+        value = self._dates.get(ordinal)
+        if value is None and ordinal != NULL_DATE:
+            value = self._dates[ordinal] = datetime.fromordinal(ordinal)
+        return value
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self._to_datetime(self.data[i])
+
+    def to_list(self):
+        to_datetime = self._to_datetime
+        return [to_datetime(ordinal) for ordinal in self.data.tolist()]
+
+    def blocks(self):
+        return [self.data]
+
+    def take(self, positions):
+        return DateColumn(array('q', [self.data[i] for i in positions]))
+
+
+class StrColumn:
+    """
+    String column stored as one text blob plus int64 character offsets (len(column) + 1 of them).
+    """
+    kind = 'str'
+    __slots__ = ('offsets', 'text')
+
+    def __init__(self, offsets, text):
+        self.offsets = offsets
+        self.text = text
+
+    @classmethod
+    def from_values(cls, values):
+        offsets = array('q', [0])
+        total = 0
+        for value in values:
+            total += len(value)
+            offsets.append(total)
+        return cls(offsets, ''.join(values))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_list(self):
+        offsets = self.offsets.tolist()
+        text = self.text
+        return [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def blocks(self):
+        return [self.offsets, self.text.encode('utf-8')]
+
+    def take(self, positions):
+        return StrColumn.from_values([self[i] for i in positions])
+
+
+class ObjectColumn:
+    """
+    Fallback column holding Python objects, used when type conversion failed for some
+    cells (the loader keeps those cells as strings).
+    """
+    kind = 'object'
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(list(values))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def to_list(self):
+        return list(self.data)
+
+    def blocks(self):
+        return [pickle.dumps(self.data, protocol=pickle.HIGHEST_PROTOCOL)]
+
+    def take(self, positions):
+        return ObjectColumn([self.data[i] for i in positions])
+
+
+_COLUMN_CLASSES = {cls.kind: cls for cls in (IntColumn, FloatColumn, DateColumn, StrColumn, ObjectColumn)}
+
+
+def build_column(values, target_type=None):
+    """
+    Builds the most compact column for a list of converted values.
+    Args:
+        values (list): Cell values as produced by DataLoader (None for empty typed cells).
+        target_type (type): The column type requested by the loader (int, float, datetime or None).
+    Returns:
+        The column object; ObjectColumn if any value does not have the expected type.
+    """
+    expected = target_type if target_type in (int, float, datetime) else str
+    for value in values:
+        if value is None and expected is not str:
+            continue
+        if type(value) is not expected:
+            return ObjectColumn.from_values(values)
+    column_class = {int: IntColumn, float: FloatColumn, datetime: DateColumn, str: StrColumn}[expected]
+    return column_class.from_values(values)
+
+
+def concat_columns(columns, target_type=None):
+    """
+    Concatenates columns holding consecutive rows of the same field.
+    Typed columns of one kind are joined buffer to buffer; if the kinds differ (e.g. a
+    conversion failed in one part), the values are rebuilt with build_column.
+    """
+    kinds = {column.kind for column in columns}
+    kind = kinds.pop() if len(kinds) == 1 else None
+    if kind in ('int', 'date', 'float'):
+        data = array('d' if kind == 'float' else 'q')
+        for column in columns:
+            data.frombytes(memoryview(column.data).cast('B'))
+        return _COLUMN_CLASSES[kind](data)
+    if kind == 'str':
+        offsets = array('q', [0])
+        for column in columns:
+            base = offsets[-1]
+            offsets.extend(base + offset for offset in column.offsets[1:])
+        return StrColumn(offsets, ''.join(column.text for column in columns))
+    values = []
+    for column in columns:
+        values.extend(column.to_list())
+    return build_column(values, target_type)
+
+
+def column_from_blocks(kind, blocks):
+    """
+    Rebuilds a column from the buffers returned by its blocks() method (e.g. read back
+    from a snapshot). Numeric blocks are used as-is (zero-copy for memoryviews).
+    """
+    if kind in ('int', 'date'):
+        return _COLUMN_CLASSES[kind](_as_typed(blocks[0], 'q'))
+    if kind == 'float':
+        return FloatColumn(_as_typed(blocks[0], 'd'))
+    if kind == 'str':
+        return StrColumn(_as_typed(blocks[0], 'q'), str(blocks[1], 'utf-8'))
+    return ObjectColumn(pickle.loads(blocks[0]))
+
+
+def _as_typed(block, typecode):
+    if isinstance(block, array):
+        return block
+    return memoryview(block).cast('B').cast(typecode)
+
+
+class Row(Mapping):
+    """
+    Read-only, dictionary-like view of one table row. Values are read from the table's
+    columns on access, so rows cost no per-cell storage.
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._table._columns[key][self._index]
+
+    def __iter__(self):
+        return iter(self._table.headers)
+
+    def __len__(self):
+        return len(self._table.headers)
+
+    def __contains__(self, key):
+        return key in self._table._columns
+
+    @property
+    def position(self):
+        """The row's index in its table."""
+        return self._index
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Table:
+    """
+    Read-only columnar table of typed column arrays (see build_column).
+    It behaves as a sequence of Row views, so services can share one Table without copying it.
+    """
+    def __init__(self, headers, columns, owner=None):
+        """
+        Args:
+            headers (list): Column names in file order.
+            columns (dict): {name: column object}, all of the same length.
+            owner: Object that must stay alive while the columns are used (e.g. a mapped snapshot).
+        """
+        self.headers = list(headers)
+        self._columns = columns
+        self._owner = owner
+        self._length = len(columns[self.headers[0]]) if self.headers else 0
+
+    @classmethod
+    def from_columns(cls, headers, values_by_column, column_types=None):
+        """
+        Builds a table from per-column lists of converted values.
+        Args:
+            headers (list): Column names.
+            values_by_column (list): One list of values per header.
+            column_types (dict): {column name: int/float/datetime}, as passed to the loader.
+        """
+        column_types = column_types or {}
+        columns = {
+            header: build_column(values, column_types.get(header))
+            for header, values in zip(headers, values_by_column)
+        }
+        return cls(headers, columns)
+
+    @classmethod
+    def from_rows(cls, headers, rows, column_types=None):
+        """
+        Builds a table from row-wise value lists (each aligned with headers).
+        """
+        values_by_column = list(zip(*rows)) if rows else [() for _ in headers]
+        return cls.from_columns(headers, values_by_column, column_types)
+
+    @classmethod
+    def concat(cls, tables, column_types=None):
+        """
+        Returns one table with the rows of `tables` in order (e.g. a snapshot plus rows
+        appended to its CSV since). All tables must have the same headers.
+        """
+        headers = tables[0].headers
+        column_types = column_types or {}
+        columns = {
+            header: concat_columns([table.column(header) for table in tables], column_types.get(header))
+            for header in headers
+        }
+        return cls(headers, columns)
+
+    @classmethod
+    def empty(cls, headers=()):
+        return cls.from_columns(headers, [[] for _ in headers])
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Row(self, j) for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("table index out of range")
+        return Row(self, i)
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield Row(self, i)
+
+    def __bool__(self):
+        return self._length > 0
+
+    def column(self, name):
+        """Returns the column object for `name` (raises KeyError if absent)."""
+        return self._columns[name]
+
+    def column_kind(self, name):
+        return self._columns[name].kind
+
+    def column_values(self, name):
+        """Returns a column as a list of Python values (None for missing values)."""
+        return self._columns[name].to_list()
+
+    def rows_at(self, positions):
+        """Returns Row views for the given row positions."""
+        return [Row(self, i) for i in positions]
+
+    def take(self, positions, headers=None):
+        """
+        Returns a new table holding copies of the rows at `positions`, in that order.
+        Args:
+            positions (list): Row positions.
+            headers (list): Columns to copy; all columns if None.
+        """
+        headers = self.headers if headers is None else list(headers)
+        return Table(headers, {header: self._columns[header].take(positions) for header in headers})
+
+
+class KeyIndex:
+    """
+    Hash index from a key column to the positions of its rows in a Table.
+    get() returns Row views in file order, so index.get(k)[0] is the first row for k.
+    Rows with a missing key are not indexed.
+    """
+    def __init__(self, table, key):
+        self._table = table
+        self._positions = {} # {key value: position or [positions]}
+        positions = self._positions
+        values = table.column_values(key) if key in table.headers else []
+        for position, value in enumerate(values):
+            if value is None:
+                continue
+            existing = positions.get(value)
+            if existing is None:
+                positions[value] = position
+            elif isinstance(existing, list):
+                existing.append(position)
+            else:
+                positions[value] = [existing, position]
+
+    def positions(self, key_value):
+        existing = self._positions.get(key_value)
+        if existing is None:
+            return []
+        return existing if isinstance(existing, list) else [existing]
+
+    def get(self, key_value, default=None):
+        positions = self.positions(key_value)
+        if not positions:
+            return default
+        return self._table.rows_at(positions)
+
+    def __getitem__(self, key_value):
+        rows = self.get(key_value)
+        if rows is None:
+            raise KeyError(key_value)
+        return rows
+
+    def __contains__(self, key_value):
+        return key_value in self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def keys(self):
+        return self._positions.keys()
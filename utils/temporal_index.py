@@ -0,0 +1,133 @@
+# utils/temporal_index.py
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+_UNRESOLVED = object()
+
+
+def _ordinals(table, column):
+    """Returns a column's dates as ordinals (None where missing or not a date)."""
+    if column not in table.headers:
+        return [None] * len(table)
+    values = table.column(column)
+    if values.kind == 'date':
+        return [ordinal or None for ordinal in values.data.tolist()] # NULL_DATE is 0
+    return [value.toordinal() if isinstance(value, datetime) else None for value in values.to_list()]
+
+
+class TemporalIndex:
+    """
+    Interval index over the effective date ranges of a slowly-changing (SCD2) dimension.
+
+    Versions of each key are kept sorted by effective_start_date together with a running
+    maximum of effective_end_date, so "which version of key K was in effect on date D" is a
+    bisect plus a short walk back over versions that can still cover D.
+    A row is in effect on D when effective_start_date <= D <= effective_end_date (compared by day).
+    All versions live in flat int64 arrays, grouped by key, to keep the index compact.
+    """
+    def __init__(self, table, key, start_column='effective_start_date', end_column='effective_end_date'):
+        """
+        Args:
+            table (Table): The dimension table.
+            key (str): The business key column (e.g. 'cust_id').
+            start_column (str): Column holding the start of the effective range.
+            end_column (str): Column holding the end of the effective range.
+        Rows without a key or without both dates are not indexed (they can never match a date).
+        """
+        self._table = table
+        keys = table.column_values(key) if key in table.headers else []
+        starts = _ordinals(table, start_column)
+        ends = _ordinals(table, end_column)
+
+        grouped = {} # {key: [positions]}
+        for position, key_value in enumerate(keys):
+            if key_value is None or starts[position] is None or ends[position] is None:
+                continue
+            positions = grouped.get(key_value)
+            if positions is None:
+                grouped[key_value] = [position]
+            else:
+                positions.append(position)
+
+        # Flat arrays with each key's versions in one contiguous slice [lo, hi),
+        # sorted by (start, file position)
+        self._groups = {} # {key: (lo, hi)}
+        self._starts = array('q')
+        self._ends = array('q')
+        self._max_ends = array('q')
+        self._positions = array('q')
+        for key_value, positions in grouped.items():
+            if len(positions) > 1:
+                positions.sort(key=lambda position: (starts[position], position))
+            lo = len(self._positions)
+            running_max = None
+            for position in positions:
+                end = ends[position]
+                running_max = end if running_max is None or end > running_max else running_max
+                self._starts.append(starts[position])
+                self._ends.append(end)
+                self._max_ends.append(running_max)
+                self._positions.append(position)
+            self._groups[key_value] = (lo, len(self._positions))
+
+    def _matching_versions(self, lo, hi, when):
+        """Yields flat indexes of versions in [lo, hi) in effect on ordinal `when`, latest start first."""
+        i = bisect_right(self._starts, when, lo, hi) - 1
+        # Versions before i all start on/before `when`; stop once none of them can reach it
+        while i >= lo and self._max_ends[i] >= when:
+            if self._ends[i] >= when:
+                yield i
+            i -= 1
+
+    def as_of(self, key_value, when):
+        """
+        Returns the version (Row) of `key_value` in effect on `when` (the latest-starting one
+        if ranges overlap), or None if no version covers that date.
+        """
+        group = self._groups.get(key_value)
+        if group is None or not when:
+            return None
+        for i in self._matching_versions(group[0], group[1], when.toordinal()):
+            return self._table[self._positions[i]]
+        return None
+
+    def positions_as_of(self, when):
+        """
+        Returns the positions of every row in effect on `when`, sorted (file order).
+        """
+        when = when.toordinal()
+        positions = []
+        for lo, hi in self._groups.values():
+            for i in self._matching_versions(lo, hi, when):
+                positions.append(self._positions[i])
+        positions.sort()
+        return positions
+
+    def rows_as_of(self, when):
+        """
+        Returns every row in effect on `when`, in the original file order.
+        """
+        return self._table.rows_at(self.positions_as_of(when))
+
+    def key_count(self):
+        """Returns the number of indexed keys."""
+        return len(self._groups)
+
+    def join_as_of(self, pairs):
+        """
+        Point-in-time join: resolves many (key, date) pairs at once.
+        Args:
+            pairs (iterable): (key value, date) tuples, e.g. (sale['product_id'], sale['order_date']).
+        Returns:
+            list: The matching version row (or None) for each pair, in input order.
+        Each distinct pair is looked up once, so repeated keys/dates (typical for sales) are cheap.
+        """
+        resolved = {}
+        results = []
+        for pair in pairs:
+            row = resolved.get(pair, _UNRESOLVED)
+            if row is _UNRESOLVED:
+                row = resolved[pair] = self.as_of(*pair)
+            results.append(row)
+        return results
@@ -0,0 +1,162 @@
+# utils/text_index.py
+from array import array
+from utils.table import StrColumn, IntColumn
+
+GRAM_SIZE = 3
+SCAN_FRACTION = 4 # Scan every row instead when a query's rarest trigram is in over 1/SCAN_FRACTION of them
+
+
+def _grams(text):
+    """Returns the distinct character trigrams of `text`."""
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class TrigramIndex:
+    """
+    Inverted trigram index for case-insensitive substring search over one text column.
+
+    Each lowercased value is split into character trigrams, and each trigram maps to the
+    sorted positions of the rows containing it. A substring query only has to check the
+    rows that contain every trigram of the query (the intersection of their posting lists);
+    queries shorter than a trigram, or whose rarest trigram is in most rows, scan every row.
+    Missing or empty values never match, like the `value and query in value.lower()` scans
+    this replaces.
+    """
+    def __init__(self, lowered, grams, offsets, positions):
+        """
+        Use build() or from_columns() instead of calling this directly.
+        Args:
+            lowered (StrColumn): Lowercased value of each row ('' when missing).
+            grams (list): Distinct trigrams, sorted.
+            offsets (sequence): Posting list of grams[i] is positions[offsets[i]:offsets[i + 1]].
+            positions (sequence): Concatenated posting lists of row positions.
+        """
+        self._lowered = lowered
+        self._positions = positions
+        self._postings = {gram: (offsets[i], offsets[i + 1]) for i, gram in enumerate(grams)}
+
+    @classmethod
+    def build(cls, values):
+        """
+        Args:
+            values (list): The column's values in row order (None or non-strings when missing).
+        """
+        lowered = [value.lower() if isinstance(value, str) else '' for value in values]
+        postings = {} # {gram: [positions]}
+        for position, text in enumerate(lowered):
+            for gram in _grams(text):
+                gram_positions = postings.get(gram)
+                if gram_positions is None:
+                    postings[gram] = [position]
+                else:
+                    gram_positions.append(position)
+
+        grams = sorted(postings)
+        offsets = array('q', [0])
+        positions = array('q')
+        for gram in grams:
+            positions.extend(postings[gram]) # Rows are visited in order, so each list is sorted
+            offsets.append(len(positions))
+        return cls(StrColumn.from_values(lowered), grams, offsets, positions)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Rebuilds an index from the columns returned by to_columns() (e.g. read from a snapshot)."""
+        return cls(columns['lowered'], columns['grams'].to_list(), columns['offsets'].data, columns['positions'].data)
+
+    def to_columns(self):
+        """Returns the index as {name: column} so it can be stored next to the table's snapshot."""
+        grams = sorted(self._postings, key=lambda gram: self._postings[gram][0])
+        offsets = array('q', [0])
+        offsets.extend(self._postings[gram][1] for gram in grams)
+        return {
+            'lowered': self._lowered,
+            'grams': StrColumn.from_values(grams),
+            'offsets': IntColumn(offsets),
+            'positions': IntColumn(self._positions),
+        }
+
+    def _candidates(self, query):
+        """
+        Returns the sorted positions that may contain `query` (already lowercased), or None
+        when the index would not narrow the search enough to beat a plain scan (the query is
+        shorter than a trigram, or even its rarest trigram is in most rows).
+        """
+        grams = _grams(query)
+        if not grams:
+            return None
+        ranges = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                return [] # A trigram no row contains
+            ranges.append(posting)
+        ranges.sort(key=lambda posting: posting[1] - posting[0]) # Intersect starting from the rarest
+        start, stop = ranges[0]
+        if (stop - start) * SCAN_FRACTION > len(self._lowered):
+            return None
+        candidates = set(self._positions[start:stop])
+        for start, stop in ranges[1:]:
+            # Verifying a candidate costs about as much as intersecting a few postings, so stop
+            # once the remaining lists are much longer than the candidate set
+            if (stop - start) > 4 * len(candidates):
+                break
+            candidates.intersection_update(self._positions[start:stop])
+        return sorted(candidates)
+
+    def _texts(self, candidates):
+        """Yields (position, lowercased value) for the candidates, or for every row if None."""
+        if candidates is None:
+            return enumerate(self._lowered.to_list())
+        lowered = self._lowered
+        return ((position, lowered[position]) for position in candidates)
+
+    def estimate(self, query):
+        """
+        Returns an upper bound on the rows containing `query` (already lowercased): the length
+        of its rarest trigram's posting list, or the number of rows for queries shorter than a trigram.
+        """
+        counts = []
+        for gram in _grams(query):
+            posting = self._postings.get(gram)
+            if posting is None:
+                return 0
+            counts.append(posting[1] - posting[0])
+        return min(counts) if counts else len(self._lowered)
+
+    def contains(self, position, query):
+        """Returns True if the row at `position` contains `query` (already lowercased)."""
+        text = self._lowered[position]
+        return bool(text) and query in text
+
+    def search(self, query):
+        """Returns the sorted positions of rows whose value contains `query` (case-insensitive)."""
+        query = query.lower()
+        return [position for position, text in self._texts(self._candidates(query)) if text and query in text]
+
+    def search_any(self, queries):
+        """
+        Matches several substring queries in one pass over the union of their candidates.
+        Returns:
+            dict: {position: index of the first query in `queries` the row matches}, in position order.
+        """
+        queries = [query.lower() for query in queries]
+        candidates = set()
+        for query in queries:
+            query_candidates = self._candidates(query)
+            if query_candidates is None: # Every row is a candidate
+                candidates = None
+                break
+            candidates.update(query_candidates)
+        if candidates is not None:
+            candidates = sorted(candidates)
+
+        matches = {}
+        for position, text in self._texts(candidates):
+            if not text:
+                continue
+            for query_number, query in enumerate(queries):
+                if query in text:
+                    matches[position] = query_number
+                    break
+        return matches
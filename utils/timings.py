@@ -0,0 +1,151 @@
+# utils/timings.py
+# Opt-in per-phase instrumentation (--timings). Code marks phases with
+#     with timings.phase('load customer') as phase:
+#         ...
+#         phase.rows = len(table)
+# and decorates service methods with @timed. Phases nest; when timings are disabled a phase
+# is a shared no-op object, so instrumented code pays almost nothing.
+import functools
+import sys
+import time
+import tracemalloc
+
+
+class _Phase:
+    __slots__ = ('name', 'depth', 'rows', 'seconds', 'allocated', 'peak', '_started', '_memory', '_max_seen')
+
+    def __init__(self, name, depth, rows=None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.seconds = 0.0
+        self.allocated = 0
+        self.peak = 0
+
+
+class _NoPhase:
+    """Stand-in returned while timings are disabled; attribute writes are ignored."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Timings:
+    """
+    Collects nested phases with wall time, rows processed and memory allocated (tracemalloc).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.phases = [] # In start order
+        self._stack = []
+
+    def enable(self):
+        self.enabled = True
+        self.phases = []
+        self._stack = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def phase(self, name, rows=None):
+        """Returns a context manager timing one phase (a no-op while disabled)."""
+        if not self.enabled:
+            return _NO_PHASE
+        return _PhaseContext(self, name, rows)
+
+    def record(self, name, seconds, rows=None):
+        """
+        Adds a phase measured by the caller (e.g. time summed over many small calls) as a
+        child of the current phase. No memory figures are recorded for it.
+        """
+        if not self.enabled:
+            return
+        phase = _Phase(name, len(self._stack), rows)
+        phase.seconds = seconds
+        self.phases.append(phase)
+
+    def report(self, file=None):
+        """Prints the collected phases as an indented table."""
+        file = file or sys.stderr
+        if not self.phases:
+            print("Timings: no phases recorded.", file=file)
+            return
+        width = max(len(phase.name) + 2 * phase.depth for phase in self.phases)
+        print(f"{'Phase'.ljust(width)} | {'Wall ms':>10} | {'Rows':>10} | {'Alloc KiB':>10} | {'Peak KiB':>10}", file=file)
+        print(f"{'-' * width}-+-{'-' * 10}-+-{'-' * 10}-+-{'-' * 10}-+-{'-' * 10}", file=file)
+        for phase in self.phases:
+            rows = '' if phase.rows is None else str(phase.rows)
+            print(f"{('  ' * phase.depth + phase.name).ljust(width)} | {phase.seconds * 1000:>10.2f} | {rows:>10} | "
+                  f"{phase.allocated / 1024:>10.1f} | {phase.peak / 1024:>10.1f}", file=file)
+
+
+class _PhaseContext:
+    __slots__ = ('_timings', '_phase')
+
+    def __init__(self, timings, name, rows):
+        self._timings = timings
+        self._phase = _Phase(name, len(timings._stack), rows)
+
+    def __enter__(self):
+        phase = self._phase
+        stack = self._timings._stack
+        current, peak = tracemalloc.get_traced_memory()
+        if stack: # reset_peak() below hides the enclosing phase's peak so far, so keep it there
+            stack[-1]._max_seen = max(stack[-1]._max_seen, peak)
+        phase._memory = phase._max_seen = current
+        tracemalloc.reset_peak()
+        self._timings.phases.append(phase)
+        stack.append(phase)
+        phase._started = time.perf_counter()
+        return phase
+
+    def __exit__(self, *exc_info):
+        phase = self._phase
+        phase.seconds = time.perf_counter() - phase._started
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, phase._max_seen)
+        phase.allocated = current - phase._memory
+        phase.peak = peak - phase._memory
+        stack = self._timings._stack
+        stack.pop()
+        if stack:
+            stack[-1]._max_seen = max(stack[-1]._max_seen, peak)
+        return False
+
+
+timings = Timings()
+
+
+def timed(name=None):
+    """
+    Decorator timing each call of a function as a phase (named after the function by default).
+    Rows are the length of the returned value when it has one.
+    """
+    def decorator(function):
+        phase_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not timings.enabled:
+                return function(*args, **kwargs)
+            with timings.phase(phase_name) as phase:
+                result = function(*args, **kwargs)
+                if hasattr(result, '__len__'):
+                    phase.rows = len(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+# utils/vectorized.py
+# Optional NumPy backend for the sales group-by aggregates in utils.aggregations.
+# Columns are viewed as int64 arrays without copying, quarter/month buckets are computed with
+# datetime64 arithmetic, and groups are reduced with lexsort + bincount. Results are returned
+# in the same first-appearance key order as the pure-Python path.
+from datetime import date
+from utils.table import NULL_DATE, NULL_INT
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; the 'python' engine does not need it
+    np = None
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def is_available():
+    return np is not None
+
+
+def _int64(column):
+    return np.frombuffer(column.data, dtype=np.int64)
+
+
+def _supports(chunk, int_columns, date_columns=()):
+    """Vectorized kernels need typed columns; chunks with mixed-type columns use the Python path."""
+    return (all(chunk.column_kind(name) == 'int' for name in int_columns)
+            and all(chunk.column_kind(name) == 'date' for name in date_columns))
+
+
+def _year_month(ordinals):
+    """Returns (year, month) int64 arrays for date ordinals."""
+    months = (ordinals - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1
+
+
+def _group_reduce(keys, weights=None):
+    """
+    Groups rows by one or more int64 key arrays.
+    Args:
+        keys (list): Equal-length int64 arrays; together they form the group key.
+        weights (ndarray): Values to sum per group; counts rows when None.
+    Returns:
+        tuple: (key_columns, totals) as lists, one entry per group, in order of each group's
+            first appearance. key_columns holds one list per key array.
+    """
+    if not len(keys[0]):
+        return [[] for _ in keys], []
+    order = np.lexsort(keys[::-1]) # Stable, so each group's first element is its first appearance
+    sorted_keys = [key[order] for key in keys]
+    starts = np.ones(len(order), dtype=bool)
+    for key in sorted_keys:
+        starts[1:] &= key[1:] == key[:-1]
+    starts = ~starts
+    starts[0] = True
+    group_of_sorted = np.cumsum(starts) - 1
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = group_of_sorted
+
+    start_positions = np.flatnonzero(starts)
+    first_appearance = order[start_positions]
+    if weights is None:
+        totals = np.bincount(inverse, minlength=len(start_positions))
+    else:
+        # int64 sums via float64 bincount are exact below 2**53
+        totals = np.rint(np.bincount(inverse, weights=weights, minlength=len(start_positions))).astype(np.int64)
+
+    emit = np.argsort(first_appearance, kind='stable')
+    key_columns = [key[start_positions][emit].tolist() for key in sorted_keys]
+    return key_columns, totals[emit].tolist()
+
+
+def _merge(state, groups):
+    """Adds (key, total) pairs into state, keeping first-appearance order."""
+    if not state:
+        state.update(groups) # First chunk: no existing keys to add to
+        return
+    for key, total in groups:
+        state[key] = state.get(key, 0) + total
+
+
+def _orders_by_customer(state, chunk):
+    if not _supports(chunk, ['cust_id']):
+        return False
+    cust_ids = _int64(chunk.column('cust_id'))
+    cust_ids = cust_ids[cust_ids != NULL_INT]
+    (cust_id_keys,), totals = _group_reduce([cust_ids])
+    _merge(state, zip(cust_id_keys, totals))
+    return True
+
+
+def _quantity_by_product(state, chunk):
+    if not _supports(chunk, ['product_id', 'product_quantity']):
+        return False
+    product_ids = _int64(chunk.column('product_id'))
+    quantities = _int64(chunk.column('product_quantity'))
+    valid = product_ids != NULL_INT
+    if (quantities[valid] == NULL_INT).any():
+        return False # Missing quantities: let the Python path report them
+    (product_id_keys,), totals = _group_reduce([product_ids[valid]], quantities[valid].astype(np.float64))
+    _merge(state, zip(product_id_keys, totals))
+    return True
+
+
+def _quantity_by_product_quarter(state, chunk):
+    if not _supports(chunk, ['product_id', 'product_quantity'], ['order_date']):
+        return False
+    product_ids = _int64(chunk.column('product_id'))
+    quantities = _int64(chunk.column('product_quantity'))
+    ordinals = _int64(chunk.column('order_date'))
+    valid = (product_ids != NULL_INT) & (ordinals != NULL_DATE)
+    if (quantities[valid] == NULL_INT).any():
+        return False
+    years, months = _year_month(ordinals[valid])
+    quarters = (months - 1) // 3 + 1
+    key_columns, totals = _group_reduce([product_ids[valid], years, quarters], quantities[valid].astype(np.float64))
+    _merge(state, zip(zip(*key_columns), totals))
+    return True
+
+
+def _orders_by_customer_month(state, chunk):
+    if not _supports(chunk, ['cust_id'], ['order_date']):
+        return False
+    cust_ids = _int64(chunk.column('cust_id'))
+    ordinals = _int64(chunk.column('order_date'))
+    valid = (cust_ids != NULL_INT) & (ordinals != NULL_DATE)
+    years, months = _year_month(ordinals[valid])
+    (cust_id_keys, year_keys, month_keys), totals = _group_reduce([cust_ids[valid], years, months])
+    _merge(state, zip(zip(cust_id_keys, zip(year_keys, month_keys)), totals))
+    return True
+
+
+VECTORIZED_AGGREGATES = {
+    'orders_by_customer': _orders_by_customer,
+    'quantity_by_product': _quantity_by_product,
+    'quantity_by_product_quarter': _quantity_by_product_quarter,
+    'orders_by_customer_month': _orders_by_customer_month,
+}
+
+
+def update_aggregate(name, state, chunk, fallback):
+    """
+    Folds one chunk into an aggregate with the NumPy kernel for `name`, or with the
+    Python `fallback` updater when the chunk's columns cannot be vectorized.
+    """
+    kernel = VECTORIZED_AGGREGATES.get(name)
+    if kernel is None or not len(chunk) or not kernel(state, chunk):
+        fallback(state, chunk)
@@ -0,0 +1,158 @@
+# utils/writers.py
+# Output writers for command results (--format). Each writer takes any iterable of
+# dictionary-like rows (lists or generators), converts every cell to text once and sends the
+# output to stdout in large buffered writes instead of one print() per row.
+import csv
+import io
+import json
+import sys
+from datetime import date
+from itertools import chain, islice
+
+FORMATS = ('table', 'csv', 'tsv', 'jsonl')
+
+
+def export_value(value):
+    """Value as written by the export formats: dates (and datetimes) as YYYY-MM-DD."""
+    return value.strftime('%Y-%m-%d') if isinstance(value, date) else value
+
+
+class RowWriter:
+    """Base class: buffers text and writes it to `out` (sys.stdout at write time by default)."""
+    def __init__(self, out=None, buffer_size=1 << 16):
+        self.out = out
+        self.buffer_size = buffer_size
+        self._parts = []
+        self._buffered = 0
+
+    def _emit(self, text):
+        self._parts.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            (self.out or sys.stdout).write(''.join(self._parts))
+            self._parts = []
+            self._buffered = 0
+
+    def write(self, rows, headers=None):
+        """
+        Writes rows and flushes the buffer.
+        Args:
+            rows (iterable): Dictionary-like rows.
+            headers (list): Columns to write, in order; by default the first row's keys.
+        Returns:
+            int: The number of rows written.
+        """
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            self._write_empty(headers)
+            self.flush()
+            return 0
+        if headers is None:
+            headers = list(first.keys())
+        count = self._write_rows(chain([first], rows), headers)
+        self.flush()
+        return count
+
+    def _write_empty(self, headers):
+        pass
+
+    def _write_rows(self, rows, headers):
+        raise NotImplementedError
+
+
+class TableWriter(RowWriter):
+    """
+    Aligned text table, as print_table has always printed it. Column widths come from a
+    single stringify pass over the first `sample_size` rows; for longer results, later rows
+    wider than that sample are written unpadded rather than holding every row in memory.
+    """
+    def __init__(self, out=None, buffer_size=1 << 16, sample_size=10000):
+        super().__init__(out, buffer_size)
+        self.sample_size = sample_size
+
+    def _write_empty(self, headers):
+        self._emit("No data to display.\n")
+
+    def _write_rows(self, rows, headers):
+        # Cells are converted to text once and reused for both the width pass and the output
+        stringify = lambda row: [str(row.get(header, '')) for header in headers]
+        sample = [stringify(row) for row in islice(rows, self.sample_size)]
+        widths = [len(str(header)) for header in headers]
+        for cells in sample:
+            for i, cell in enumerate(cells):
+                if len(cell) > widths[i]:
+                    widths[i] = len(cell)
+
+        self._emit(" | ".join(str(header).ljust(width) for header, width in zip(headers, widths)) + "\n")
+        self._emit("-+-".join("-" * width for width in widths) + "\n")
+        count = 0
+        for cells in chain(sample, (stringify(row) for row in rows)):
+            self._emit(" | ".join(cell.ljust(width) for cell, width in zip(cells, widths)) + "\n")
+            count += 1
+        return count
+
+
+class DelimitedWriter(RowWriter):
+    """
+    CSV (or TSV) with a header line; missing values are written as empty fields and dates
+    as YYYY-MM-DD.
+    """
+    def __init__(self, out=None, buffer_size=1 << 16, delimiter=','):
+        super().__init__(out, buffer_size)
+        self.delimiter = delimiter
+
+    def _write_empty(self, headers):
+        if headers:
+            self._write_lines([headers])
+
+    def _write_lines(self, lines):
+        text = io.StringIO()
+        csv.writer(text, delimiter=self.delimiter, lineterminator='\n').writerows(lines)
+        self._emit(text.getvalue())
+
+    def _write_rows(self, rows, headers):
+        self._write_lines([headers])
+        count = 0
+        while True:
+            # Rows are formatted a block at a time so csv.writer works on many rows per call
+            block = [[export_value(row.get(header)) for header in headers] for row in islice(rows, 1000)]
+            if not block:
+                return count
+            self._write_lines(block)
+            count += len(block)
+
+
+class JsonLinesWriter(RowWriter):
+    """
+    One JSON object per row (JSON Lines); keys follow the header order. Dates are written as
+    YYYY-MM-DD strings, other values JSON cannot represent as their str().
+    """
+    def _write_rows(self, rows, headers):
+        dumps = json.JSONEncoder(default=lambda value: str(export_value(value)), ensure_ascii=False).encode
+        count = 0
+        for row in rows:
+            self._emit(dumps({header: row.get(header) for header in headers}) + "\n")
+            count += 1
+        return count
+
+
+def get_writer(output_format='table', out=None):
+    """
+    Returns a writer for one of FORMATS.
+    Raises:
+        ValueError: For an unknown format.
+    """
+    if output_format == 'table':
+        return TableWriter(out)
+    if output_format == 'csv':
+        return DelimitedWriter(out, delimiter=',')
+    if output_format == 'tsv':
+        return DelimitedWriter(out, delimiter='\t')
+    if output_format == 'jsonl':
+        return JsonLinesWriter(out)
+    raise ValueError(f"Unknown output format: {output_format}")